@@ -0,0 +1,103 @@
+import asyncio
+from datetime import timedelta
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.util import obj_to_ref
+from config import (
+    PLACEMENT_SWEEP_MINUTES, SCHEDULER_MODE, WORKER_POLL_SECONDS, TZ, ADMIN_DIGEST_ENABLED, ADMIN_DIGEST_HOUR,
+)
+from services.admin_digest_service import send_daily_digest
+from services.jobstore import HybridJobStore, build_jobstore
+from services.placement_test_service import placement_test_service, run_placement_sweep
+from services.profiling_service import ProfilingAsyncIOExecutor
+from services.tenant_service import add_tenant_job, tenant_scope, tenants
+
+# -----------------------------------------------------------------------------
+# Scheduler Setup with Persistent Job Store
+# -----------------------------------------------------------------------------
+# Compartilhado pelo processo web (main.py) e pelo worker (worker.py)
+jobstores = {
+    'default': build_jobstore()
+}
+# Executor padrão com amostragem opcional dos jobs (PROFILE_SAMPLE_RATE)
+executors = {
+    'default': ProfilingAsyncIOExecutor()
+}
+scheduler = AsyncIOScheduler(jobstores=jobstores, executors=executors)
+
+# Com relógio externo a varredura vai para a fila durável: o /tick responde sem esperar por ela
+SWEEP_ENQUEUE_FUNC = "services.admin_job_service:enqueue_placement_sweep"
+
+
+def start_scheduler(run_jobs: bool) -> None:
+    """Inicia o scheduler. Com `run_jobs=False` ele só grava jobs no jobstore (não dispara)."""
+    paused = not run_jobs or SCHEDULER_MODE == "external"
+    scheduler.start(paused=paused)
+    if paused:
+        print("Scheduler started (somente gravação de jobs)...")
+    else:
+        print("Scheduler started...")
+
+
+def register_periodic_jobs() -> None:
+    """Agenda os jobs periódicos (varredura de testes de nivelamento e resumo diário dos admins)."""
+    # Um resumo por tenant, cada um com as próprias reuniões e admins
+    for tenant in tenants.values():
+        with tenant_scope(tenant):
+            if ADMIN_DIGEST_ENABLED:
+                add_tenant_job(
+                    scheduler,
+                    send_daily_digest,
+                    trigger=CronTrigger(hour=ADMIN_DIGEST_HOUR, minute=0, timezone=TZ),
+                    id="admin_daily_digest",
+                    replace_existing=True,
+                )
+            elif scheduler.get_job(tenant.job_id("admin_daily_digest")):
+                scheduler.remove_job(tenant.job_id("admin_daily_digest"))
+    if ADMIN_DIGEST_ENABLED:
+        print(f"✅ Resumo diário dos admins agendado (todo dia às {ADMIN_DIGEST_HOUR}h)")
+
+    # ✅ NOVO: Adicionar job periódico para verificar testes de nivelamento
+    if placement_test_service.enabled:
+        interval = timedelta(minutes=PLACEMENT_SWEEP_MINUTES)
+        sweep_func = SWEEP_ENQUEUE_FUNC if SCHEDULER_MODE == "external" else obj_to_ref(run_placement_sweep)
+        existing = scheduler.get_job("placement_test_checker")
+        unchanged = (
+            existing is not None
+            and existing.func_ref == sweep_func
+            and getattr(existing.trigger, "interval", None) == interval
+        )
+        if SCHEDULER_MODE == "external" and unchanged:
+            # Não reagendar a cada cold start, senão a varredura nunca vence
+            print(f"✅ Job de verificação de testes de nivelamento mantido (próxima: {existing.next_run_time})")
+        else:
+            scheduler.add_job(
+                sweep_func,
+                # Cada lead tem a própria agenda; a varredura só verifica os que venceram
+                trigger=IntervalTrigger(minutes=PLACEMENT_SWEEP_MINUTES),
+                id="placement_test_checker",
+                replace_existing=True,
+                max_instances=1  # Evita execuções simultâneas
+            )
+            print(f"✅ Job de verificação de testes de nivelamento agendado (a cada {PLACEMENT_SWEEP_MINUTES:g} min)")
+    else:
+        print("⚠️ Job de verificação de testes de nivelamento não agendado (FLEXGE_API_KEY não configurada)")
+
+
+async def poll_jobstore(stop_event: asyncio.Event) -> None:
+    """Acorda o scheduler periodicamente para enxergar jobs gravados por outros processos."""
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=WORKER_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            scheduler.wakeup()
+
+
+def shutdown_scheduler() -> None:
+    scheduler.shutdown()
+    store = jobstores['default']
+    if isinstance(store, HybridJobStore):
+        # O shutdown do AsyncIOScheduler roda depois, no event loop; persiste já
+        store.close()
+    print("Scheduler shut down.")
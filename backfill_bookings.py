@@ -0,0 +1,214 @@
+"""
+Importa agendamentos históricos do Cal.com e reconstrói os lembretes.
+
+Lê um arquivo JSONL com um payload de webhook do Cal.com por linha (mesmo formato de
+`CalWebhookPayload`), encontra ou cria as páginas no Notion em lotes concorrentes e
+recria apenas os lembretes futuros, gravados em lote no jobstore. Nenhuma mensagem de
+confirmação é enviada por WhatsApp.
+
+O progresso é salvo em um arquivo de checkpoint após cada lote; rodar de novo com o
+mesmo checkpoint continua de onde parou, começando pelas linhas que falharam.
+
+Uso:
+    python backfill_bookings.py bookings.jsonl
+    python backfill_bookings.py bookings.jsonl --batch-size 200 --concurrency 4
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import chain
+from typing import Dict, List, Tuple
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.memory import MemoryJobStore
+from pydantic import ValidationError
+
+from config import TZ
+from database import create_tables
+from models import CalWebhookPayload
+from services.booking_service import BOOKING_EVENTS, booking_start, extract_whatsapp, lead_key, resolve_lead_page
+from services.jobstore import build_jobstore, bulk_upsert_jobs
+from services.notion_client import NotionUnavailableError
+from services.notion_service import flush_notion_writes
+from services.scheduling_service import schedule_messages, schedule_lead_messages
+from utils import format_pt_br
+
+
+def load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"line": 0, "imported": 0, "jobs": 0, "failed": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, checkpoint: dict) -> None:
+    """Grava o checkpoint de forma atômica (arquivo temporário + rename)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_batches(path: str, start_line: int, batch_size: int):
+    """Gera lotes de (número da linha, payload) a partir de `start_line`."""
+    batch: List[Tuple[int, str]] = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, start=1):
+            if line_no <= start_line or not line.strip():
+                continue
+            batch.append((line_no, line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def read_failed_batches(path: str, line_numbers: List[int], batch_size: int):
+    """Gera lotes com as linhas que falharam em uma execução anterior."""
+    wanted = set(line_numbers)
+    batch: List[Tuple[int, str]] = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, start=1):
+            if line_no not in wanted or not line.strip():
+                continue
+            batch.append((line_no, line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def resolve_group(bookings: List[CalWebhookPayload], now: datetime) -> Tuple[str | None, List[CalWebhookPayload]]:
+    """Resolve a página do lead uma única vez, usando o agendamento mais recente.
+
+    Páginas existentes só são atualizadas se esse agendamento ainda não aconteceu.
+    """
+    latest = max(bookings, key=booking_start)
+    attendee = latest.payload.attendees[0]
+    start_dt = booking_start(latest)
+    # Sem lead provisório: com o Notion fora, o lote é refeito na próxima execução
+    page_id = resolve_lead_page(
+        attendee, extract_whatsapp(latest), format_pt_br(start_dt), update_existing=start_dt > now,
+        provisional=False,
+    )
+    return page_id, bookings
+
+
+def run_backfill(path: str, checkpoint_path: str, batch_size: int, concurrency: int, dry_run: bool) -> dict:
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint["line"]:
+        print(f"↩️ Retomando a partir da linha {checkpoint['line'] + 1}")
+    retry = sorted(set(checkpoint["failed"]))
+    if retry:
+        print(f"↩️ Tentando de novo {len(retry)} linha(s) que falharam")
+    # Primeiro as linhas que falharam antes (sem mexer no cursor), depois o restante do arquivo
+    batches = chain(
+        ((batch, True) for batch in read_failed_batches(path, retry, batch_size)),
+        ((batch, False) for batch in read_batches(path, checkpoint["line"], batch_size)),
+    )
+
+    create_tables()
+    store = build_jobstore()
+    # Scheduler só em memória: schedule_messages/schedule_lead_messages montam os jobs
+    # normalmente e depois gravamos todos de uma vez no jobstore real
+    collector = BackgroundScheduler(jobstores={"default": MemoryJobStore()}, timezone=TZ)
+    collector.start(paused=True)
+    started = time.monotonic()
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for batch, retrying in batches:
+                failed: List[int] = []
+                groups: Dict[str, List[CalWebhookPayload]] = {}
+                group_lines: Dict[str, List[int]] = {}
+                for line_no, raw in batch:
+                    try:
+                        data = CalWebhookPayload.model_validate_json(raw)
+                    except ValidationError as e:
+                        print(f"✗ Linha {line_no} inválida: {e.errors()[0].get('msg')}")
+                        failed.append(line_no)
+                        continue
+                    if data.trigger_event not in BOOKING_EVENTS or not data.payload.attendees:
+                        continue
+                    key = lead_key(data)
+                    groups.setdefault(key, []).append(data)
+                    group_lines.setdefault(key, []).append(line_no)
+
+                if dry_run:
+                    print(f"🔎 Linhas {batch[0][0]}-{batch[-1][0]}: {len(groups)} lead(s) seriam importados")
+                    if not retrying:
+                        checkpoint["line"] = batch[-1][0]
+                    continue
+
+                now = datetime.now(tz=TZ)
+                futures = {key: pool.submit(resolve_group, bookings, now) for key, bookings in groups.items()}
+                for key, future in futures.items():
+                    try:
+                        page_id, bookings = future.result()
+                    except NotionUnavailableError as e:
+                        # Interrompe sem avançar o checkpoint: o lote inteiro será refeito
+                        raise SystemExit(f"✗ Notion indisponível, backfill interrompido: {e}")
+                    except Exception as e:
+                        # As linhas do lead ficam no checkpoint e são refeitas na próxima execução
+                        print(f"✗ Erro ao importar lead (linhas {group_lines[key]}): {e}")
+                        failed.extend(group_lines[key])
+                        continue
+                    for data in bookings:
+                        start_dt = booking_start(data)
+                        if start_dt <= now:
+                            continue
+                        attendee = data.payload.attendees[0]
+                        whatsapp = extract_whatsapp(data)
+                        if whatsapp:
+                            schedule_lead_messages(collector, attendee.name, whatsapp, start_dt)
+                        if page_id:
+                            schedule_messages(collector, attendee.name, start_dt, page_id, whatsapp)
+                    checkpoint["imported"] += len(bookings)
+
+                # As atualizações de páginas do lote vão ao Notion antes de avançar o checkpoint
+                flush_notion_writes()
+                written = bulk_upsert_jobs(store, collector.get_jobs(), now=now)
+                collector.remove_all_jobs()
+                checkpoint["jobs"] += written
+                batch_lines = {line_no for line_no, _ in batch}
+                checkpoint["failed"] = sorted(
+                    {line_no for line_no in checkpoint["failed"] if line_no not in batch_lines} | set(failed)
+                )
+                if not retrying:
+                    checkpoint["line"] = batch[-1][0]
+                save_checkpoint(checkpoint_path, checkpoint)
+
+                elapsed = time.monotonic() - started
+                print(
+                    f"✓ Linha {checkpoint['line']}: {checkpoint['imported']} agendamento(s), "
+                    f"{checkpoint['jobs']} lembrete(s) gravado(s) em {elapsed:.0f}s"
+                )
+    finally:
+        collector.shutdown(wait=False)
+
+    if checkpoint["failed"]:
+        print(f"⚠️ {len(checkpoint['failed'])} linha(s) com falha; rode de novo para tentar outra vez")
+    print("✅ Backfill concluído!")
+    return checkpoint
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Importa agendamentos do Cal.com (JSONL) e recria lembretes futuros.")
+    parser.add_argument("path", help="Arquivo JSONL com um payload de webhook do Cal.com por linha")
+    parser.add_argument("--checkpoint", help="Arquivo de checkpoint (padrão: <path>.checkpoint.json)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Agendamentos por lote (padrão: 100)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Leads resolvidos em paralelo no Notion (padrão: 4)")
+    parser.add_argument("--dry-run", action="store_true", help="Só valida o arquivo, sem chamar o Notion nem gravar jobs")
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or f"{args.path}.checkpoint.json"
+    run_backfill(args.path, checkpoint_path, args.batch_size, args.concurrency, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
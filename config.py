@@ -10,6 +10,55 @@ CAL_SECRET = os.getenv("CAL_SECRET", "changeme").encode()
 TZ = pytz.timezone(os.getenv("TZ", "America/Sao_Paulo"))
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# --- Pool de conexões (um engine compartilhado por processo: jobstore + tabelas da app) ---
+# Conexões por processo = DB_POOL_SIZE + DB_MAX_OVERFLOW (o mesmo vale para o engine assíncrono)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+# Espera máxima por uma conexão livre do pool e timeout para abrir uma nova
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))
+DB_CONNECT_TIMEOUT_SECONDS = int(os.getenv("DB_CONNECT_TIMEOUT_SECONDS", "10"))
+# Conexões mais velhas que isso são reabertas (poolers/Supabase derrubam conexões ociosas)
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Conexões abertas já na inicialização, para a primeira requisição não pagar o handshake
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", "2"))
+# Pooler em modo transação (PgBouncer, Supabase na porta 6543): sem prepared statements no
+# driver assíncrono. "auto" liga quando a URL aponta para a porta 6543 ou um host "pooler."
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "auto").lower()
+# Acesso assíncrono (asyncpg/aiosqlite) a partir de corrotinas; sem o driver, usa threads
+DB_ASYNC_ENABLED = os.getenv("DB_ASYNC_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# --- Scheduler ---
+# "internal": o AsyncIOScheduler dispara os jobs enquanto a instância está viva (padrão).
+# "external": nada dispara sozinho; o Cloud Scheduler/cron chama POST /tick, que executa
+# tudo que venceu. Permite escalar a zero sem perder lembretes.
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "internal").lower()
+TICK_TOKEN = os.getenv("TICK_TOKEN")
+# Execuções perdidas há mais que isso são descartadas no tick (catch-up)
+TICK_CATCHUP_SECONDS = float(os.getenv("TICK_CATCHUP_SECONDS", "86400"))
+TICK_CONCURRENCY = int(os.getenv("TICK_CONCURRENCY", "8"))
+TICK_MAX_JOBS = int(os.getenv("TICK_MAX_JOBS", "500"))
+# Várias instâncias: cada execução de job é "arrendada" por uma instância por este tempo
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+# "sql": cada alteração de job é uma escrita no banco (padrão, seguro para várias instâncias).
+# "hybrid": jobs em memória, persistidos em segundo plano (WAL + snapshot); um único processo.
+JOBSTORE_MODE = os.getenv("JOBSTORE_MODE", "sql").lower()
+JOBSTORE_FLUSH_SECONDS = float(os.getenv("JOBSTORE_FLUSH_SECONDS", "0.5"))
+JOBSTORE_SNAPSHOT_SECONDS = float(os.getenv("JOBSTORE_SNAPSHOT_SECONDS", "60"))
+JOBSTORE_SNAPSHOT_WAL_ROWS = int(os.getenv("JOBSTORE_SNAPSHOT_WAL_ROWS", "1000"))
+
+# --- Papéis do processo ---
+# "all": HTTP + scheduler + varreduras no mesmo processo (padrão).
+# "web": só recebe webhooks e enfileira (pode rodar com vários workers do gunicorn).
+# "worker" (worker.py): scheduler, lembretes, varreduras e consumo da fila.
+APP_ROLE = os.getenv("APP_ROLE", "all").lower()
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "5"))
+QUEUE_BATCH_SIZE = int(os.getenv("QUEUE_BATCH_SIZE", "10"))
+QUEUE_LEASE_SECONDS = float(os.getenv("QUEUE_LEASE_SECONDS", "300"))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "8"))
+# Intervalo entre eventos do GET /jobs/{id}/events (progresso dos jobs administrativos)
+JOB_EVENTS_INTERVAL_SECONDS = float(os.getenv("JOB_EVENTS_INTERVAL_SECONDS", "2"))
+
 # --- Notion API Config ---
 NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 NOTION_DB = os.getenv("NOTION_DB")
@@ -19,6 +68,22 @@ HEADERS_NOTION = {
     "Notion-Version": "2025-09-03",
 }
 
+# --- Notion Rate Limit ---
+# O Notion aceita ~3 req/s por integração; webhook e varredura dividem o mesmo limite
+NOTION_RATE_PER_SECOND = float(os.getenv("NOTION_RATE_PER_SECOND", "3"))
+NOTION_BURST = int(os.getenv("NOTION_BURST", "3"))
+NOTION_MAX_CONCURRENCY = int(os.getenv("NOTION_MAX_CONCURRENCY", "3"))
+NOTION_MAX_RETRIES = int(os.getenv("NOTION_MAX_RETRIES", "3"))
+# Validade (segundos) do cache de schema do database/data source e das opções
+NOTION_SCHEMA_TTL_SECONDS = float(os.getenv("NOTION_SCHEMA_TTL_SECONDS", "600"))
+# Atualizações da mesma página que chegam dentro desta janela viram um único PATCH (0 desliga)
+NOTION_WRITE_COALESCE_SECONDS = float(os.getenv("NOTION_WRITE_COALESCE_SECONDS", "2"))
+# Com o Notion fora do ar, escritas (e leads novos, com id provisório) vão para um outbox
+# durável aplicado em segundo plano; desligado, o webhook responde 503 como antes
+NOTION_OUTBOX_ENABLED = os.getenv("NOTION_OUTBOX_ENABLED", "true").lower() in ("1", "true", "yes")
+NOTION_OUTBOX_MAX_ATTEMPTS = int(os.getenv("NOTION_OUTBOX_MAX_ATTEMPTS", "20"))
+NOTION_OUTBOX_BATCH_SIZE = int(os.getenv("NOTION_OUTBOX_BATCH_SIZE", "20"))
+
 # --- Notion Database Properties ---
 # !! IMPORTANTE !!
 # Se os nomes das colunas na sua base de dados do Notion forem diferentes,
@@ -31,6 +96,7 @@ NOTION_DATE_PROP = os.getenv("NOTION_DATE_PROP", "Data Agendada pelo Lead")
 NOTION_LINK_PROP = os.getenv("NOTION_LINK_PROP", "Link Flexge")
 NOTION_TEST_PROP = os.getenv("NOTION_TEST_PROP", "Teste de Nivelamento")
 NOTION_IA_ATTENDANCE_PROP = os.getenv("NOTION_IA_ATTENDANCE_PROP", "Em atendimento pela IA")
+NOTION_LEVEL_PROP = os.getenv("NOTION_LEVEL_PROP", "Nível Flexge")
 
 # IDs das opções do multi-select (opcionais): "Sim" e "Não"
 NOTION_TEST_OPTION_ID_SIM = os.getenv("NOTION_TEST_OPTION_ID_SIM")
@@ -44,12 +110,87 @@ NOTION_STATUS_VALUE = os.getenv("NOTION_STATUS_VALUE", "Agendado reunião")
 ZAPI_INSTANCE = os.getenv("ZAPI_INSTANCE")
 ZAPI_TOKEN = os.getenv("ZAPI_TOKEN")
 ZAPI_CLIENT_TOKEN = os.getenv("ZAPI_CLIENT_TOKEN")
+# Pool de instâncias (números) da Z-API: "instancia:token[:client_token],..."
+# Sem ZAPI_INSTANCES, usa apenas ZAPI_INSTANCE/ZAPI_TOKEN.
+ZAPI_INSTANCES = [
+    tuple(part.strip() for part in item.split(":"))
+    for item in os.getenv("ZAPI_INSTANCES", "").split(",")
+    if item.strip()
+]
 ADMIN_PHONES = [p.strip() for p in os.getenv("ADMIN_PHONES", "").split(",") if p]
+# Tenants adicionais (outras escolas/unidades) atendidos pelo mesmo processo: JSON com
+# {"<tenant>": {"cal_secret", "notion_token", "notion_db", "zapi_instances", "admin_phones", ...}}
+# em TENANTS_FILE (caminho) ou TENANTS_JSON. As variáveis acima formam o tenant "default".
+TENANTS_FILE = os.getenv("TENANTS_FILE")
+TENANTS_JSON = os.getenv("TENANTS_JSON")
+# Token exigido pelos endpoints administrativos (header X-Admin-Token ou Bearer)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Resumo diário para os admins: uma agenda consolidada às ADMIN_DIGEST_HOUR em vez de um
+# lembrete das 8h por reunião
+ADMIN_DIGEST_ENABLED = os.getenv("ADMIN_DIGEST_ENABLED", "false").lower() in ("1", "true", "yes")
+ADMIN_DIGEST_HOUR = int(os.getenv("ADMIN_DIGEST_HOUR", "8"))
+# > 0: novos agendamentos são avisados aos admins em um resumo a cada N minutos (0 = um por agendamento)
+ADMIN_BOOKINGS_SUMMARY_MINUTES = float(os.getenv("ADMIN_BOOKINGS_SUMMARY_MINUTES", "0"))
+
+# --- Timeouts e Circuit Breakers ---
+# Timeout padrão (segundos) de cada chamada aos upstreams
+NOTION_TIMEOUT_SECONDS = float(os.getenv("NOTION_TIMEOUT_SECONDS", "15"))
+ZAPI_TIMEOUT_SECONDS = float(os.getenv("ZAPI_TIMEOUT_SECONDS", "10"))
+FLEXGE_TIMEOUT_SECONDS = float(os.getenv("FLEXGE_TIMEOUT_SECONDS", "15"))
+# Orçamento total de tempo de um webhook (todas as chamadas da cadeia somadas)
+WEBHOOK_DEADLINE_SECONDS = float(os.getenv("WEBHOOK_DEADLINE_SECONDS", "25"))
+# Controle de admissão dos webhooks processados no próprio processo: até N simultâneos,
+# no máximo M esperando (por até WEBHOOK_QUEUE_TIMEOUT_SECONDS); além disso, 503 + Retry-After
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "4"))
+WEBHOOK_MAX_QUEUED = int(os.getenv("WEBHOOK_MAX_QUEUED", "20"))
+WEBHOOK_QUEUE_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_QUEUE_TIMEOUT_SECONDS", "10"))
+WEBHOOK_RETRY_AFTER_SECONDS = float(os.getenv("WEBHOOK_RETRY_AFTER_SECONDS", "30"))
+# Leads reprocessados em paralelo no replay dos webhooks gravados
+WEBHOOK_REPLAY_CONCURRENCY = int(os.getenv("WEBHOOK_REPLAY_CONCURRENCY", "4"))
+# Circuito abre quando a taxa de falhas nas últimas N chamadas passa do limite
+CIRCUIT_WINDOW_SIZE = int(os.getenv("CIRCUIT_WINDOW_SIZE", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_CALLS = int(os.getenv("CIRCUIT_HALF_OPEN_CALLS", "2"))
+
+# --- Profiling por amostragem ---
+# Fração dos webhooks/jobs amostrada (0 = desligado; ex.: 0.05 = 5%)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Intervalo entre leituras da pilha e quantos perfis (os mais lentos) ficam em memória
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_MAX_DEPTH = int(os.getenv("PROFILE_MAX_DEPTH", "64"))
 
 # --- Flexge API Config ---
 # Configurações para verificação de testes de nivelamento
 FLEXGE_API_KEY = os.getenv("FLEXGE_API_KEY")
 FLEXGE_BASE_URL = os.getenv("FLEXGE_BASE_URL", "https://partner-api.flexge.com/external/placement-tests")
+# Páginas da listagem buscadas em paralelo (quando a API aceita `page=N`) e limite de req/s
+FLEXGE_PAGE_WINDOW = int(os.getenv("FLEXGE_PAGE_WINDOW", "4"))
+FLEXGE_RATE_PER_SECOND = float(os.getenv("FLEXGE_RATE_PER_SECOND", "5"))
+FLEXGE_MAX_PAGES = int(os.getenv("FLEXGE_MAX_PAGES", "200"))
+# O índice email → teste da última leitura completa é reaproveitado por esse tempo
+FLEXGE_INDEX_TTL_SECONDS = float(os.getenv("FLEXGE_INDEX_TTL_SECONDS", "1800"))
+
+# --- Varredura de testes de nivelamento ---
+# Uma execução sem heartbeat há mais que isso é considerada abandonada e é retomada
+SWEEP_STALE_SECONDS = float(os.getenv("SWEEP_STALE_SECONDS", "900"))
+# Intervalo da varredura; cada lead só é verificado quando vence sua própria agenda
+PLACEMENT_SWEEP_MINUTES = float(os.getenv("PLACEMENT_SWEEP_MINUTES", "30"))
+# Leads com agendamento/cadastro recente são verificados a cada PLACEMENT_RECENT_INTERVAL_MINUTES
+PLACEMENT_RECENT_DAYS = float(os.getenv("PLACEMENT_RECENT_DAYS", "3"))
+PLACEMENT_RECENT_INTERVAL_MINUTES = float(os.getenv("PLACEMENT_RECENT_INTERVAL_MINUTES", "30"))
+# Leads mais antigos sem teste: back-off exponencial a partir da base, até o teto
+PLACEMENT_BACKOFF_BASE_HOURS = float(os.getenv("PLACEMENT_BACKOFF_BASE_HOURS", "3"))
+PLACEMENT_BACKOFF_MAX_HOURS = float(os.getenv("PLACEMENT_BACKOFF_MAX_HOURS", "168"))
+# Verificação do lead agendada após o envio do link do teste na confirmação da reunião
+PLACEMENT_REFRESH_DELAY_MINUTES = float(os.getenv("PLACEMENT_REFRESH_DELAY_MINUTES", "20"))
+# Cópia local dos leads: cada varredura só busca no Notion as páginas editadas desde a
+# última sincronização (com margem, pois o last_edited_time do Notion tem precisão de minuto)
+LEAD_SYNC_OVERLAP_SECONDS = float(os.getenv("LEAD_SYNC_OVERLAP_SECONDS", "120"))
+# Leitura completa periódica para remover da cópia local páginas apagadas/arquivadas
+LEAD_FULL_RECONCILE_HOURS = float(os.getenv("LEAD_FULL_RECONCILE_HOURS", "24"))
 
 # --- Zaia API Config (NOVO) ---
 # Configurações para enviar mensagens para a Zaia e preservar contexto
@@ -57,6 +198,18 @@ ZAIA_API_KEY = os.getenv("ZAIA_API_KEY")
 ZAIA_AGENT_ID = os.getenv("ZAIA_AGENT_ID")
 ZAIA_BASE_URL = os.getenv("ZAIA_BASE_URL", "https://api.zaia.app")
 
+# --- Marcação de contexto (mensagens do sistema) ---
+# Avisa o receptor do agente que uma mensagem foi enviada pelo sistema.
+# "http": lotes enviados em segundo plano; "disabled"
+CONTEXT_MARKER_MODE = os.getenv("CONTEXT_MARKER_MODE", "http").lower()
+CONTEXT_MARKER_URL = os.getenv("CONTEXT_MARKER_URL", "https://agenda-cal-2-0.onrender.com/webhook")
+# Se definida, cada lote vai em uma única requisição para esta URL; senão, um POST por marcação
+CONTEXT_MARKER_BATCH_URL = os.getenv("CONTEXT_MARKER_BATCH_URL")
+CONTEXT_MARKER_FLUSH_SECONDS = float(os.getenv("CONTEXT_MARKER_FLUSH_SECONDS", "1"))
+CONTEXT_MARKER_BATCH_SIZE = int(os.getenv("CONTEXT_MARKER_BATCH_SIZE", "50"))
+CONTEXT_MARKER_MAX_PENDING = int(os.getenv("CONTEXT_MARKER_MAX_PENDING", "1000"))
+CONTEXT_MARKER_TIMEOUT_SECONDS = float(os.getenv("CONTEXT_MARKER_TIMEOUT_SECONDS", "10"))
+
 # Validação das configurações
 if not FLEXGE_API_KEY:
     print("⚠️  AVISO: FLEXGE_API_KEY não configurada. Verificação de testes de nivelamento será desabilitada.")
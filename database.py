@@ -0,0 +1,225 @@
+import asyncio
+import importlib.util
+import json
+import threading
+import time
+import uuid
+from typing import Any, Dict, List
+from sqlalchemy import Column, Float, MetaData, String, Table, Text, create_engine, select
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.sql import Executable
+from config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT_SECONDS, DB_CONNECT_TIMEOUT_SECONDS,
+    DB_POOL_RECYCLE_SECONDS, DB_POOL_PRE_PING, DB_POOL_WARMUP, DB_PGBOUNCER, DB_ASYNC_ENABLED,
+)
+
+# Tabelas da aplicação (fora as do APScheduler) são registradas aqui
+metadata = MetaData()
+
+# Pequenos estados persistentes da aplicação (ex.: horário da última sincronização)
+app_state = Table(
+    "app_state",
+    metadata,
+    Column("key", String(191), primary_key=True),
+    Column("value", Text, nullable=False),
+    Column("updated_at", Float, nullable=False),
+)
+
+_engine: Engine | None = None
+_async_engine: AsyncEngine | None = None
+_engine_lock = threading.Lock()
+
+# Driver assíncrono de cada banco
+_ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def _database_url() -> URL:
+    if not DATABASE_URL:
+        raise RuntimeError("DATABASE_URL não configurada")
+    url = make_url(DATABASE_URL)
+    if url.drivername in ("postgres", "postgresql"):
+        # "postgres://" (Render/Heroku) não é aceito pelo SQLAlchemy 2, e sem driver explícito
+        # o SQLAlchemy 2.1 escolhe o psycopg 3; o instalado é o psycopg2
+        url = url.set(drivername="postgresql+psycopg2")
+    return url
+
+
+def uses_pgbouncer(url: URL) -> bool:
+    """Pooler em modo transação (PgBouncer/Supabase): configurado ou deduzido da URL."""
+    if DB_PGBOUNCER != "auto":
+        return DB_PGBOUNCER in ("1", "true", "yes")
+    return url.get_backend_name() == "postgresql" and (url.port == 6543 or "pooler." in (url.host or ""))
+
+
+def _pool_options(url: URL) -> Dict[str, Any]:
+    """Opções de pool comuns aos engines síncrono e assíncrono."""
+    options: Dict[str, Any] = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        )
+    return options
+
+
+def get_engine() -> Engine:
+    """Engine SQLAlchemy compartilhado do processo (jobstore e tabelas da aplicação).
+
+    Todo acesso ao banco passa por ele (ou pelo assíncrono, com o mesmo pool
+    configurado), então cada instância abre no máximo DB_POOL_SIZE + DB_MAX_OVERFLOW
+    conexões por engine.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            url = _database_url()
+            connect_args = {}
+            if url.get_backend_name() == "postgresql":
+                connect_args["connect_timeout"] = DB_CONNECT_TIMEOUT_SECONDS
+            # psycopg2 não usa prepared statements no servidor: funciona igual atrás do PgBouncer
+            _engine = create_engine(url, connect_args=connect_args, **_pool_options(url))
+        return _engine
+
+
+def _async_url(url: URL) -> URL | None:
+    backend = url.get_backend_name()
+    driver = _ASYNC_DRIVERS.get(backend)
+    if driver is None or importlib.util.find_spec(driver) is None:
+        return None
+    query = dict(url.query)
+    if backend == "postgresql" and "sslmode" in query:
+        # O asyncpg recebe o modo de SSL como `ssl`
+        query["ssl"] = query.pop("sslmode")
+    return url.set(drivername=f"{backend}+{driver}", query=query)
+
+
+def get_async_engine() -> AsyncEngine | None:
+    """Engine assíncrono compartilhado (asyncpg/aiosqlite) para uso direto em corrotinas.
+
+    None se DB_ASYNC_ENABLED=false ou o driver não estiver instalado; nesse caso
+    `execute_async`/`fetch_all_async` usam o engine síncrono em uma thread.
+    """
+    global _async_engine
+    if not DB_ASYNC_ENABLED:
+        return None
+    with _engine_lock:
+        if _async_engine is None:
+            url = _database_url()
+            async_url = _async_url(url)
+            if async_url is None:
+                return None
+            connect_args: Dict[str, Any] = {}
+            if url.get_backend_name() == "postgresql":
+                connect_args["timeout"] = DB_CONNECT_TIMEOUT_SECONDS
+                if uses_pgbouncer(url):
+                    # Modo transação: cada statement pode cair em outra conexão do servidor,
+                    # então nada de cache de prepared statements e nomes sempre únicos
+                    async_url = async_url.update_query_dict({"prepared_statement_cache_size": "0"})
+                    connect_args["statement_cache_size"] = 0
+                    connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+            _async_engine = create_async_engine(async_url, connect_args=connect_args, **_pool_options(url))
+        return _async_engine
+
+
+async def execute_async(statement: Executable) -> Any:
+    """Executa um INSERT/UPDATE/DELETE em uma transação, sem bloquear o event loop.
+
+    Retorna a chave primária gerada (INSERT) ou o número de linhas afetadas.
+    """
+    engine = get_async_engine()
+    if engine is None:
+        return await asyncio.to_thread(_execute_sync, statement)
+    async with engine.begin() as conn:
+        return _write_result(await conn.execute(statement))
+
+
+def _execute_sync(statement: Executable) -> Any:
+    with get_engine().begin() as conn:
+        return _write_result(conn.execute(statement))
+
+
+def _write_result(result) -> Any:
+    if result.is_insert:
+        return result.inserted_primary_key[0]
+    return result.rowcount
+
+
+async def fetch_all_async(statement: Executable) -> List[Any]:
+    """Executa um SELECT sem bloquear o event loop e retorna todas as linhas."""
+    engine = get_async_engine()
+    if engine is None:
+        return await asyncio.to_thread(_fetch_all_sync, statement)
+    async with engine.connect() as conn:
+        return (await conn.execute(statement)).all()
+
+
+def _fetch_all_sync(statement: Executable) -> List[Any]:
+    with get_engine().begin() as conn:
+        return conn.execute(statement).all()
+
+
+def warm_up_pool() -> None:
+    """Abre DB_POOL_WARMUP conexões na inicialização e devolve ao pool."""
+    count = min(DB_POOL_WARMUP, DB_POOL_SIZE)
+    if count <= 0:
+        return
+    connections = [get_engine().connect() for _ in range(count)]
+    for conn in connections:
+        conn.close()
+
+
+async def warm_up_async_pool() -> None:
+    """Como `warm_up_pool`, para o engine assíncrono (no event loop da aplicação)."""
+    engine = get_async_engine()
+    count = min(DB_POOL_WARMUP, DB_POOL_SIZE)
+    if engine is None or count <= 0:
+        return
+    connections = await asyncio.gather(*(engine.connect() for _ in range(count)))
+    for conn in connections:
+        await conn.close()
+
+
+async def dispose_async_engine() -> None:
+    """Fecha as conexões do engine assíncrono (no shutdown, antes do event loop acabar)."""
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+
+def pool_snapshot() -> Dict[str, Any]:
+    """Estado dos pools para o health check."""
+    url = _database_url()
+    snapshot: Dict[str, Any] = {
+        "backend": url.get_backend_name(),
+        "pgbouncer": uses_pgbouncer(url),
+        "pool": get_engine().pool.status(),
+        "async": None,
+    }
+    if _async_engine is not None:
+        snapshot["async"] = _async_engine.pool.status()
+    return snapshot
+
+
+def create_tables() -> None:
+    """Cria as tabelas da aplicação que ainda não existirem."""
+    metadata.create_all(get_engine(), checkfirst=True)
+
+
+def get_state(key: str, default: Any = None) -> Any:
+    with get_engine().begin() as conn:
+        value = conn.execute(select(app_state.c.value).where(app_state.c.key == key)).scalar()
+    return json.loads(value) if value is not None else default
+
+
+def set_state(key: str, value: Any) -> None:
+    now = time.time()
+    with get_engine().begin() as conn:
+        updated = conn.execute(
+            app_state.update().where(app_state.c.key == key).values(value=json.dumps(value), updated_at=now)
+        ).rowcount
+        if not updated:
+            conn.execute(app_state.insert().values(key=key, value=json.dumps(value), updated_at=now))
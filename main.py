@@ -1,48 +1,62 @@
 from __future__ import annotations
 from contextlib import asynccontextmanager
+import asyncio
+import os
+import socket
 import hmac
 import hashlib
 import json
 import httpx
 from datetime import datetime, timedelta
 from fastapi import FastAPI, Header, HTTPException, Request, status, Body
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import ValidationError
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.triggers.date import DateTrigger
-from apscheduler.triggers.interval import IntervalTrigger
 
-from config import CAL_SECRET, TZ, ADMIN_PHONES, HEADERS_NOTION, NOTION_STATUS_VALUE, DATABASE_URL
+from config import (
+    CAL_SECRET, TZ, ADMIN_PHONES, HEADERS_NOTION,
+    WEBHOOK_DEADLINE_SECONDS, SCHEDULER_MODE, TICK_TOKEN, APP_ROLE, ADMIN_TOKEN, NOTION_OUTBOX_ENABLED,
+)
+from database import create_tables, dispose_async_engine, pool_snapshot, warm_up_async_pool, warm_up_pool
+from app_scheduler import scheduler, jobstores, start_scheduler, register_periodic_jobs, shutdown_scheduler
 from models import (
     CalWebhookPayload,
     ScheduleTestRequest,
     ScheduleLeadTestRequest,
     SendLeadMessageRequest,
+    PlacementRefreshRequest,
+    WebhookReplayRequest,
+)
+from services.notion_service import flush_notion_writes, notion_find_page
+from services.notion_client import notion_client, NotionUnavailableError
+from services.whatsapp_service import send_wa_message
+from services.booking_service import BOOKING_EVENTS, process_booking
+from services.scheduling_service import schedule_messages
+from services.zapi_pool import zapi_pool
+from services.tenant_service import (
+    DEFAULT_TENANT, TENANT_PAYLOAD_KEY, Tenant, close_tenants, get_tenant, tenant_for_signature,
+    tenant_scope, tenants, tenants_snapshot,
 )
-from services.notion_service import (
-    notion_find_page,
-    notion_update_meeting_date,
-    notion_update_status,
-    notion_update_email,
-    notion_create_page
+from services.resilience import deadline_budget, breakers_snapshot
+from services.profiling_service import profiler
+from services.admission_service import OverloadedError, webhook_admission
+from services.webhook_log_service import EVENT_PAYLOAD_KEY, list_events, mark_processed_async, record_event_async
+from services.queue_service import enqueue_async, run_queue_consumer
+from services.notion_outbox_service import outbox_snapshot
+from services.notion_outbox_drainer import run_outbox_drainer
+from services.jobstore import jobstore_info
+from services.queue_handlers import register_queue_handlers
+from services.tick_service import run_due_jobs
+from services.sweep_run_service import list_runs, get_run
+from services.admin_job_service import (
+    NOTION_API_CHECK, PLACEMENT_SWEEP, SCHEDULE_LEAD_MESSAGES, WEBHOOK_REPLAY, job_events, job_snapshot, submit_job,
 )
-from services.whatsapp_service import send_immediate_booking_notifications, send_wa_message
-from services.scheduling_service import schedule_messages, schedule_lead_messages
-from utils import format_pt_br
 
 # NOVA IMPORTAÇÃO: Serviço de contexto da Zaia
 from services.zaia_context_service import ZaiaContextService
 
 # NOVA IMPORTAÇÃO: Serviço de verificação de testes de nivelamento
-from services.placement_test_service import placement_test_service
-
-# -----------------------------------------------------------------------------
-# Scheduler Setup with Persistent Job Store
-# -----------------------------------------------------------------------------
-jobstores = {
-    'default': SQLAlchemyJobStore(url=DATABASE_URL)
-}
-scheduler = AsyncIOScheduler(jobstores=jobstores)
+from services.placement_test_service import PlacementUpstreamError, placement_test_service
 
 # ✅ REMOVIDO: Inicialização duplicada do ZaiaContextService
 # O serviço será inicializado apenas quando necessário em whatsapp_service.py
@@ -50,29 +64,41 @@ scheduler = AsyncIOScheduler(jobstores=jobstores)
 # -----------------------------------------------------------------------------
 # FastAPI app & scheduler lifecycle
 # -----------------------------------------------------------------------------
+# APP_ROLE=web: este processo só recebe webhooks e enfileira; o scheduler fica
+# apenas gravando jobs e quem executa é o worker (worker.py).
+WEB_ONLY = APP_ROLE == "web"
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Iniciar o scheduler quando a aplicação iniciar
-    scheduler.start()
-    print("Scheduler started...")
-    
-    # ✅ NOVO: Adicionar job periódico para verificar testes de nivelamento
-    if placement_test_service.enabled:
-        scheduler.add_job(
-            placement_test_service.process_all_students,
-            trigger=IntervalTrigger(hours=3),  # Executa a cada 3 horas
-            id="placement_test_checker",
-            replace_existing=True,
-            max_instances=1  # Evita execuções simultâneas
-        )
-        print("✅ Job de verificação de testes de nivelamento agendado (a cada 3 horas)")
-    else:
-        print("⚠️ Job de verificação de testes de nivelamento não agendado (FLEXGE_API_KEY não configurada)")
+    create_tables()
+    # Conexões já abertas: a primeira requisição não espera o handshake com o banco
+    warm_up_pool()
+    await warm_up_async_pool()
+    # Iniciar o scheduler quando a aplicação iniciar.
+    # No modo "external" ele só grava jobs; quem dispara é o POST /tick.
+    start_scheduler(run_jobs=not WEB_ONLY)
+
+    stop_event = asyncio.Event()
+    tasks = []
+    if not WEB_ONLY:
+        register_periodic_jobs()
+        # No modo "all" este processo também consome a fila durável
+        register_queue_handlers()
+        tasks.append(asyncio.create_task(run_queue_consumer(INSTANCE_ID, stop_event)))
+        if NOTION_OUTBOX_ENABLED:
+            tasks.append(asyncio.create_task(run_outbox_drainer(INSTANCE_ID, scheduler, stop_event)))
     
     yield
     # Parar o scheduler quando a aplicação desligar
-    scheduler.shutdown()
-    print("Scheduler shut down.")
+    stop_event.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    shutdown_scheduler()
+    # Atualizações de páginas do Notion ainda no buffer de escrita
+    await asyncio.to_thread(flush_notion_writes)
+    # Envia as marcações de contexto que ainda estão na fila e fecha as conexões dos tenants
+    await asyncio.to_thread(close_tenants)
+    await dispose_async_engine()
 
 app = FastAPI(
     title="Cal.com → Notion + WhatsApp Integration",
@@ -84,14 +110,44 @@ app = FastAPI(
 # -----------------------------------------------------------------------------
 # Helpers
 # -----------------------------------------------------------------------------
-def verify_signature(signature_header: str | None, raw_body: bytes) -> None:
+def verify_signature(signature_header: str | None, raw_body: bytes, secret: bytes = CAL_SECRET) -> None:
     if not signature_header:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing signature")
 
-    digest = hmac.new(CAL_SECRET, raw_body, hashlib.sha256).hexdigest()
+    digest = hmac.new(secret, raw_body, hashlib.sha256).hexdigest()
     if not hmac.compare_digest(digest, signature_header):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid signature")
 
+def verify_admin_token(authorization: str | None, x_admin_token: str | None) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="ADMIN_TOKEN not configured")
+    provided = x_admin_token
+    if not provided and authorization and authorization.startswith("Bearer "):
+        provided = authorization[len("Bearer "):]
+    if not provided or not hmac.compare_digest(provided, ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin token")
+
+def verify_tick_token(authorization: str | None, x_tick_token: str | None) -> None:
+    if not TICK_TOKEN:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="TICK_TOKEN not configured")
+    provided = x_tick_token
+    if not provided and authorization and authorization.startswith("Bearer "):
+        provided = authorization[len("Bearer "):]
+    if not provided or not hmac.compare_digest(provided, TICK_TOKEN):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid tick token")
+
+# -----------------------------------------------------------------------------
+# External clock (Cloud Scheduler / cron)
+# -----------------------------------------------------------------------------
+@app.post("/tick")
+async def tick(authorization: str = Header(None), x_tick_token: str = Header(None)):
+    """Executa todos os lembretes e jobs vencidos (modo SCHEDULER_MODE=external)."""
+    verify_tick_token(authorization, x_tick_token)
+    if SCHEDULER_MODE != "external":
+        # No modo interno o próprio scheduler dispara; um tick executaria em dobro
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="SCHEDULER_MODE is not 'external'")
+    return await run_due_jobs(scheduler, jobstores['default'])
+
 # -----------------------------------------------------------------------------
 # Webhook endpoint
 # -----------------------------------------------------------------------------
@@ -99,9 +155,29 @@ def verify_signature(signature_header: str | None, raw_body: bytes) -> None:
 async def cal_webhook(
     request: Request, x_cal_signature_256: str = Header(None)
 ):
-    print("\n=== Novo webhook recebido ===")
     raw_body = await request.body()
-    # verify_signature(x_cal_signature_256, raw_body) # Temporariamente desabilitado para testes
+    # Sem tenant no caminho, o webhook é do tenant cujo segredo gerou a assinatura
+    tenant = tenant_for_signature(x_cal_signature_256, raw_body)
+    if tenant is None:
+        if len(tenants) > 1:
+            # Com vários tenants, cair no padrão gravaria o lead no Notion/WhatsApp de outra escola
+            print("✗ Webhook sem assinatura de nenhum tenant configurado")
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Signature matches no tenant")
+        tenant = get_tenant(DEFAULT_TENANT)
+    return await handle_cal_webhook(tenant, raw_body, x_cal_signature_256)
+
+@app.post("/webhook/cal/{tenant_id}")
+async def cal_webhook_tenant(
+    tenant_id: str, request: Request, x_cal_signature_256: str = Header(None)
+):
+    tenant = get_tenant(tenant_id)
+    if tenant is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown tenant")
+    return await handle_cal_webhook(tenant, await request.body(), x_cal_signature_256)
+
+async def handle_cal_webhook(tenant: Tenant, raw_body: bytes, x_cal_signature_256: str | None):
+    print(f"\n=== Novo webhook recebido (tenant {tenant.id}) ===")
+    # verify_signature(x_cal_signature_256, raw_body, tenant.cal_secret) # Temporariamente desabilitado para testes
     
     print("\nPayload recebido do Cal.com:")
     payload_json = json.loads(raw_body)
@@ -113,70 +189,50 @@ async def cal_webhook(
         print(f"✗ Erro de validação: {e.json()}")
         raise HTTPException(status_code=400,detail=f"Payload inválido: {str(e)}")
 
-    if data.trigger_event not in {"BOOKING_CREATED", "BOOKING_RESCHEDULED", "BOOKING_REQUESTED"}:
-        return {"ignored": data.trigger_event}
-
-    attendee = data.payload.attendees[0]
-    start_dt = datetime.fromisoformat(data.payload.start_time.replace("Z", "+00:00")).astimezone(TZ)
-    formatted_pt = format_pt_br(start_dt)
+    # Corpo original gravado (comprimido) para reprocessamento após bugs ou quedas
+    try:
+        event_id = await record_event_async(tenant.id, data, raw_body)
+    except Exception as e:
+        # Sem o registro o webhook ainda é processado; só não fica disponível para replay
+        print(f"⚠️ Erro ao gravar o webhook para reprocessamento: {e}")
+        event_id = None
 
-    print(f"\nDetalhes do agendamento: Nome: {attendee.name}, Email: {attendee.email}, Data: {formatted_pt}")
+    if data.trigger_event not in BOOKING_EVENTS:
+        return {"ignored": data.trigger_event}
 
-    # 1. Extrair WhatsApp do payload
-    whatsapp = None
-    ufr = data.payload.userFieldsResponses
-    if ufr and ufr.WhatsApp and 'value' in ufr.WhatsApp:
-        whatsapp = ufr.WhatsApp['value']
-    
-    if whatsapp:
-        print(f"WhatsApp extraído do payload: {whatsapp}")
-
-    # 2. Encontrar ou criar página no Notion
-    page_id = None
-    if whatsapp:
-        page_id = notion_find_page(whatsapp, by="phone")
-    if not page_id and attendee.email:
-        page_id = notion_find_page(attendee.email, by="email")
-
-    if page_id:
-        print(f"Página do Notion encontrada: {page_id}")
-        notion_update_meeting_date(page_id, formatted_pt)
-        notion_update_status(page_id, NOTION_STATUS_VALUE)
-        if attendee.email:
-            notion_update_email(page_id, attendee.email)
-    else:
-        print("Lead não encontrado. Criando novo registro no Notion...")
-        page_id = notion_create_page(
-            name=attendee.name,
-            email=attendee.email,
-            phone=whatsapp,
-            meeting_date=formatted_pt,
-            status=NOTION_STATUS_VALUE
+    if WEB_ONLY:
+        # Só ingere: o worker processa (Notion, WhatsApp, lembretes) a partir da fila
+        if not tenant.is_default:
+            payload_json[TENANT_PAYLOAD_KEY] = tenant.id
+        payload_json[EVENT_PAYLOAD_KEY] = event_id
+        item_id = await enqueue_async("cal_booking", payload_json)
+        print(f"✓ Webhook enfileirado (item {item_id})")
+        return {"success": True, "queued": item_id}
+
+    # Todas as chamadas a upstreams deste webhook dividem um único orçamento de tempo.
+    # O processamento (chamadas síncronas ao Notion/Z-API) roda fora do event loop.
+    # Em rajadas, só WEBHOOK_MAX_IN_FLIGHT por vez; o excedente espera ou volta com 503.
+    try:
+        async with webhook_admission.admit():
+            with tenant_scope(tenant), deadline_budget(WEBHOOK_DEADLINE_SECONDS):
+                booking = profiler.wrap(f"webhook:{data.trigger_event}", process_booking)
+                result = await asyncio.to_thread(booking, scheduler, data)
+        await mark_processed_async(event_id)
+        return result
+    except OverloadedError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Serviço sobrecarregado, tente novamente",
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
+    except NotionUnavailableError as e:
+        # Não sabemos se o lead existe: pedir ao Cal.com para reenviar em vez de duplicar
+        print(f"✗ Notion indisponível, webhook será reenviado pelo Cal.com: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Notion indisponível, tente novamente",
+            headers={"Retry-After": "60"},
         )
-
-    # Enviar notificações e agendar mensagens
-    if not page_id:
-        print("✗ Não foi possível encontrar ou criar uma página no Notion. O fluxo de notificação para o lead pode não funcionar.")
-    
-    if whatsapp:
-        send_immediate_booking_notifications(attendee.name, whatsapp, start_dt)
-        schedule_lead_messages(scheduler, attendee.name, whatsapp, start_dt)
-        print("✓ Notificações para o lead enviadas e agendadas.")
-        
-        # ✅ NOVO: Envia contexto para a Zaia sobre o agendamento
-        try:
-            context_message = f"Reunião agendada para {attendee.name} em {formatted_pt}"
-            ZaiaContextService().send_meeting_confirmation(whatsapp, context_message)
-            print("✓ Contexto enviado para a Zaia com sucesso.")
-        except Exception as e:
-            print(f"⚠️ Erro ao enviar contexto para Zaia: {e}")
-
-    # Notificações para admins, somente se tivermos uma página no Notion
-    if page_id:
-        schedule_messages(scheduler, attendee.name, start_dt, page_id, whatsapp)
-        print("✓ Lembretes para admins agendados.")
-
-    return {"success": True}
 
 # -----------------------------------------------------------------------------
 # Health check & Test endpoints
@@ -187,7 +243,17 @@ async def root():
         "status": "healthy",
         "version": "1.0.3",
         "timezone": str(TZ),
+        "scheduler_mode": SCHEDULER_MODE,
+        "role": APP_ROLE,
         "admin_phones_configured": len(ADMIN_PHONES),
+        "circuits": breakers_snapshot(),
+        "zapi_instances": zapi_pool.snapshot(),
+        "notion_rate_limit": notion_client.limiter.snapshot(),
+        "webhook_admission": webhook_admission.snapshot(),
+        "tenants": tenants_snapshot(),
+        "jobstore": jobstore_info(jobstores['default']),
+        "notion_outbox": await outbox_snapshot(),
+        "database": pool_snapshot(),
     }
 
 @app.post("/test/schedule-messages", tags=["Testes"])
@@ -199,26 +265,19 @@ def test_schedule_messages(req: ScheduleTestRequest = Body(...)):
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-@app.post("/test/schedule-lead-messages", tags=["Testes"])
-def test_schedule_lead_messages(req: ScheduleLeadTestRequest = Body(...)):
+@app.post("/test/schedule-lead-messages", tags=["Testes"], status_code=status.HTTP_202_ACCEPTED)
+async def test_schedule_lead_messages(
+    req: ScheduleLeadTestRequest = Body(...),
+    authorization: str = Header(None),
+    x_admin_token: str = Header(None),
+):
+    """Enfileira o agendamento (a busca no Notion roda no consumidor da fila)."""
+    verify_admin_token(authorization, x_admin_token)
     try:
-        dt = datetime.fromisoformat(req.meeting_datetime)
-        page_id = notion_find_page(req.email, by="email")
-        if not page_id:
-            return {"success": False, "error": "Lead não encontrado no Notion"}
-        
-        resp = httpx.get(f"https://api.notion.com/v1/pages/{page_id}", headers=HEADERS_NOTION)
-        resp.raise_for_status()
-        page_props = resp.json().get("properties", {})
-        phone = page_props.get("Telefone", {}).get("phone_number")
-        
-        if not phone:
-            return {"success": False, "error": "Telefone não encontrado para o lead no Notion"}
-        
-        schedule_lead_messages(scheduler, req.first_name, phone, dt)
-        return {"success": True, "scheduled_for": req.meeting_datetime, "phone": phone}
-    except Exception as e:
-        return {"success": False, "error": str(e)}
+        datetime.fromisoformat(req.meeting_datetime)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return await asyncio.to_thread(submit_job, SCHEDULE_LEAD_MESSAGES, req.model_dump())
 
 @app.post("/test/send-lead-message", tags=["Testes"])
 def test_send_lead_message(req: SendLeadMessageRequest = Body(...)):
@@ -325,60 +384,154 @@ async def test_schedule_messages():
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-@app.get("/test/placement-tests")
-async def test_placement_tests():
-    """Testa a verificação de testes de nivelamento."""
-    try:
-        if not placement_test_service.enabled:
-            return {
-                "success": False,
-                "error": "PlacementTestService desabilitado: FLEXGE_API_KEY não configurada",
-                "enabled": False
-            }
-        
-        await placement_test_service.process_all_students()
-        return {
-            "success": True,
-            "message": "Verificação de testes de nivelamento executada com sucesso",
-            "timestamp": datetime.now().isoformat(),
-            "enabled": True
-        }
-    except Exception as e:
-        return {"success": False, "error": str(e), "enabled": placement_test_service.enabled}
+@app.get("/test/placement-tests", status_code=status.HTTP_202_ACCEPTED)
+async def test_placement_tests(force: bool = False, authorization: str = Header(None), x_admin_token: str = Header(None)):
+    """Dispara a verificação de testes de nivelamento em segundo plano (`force=true` ignora a agenda).
 
-@app.get("/test/notion-api-upgrade")
-async def test_notion_api_upgrade():
-    """Testa a compatibilidade com a nova API do Notion 2025-09-03."""
-    try:
-        from services.notion_service import get_data_source_id
-        
-        # Testa descoberta de data_source_id
-        data_source_id = get_data_source_id(NOTION_DB)
-        if not data_source_id:
-            return {
-                "success": False,
-                "error": "Não foi possível descobrir data_source_id",
-                "api_version": "2025-09-03"
-            }
-        
-        # Testa busca de página (simulando busca por email)
-        test_email = "test@example.com"
-        page_id = notion_find_page(test_email, "email")
-        
-        return {
-            "success": True,
-            "message": "API do Notion 2025-09-03 funcionando corretamente",
-            "data_source_id": data_source_id,
-            "database_id": NOTION_DB,
-            "api_version": "2025-09-03",
-            "test_search_worked": page_id is not None or True  # True se não encontrou (esperado)
-        }
-    except Exception as e:
+    Retorna o id do job; o progresso é acompanhado em `/jobs/{job_id}/events`.
+    """
+    verify_admin_token(authorization, x_admin_token)
+    if not placement_test_service.enabled:
         return {
             "success": False,
-            "error": str(e),
-            "api_version": "2025-09-03"
+            "error": "PlacementTestService desabilitado: FLEXGE_API_KEY não configurada",
+            "enabled": False
         }
+    return await asyncio.to_thread(submit_job, PLACEMENT_SWEEP, {"force": force})
+
+@app.post("/placement/refresh", tags=["Varredura"])
+async def placement_refresh(
+    req: PlacementRefreshRequest = Body(...),
+    authorization: str = Header(None),
+    x_admin_token: str = Header(None),
+):
+    """Atualiza o teste de nivelamento de um único lead (por email ou page_id)."""
+    verify_admin_token(authorization, x_admin_token)
+    if not req.email and not req.page_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Informe email ou page_id")
+    try:
+        result = await placement_test_service.refresh_lead(email=req.email, page_id=req.page_id)
+    except NotionUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Notion indisponível: {e}",
+            headers={"Retry-After": "60"},
+        )
+    except PlacementUpstreamError as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
+    if not result["success"] and "page_id" not in result:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=result["error"])
+    return result
+
+@app.get("/placement/runs", tags=["Varredura"])
+async def placement_runs(limit: int = 20, authorization: str = Header(None), x_admin_token: str = Header(None)):
+    """Histórico das varreduras de testes (duração, leads por segundo, erros)."""
+    verify_admin_token(authorization, x_admin_token)
+    return {"runs": await asyncio.to_thread(list_runs, min(limit, 200))}
+
+@app.get("/placement/runs/{run_id}", tags=["Varredura"])
+async def placement_run(
+    run_id: int,
+    outcome: str | None = None,
+    limit: int = 500,
+    authorization: str = Header(None),
+    x_admin_token: str = Header(None),
+):
+    """Uma varredura com o resultado de cada lead (filtro opcional por `outcome`)."""
+    verify_admin_token(authorization, x_admin_token)
+    run = await asyncio.to_thread(get_run, run_id, outcome, min(limit, 5000))
+    if run is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Run not found")
+    return run
+
+@app.get("/test/notion-api-upgrade", status_code=status.HTTP_202_ACCEPTED)
+async def test_notion_api_upgrade(authorization: str = Header(None), x_admin_token: str = Header(None)):
+    """Enfileira o teste de compatibilidade com a API do Notion 2025-09-03."""
+    verify_admin_token(authorization, x_admin_token)
+    return await asyncio.to_thread(submit_job, NOTION_API_CHECK, {})
+
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+async def job_status(job_id: int, authorization: str = Header(None), x_admin_token: str = Header(None)):
+    """Estado de um job administrativo (e contadores da varredura vinculada)."""
+    verify_admin_token(authorization, x_admin_token)
+    snapshot = await asyncio.to_thread(job_snapshot, job_id)
+    if snapshot is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return snapshot
+
+@app.get("/jobs/{job_id}/events", tags=["Jobs"])
+async def job_status_events(job_id: int, request: Request, authorization: str = Header(None), x_admin_token: str = Header(None)):
+    """Server-Sent Events com processados/atualizados/falhas e itens por segundo até o job terminar."""
+    verify_admin_token(authorization, x_admin_token)
+    if await asyncio.to_thread(job_snapshot, job_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return StreamingResponse(
+        job_events(job_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/admin/webhooks/events", tags=["Webhooks"])
+async def webhook_events_list(
+    since: str | None = None,
+    until: str | None = None,
+    uid: str | None = None,
+    tenant: str | None = None,
+    limit: int = 200,
+    authorization: str = Header(None),
+    x_admin_token: str = Header(None),
+):
+    """Webhooks do Cal.com gravados (sem o corpo), por período de recebimento e/ou uid."""
+    verify_admin_token(authorization, x_admin_token)
+    try:
+        since_dt = datetime.fromisoformat(since) if since else None
+        until_dt = datetime.fromisoformat(until) if until else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Data inválida: {e}")
+    events = await asyncio.to_thread(
+        list_events, since_dt, until_dt, [uid] if uid else None, tenant, None, min(limit, 5000)
+    )
+    return {"events": events}
+
+@app.post("/admin/webhooks/replay", tags=["Webhooks"], status_code=status.HTTP_202_ACCEPTED)
+async def webhook_replay(
+    req: WebhookReplayRequest = Body(...),
+    authorization: str = Header(None),
+    x_admin_token: str = Header(None),
+):
+    """Enfileira o reprocessamento dos webhooks gravados de um período e/ou lista de uids."""
+    verify_admin_token(authorization, x_admin_token)
+    if not req.since and not req.uids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Informe since ou uids")
+    try:
+        for value in (req.since, req.until):
+            if value:
+                datetime.fromisoformat(value)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Data inválida: {e}")
+    return await asyncio.to_thread(submit_job, WEBHOOK_REPLAY, req.model_dump())
+
+@app.get("/admin/profiles", tags=["Profiling"])
+async def list_profiles(authorization: str = Header(None), x_admin_token: str = Header(None)):
+    """Perfis amostrados mais lentos (webhooks e jobs), com o tempo dividido em upstream/CPU/resto."""
+    verify_admin_token(authorization, x_admin_token)
+    return {"sample_rate": profiler.sample_rate, "profiles": profiler.profiles()}
+
+@app.get("/admin/profiles/{profile_id}", tags=["Profiling"])
+async def get_profile(
+    profile_id: int,
+    format: str = "json",
+    authorization: str = Header(None),
+    x_admin_token: str = Header(None),
+):
+    """Um perfil completo; com `format=folded`, as pilhas para flamegraph.pl/speedscope."""
+    verify_admin_token(authorization, x_admin_token)
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    if format == "folded":
+        return PlainTextResponse(profiler.folded(profile))
+    return profile
 
 if __name__ == "__main__":
     import uvicorn
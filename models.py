@@ -45,4 +45,22 @@ class SendLeadMessageRequest(BaseModel):
     meeting_datetime: str  # ISO format string
     first_name: str = "Lead"
     which: str = "1d"  # opções: "1d", "4h", "after"
-    send_now: bool = True 
\ No newline at end of file
+    send_now: bool = True 
+
+
+class PlacementRefreshRequest(BaseModel):
+    email: Optional[str] = None
+    page_id: Optional[str] = None
+
+
+class WebhookReplayRequest(BaseModel):
+    since: Optional[str] = None  # ISO format string (recebimento do webhook)
+    until: Optional[str] = None  # ISO format string
+    uids: List[str] = []
+    tenant: Optional[str] = None
+    notify_lead: bool = False
+    notify_admins: bool = False
+    include_processed: bool = False
+    include_past: bool = False
+    concurrency: Optional[int] = None
+    dry_run: bool = False
@@ -0,0 +1,74 @@
+"""
+Reprocessa webhooks do Cal.com gravados pelo serviço (tabela webhook_events).
+
+Para recuperar agendamentos afetados por um bug ou uma queda: seleciona os webhooks de um
+período de recebimento e/ou uma lista de uids, fica só com o evento mais recente de cada
+agendamento e roda o fluxo normal (Notion, lembretes), vários leads em paralelo. Os
+lembretes são gravados em lote no jobstore ao final.
+
+Por padrão só eventos que não terminaram de ser processados e reuniões futuras, e nem o
+lead nem os admins são avisados de novo (use --notify-lead / --notify-admins para enviar).
+
+Uso:
+    python replay_webhooks.py --since 2025-03-10T14:00 --until 2025-03-10T16:30
+    python replay_webhooks.py --uid abc123 --uid def456 --include-processed
+    python replay_webhooks.py --since 2025-03-10 --dry-run
+"""
+from __future__ import annotations
+import argparse
+from datetime import datetime
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.memory import MemoryJobStore
+
+from config import TZ, WEBHOOK_REPLAY_CONCURRENCY
+from database import create_tables
+from services.jobstore import build_jobstore, bulk_upsert_jobs
+from services.webhook_replay_service import replay_events
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reprocessa webhooks do Cal.com gravados pelo serviço.")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Recebidos a partir de (ISO; sem fuso = fuso da aplicação)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Recebidos antes de (ISO)")
+    parser.add_argument("--uid", action="append", default=[], help="uid do agendamento no Cal.com (pode repetir)")
+    parser.add_argument("--tenant", help="Só os webhooks deste tenant")
+    parser.add_argument("--concurrency", type=int, default=WEBHOOK_REPLAY_CONCURRENCY, help="Leads reprocessados em paralelo")
+    parser.add_argument("--notify-lead", action="store_true", help="Reenvia a confirmação por WhatsApp ao lead")
+    parser.add_argument("--notify-admins", action="store_true", help="Reenvia aos admins o aviso de novo agendamento")
+    parser.add_argument("--include-processed", action="store_true", help="Inclui eventos já processados com sucesso")
+    parser.add_argument("--include-past", action="store_true", help="Inclui reuniões que já aconteceram")
+    parser.add_argument("--dry-run", action="store_true", help="Só mostra quantos eventos seriam reprocessados")
+    args = parser.parse_args()
+    if not args.since and not args.uid:
+        parser.error("informe --since e/ou --uid")
+
+    create_tables()
+    store = build_jobstore()
+    # Scheduler só em memória: o fluxo monta os jobs normalmente e gravamos todos de uma vez
+    collector = BackgroundScheduler(jobstores={"default": MemoryJobStore()}, timezone=TZ)
+    collector.start(paused=True)
+    try:
+        summary = replay_events(
+            collector,
+            since=args.since,
+            until=args.until,
+            uids=args.uid,
+            tenant_id=args.tenant,
+            notify_lead=args.notify_lead,
+            notify_admins=args.notify_admins,
+            include_processed=args.include_processed,
+            include_past=args.include_past,
+            concurrency=args.concurrency,
+            dry_run=args.dry_run,
+            on_progress=lambda s: print(f"  … {s['replayed']} reprocessado(s), {len(s['failed'])} falha(s)"),
+        )
+        if not args.dry_run:
+            written = bulk_upsert_jobs(store, collector.get_jobs(), now=datetime.now(tz=TZ))
+            print(f"✓ {written} lembrete(s) gravado(s) no jobstore")
+    finally:
+        collector.shutdown(wait=False)
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# services/admin_digest_service.py
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from apscheduler.jobstores.base import ConflictingIdError
+from apscheduler.schedulers.base import BaseScheduler
+from apscheduler.triggers.date import DateTrigger
+from sqlalchemy import Column, Float, String, Table, select
+from config import TZ, ADMIN_BOOKINGS_SUMMARY_MINUTES
+from database import get_engine, metadata
+from services.tenant_service import add_tenant_job, current_tenant
+from services.whatsapp_service import send_wa_bulk
+from utils import format_pt_br, notion_page_url, wa_me_link
+
+# Reuniões mantidas por esse tempo depois de acontecerem (consultas do resumo diário)
+RETENTION_DAYS = 30
+
+# Reuniões agendadas, para o resumo diário e o resumo de novos agendamentos dos admins
+admin_meetings = Table(
+    "admin_meetings",
+    metadata,
+    Column("page_id", String(64), primary_key=True),
+    # Tenant (escola/unidade) dono da reunião: cada um recebe só os seus resumos
+    Column("tenant", String(64), nullable=False, index=True),
+    Column("name", String(255), nullable=False),
+    Column("whatsapp", String(64)),
+    Column("meeting_at", Float, nullable=False, index=True),
+    Column("booked_at", Float, nullable=False),
+    # Quando o agendamento entrou em um resumo de novos agendamentos (None = ainda não)
+    Column("announced_at", Float, index=True),
+)
+
+
+def record_meeting(
+    page_id: str, name: str, meeting_dt: datetime, whatsapp: str | None, announce: bool = False
+) -> None:
+    """Grava (ou atualiza, em caso de reagendamento) a reunião do lead.
+
+    Com `announce=True` ela entra no próximo resumo de novos agendamentos.
+    """
+    now = time.time()
+    values = dict(
+        name=name,
+        whatsapp=whatsapp,
+        meeting_at=meeting_dt.timestamp(),
+        booked_at=now,
+        announced_at=None if announce else now,
+    )
+    with get_engine().begin() as conn:
+        updated = conn.execute(
+            admin_meetings.update().where(admin_meetings.c.page_id == page_id).values(**values)
+        ).rowcount
+        if not updated:
+            conn.execute(admin_meetings.insert().values(page_id=page_id, tenant=current_tenant().id, **values))
+
+
+def meetings_between(start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    with get_engine().begin() as conn:
+        rows = conn.execute(
+            select(admin_meetings)
+            .where(
+                admin_meetings.c.tenant == current_tenant().id,
+                admin_meetings.c.meeting_at >= start.timestamp(),
+                admin_meetings.c.meeting_at < end.timestamp(),
+            )
+            .order_by(admin_meetings.c.meeting_at)
+        ).mappings().all()
+    return [dict(row) for row in rows]
+
+
+def _meeting_lines(meeting: Dict[str, Any], when: str) -> str:
+    lines = f"• {when} — *{meeting['name']}*\n   📄 {notion_page_url(meeting['page_id'])}"
+    if meeting["whatsapp"]:
+        lines += f"\n   💬 {wa_me_link(meeting['whatsapp'])}"
+    return lines
+
+
+def build_daily_digest(day: datetime) -> str | None:
+    """Agenda consolidada do dia (None se não houver reuniões)."""
+    start = day.replace(hour=0, minute=0, second=0, microsecond=0)
+    meetings = meetings_between(start, start + timedelta(days=1))
+    if not meetings:
+        return None
+    items = [
+        _meeting_lines(m, datetime.fromtimestamp(m["meeting_at"], tz=TZ).strftime("%H:%M"))
+        for m in meetings
+    ]
+    return (
+        f"📅 Agenda de hoje ({start.strftime('%d/%m')}): {len(meetings)} reunião(ões)\n\n"
+        + "\n\n".join(items)
+    )
+
+
+def _purge_old_meetings() -> None:
+    cutoff = time.time() - RETENTION_DAYS * 86400
+    with get_engine().begin() as conn:
+        conn.execute(admin_meetings.delete().where(admin_meetings.c.meeting_at < cutoff))
+
+
+def send_daily_digest() -> None:
+    """Job diário: uma mensagem por admin com todas as reuniões do dia."""
+    message = build_daily_digest(datetime.now(TZ))
+    if message is None:
+        print("📅 Nenhuma reunião hoje; resumo diário não enviado")
+    else:
+        send_wa_bulk(message)
+        print("✓ Resumo diário enviado aos admins")
+    _purge_old_meetings()
+
+
+def send_new_bookings_summary() -> None:
+    """Job: avisa os admins, em uma única mensagem, dos agendamentos ainda não anunciados."""
+    with get_engine().begin() as conn:
+        pending = [
+            dict(row) for row in conn.execute(
+                select(admin_meetings)
+                .where(admin_meetings.c.tenant == current_tenant().id, admin_meetings.c.announced_at.is_(None))
+                .order_by(admin_meetings.c.booked_at)
+            ).mappings()
+        ]
+        if not pending:
+            return
+        conn.execute(
+            admin_meetings.update()
+            .where(admin_meetings.c.page_id.in_([m["page_id"] for m in pending]))
+            .values(announced_at=time.time())
+        )
+
+    items = [_meeting_lines(m, format_pt_br(datetime.fromtimestamp(m["meeting_at"], tz=TZ))) for m in pending]
+    send_wa_bulk(f"🆕 {len(pending)} novo(s) agendamento(s):\n\n" + "\n\n".join(items))
+    print(f"✓ Resumo de {len(pending)} novo(s) agendamento(s) enviado aos admins")
+
+
+def schedule_new_bookings_summary(scheduler: BaseScheduler) -> None:
+    """Agenda o próximo resumo de novos agendamentos, se ainda não houver um pendente.
+
+    O job não é substituído: agendamentos que chegam antes dele disparar entram no mesmo resumo.
+    """
+    run_at = datetime.now(TZ) + timedelta(minutes=ADMIN_BOOKINGS_SUMMARY_MINUTES)
+    try:
+        add_tenant_job(
+            scheduler,
+            send_new_bookings_summary,
+            trigger=DateTrigger(run_date=run_at),
+            id="admin_new_bookings_summary",
+            replace_existing=False,
+        )
+    except ConflictingIdError:
+        pass
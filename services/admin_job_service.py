@@ -0,0 +1,191 @@
+# services/admin_job_service.py
+import asyncio
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from app_scheduler import scheduler
+from config import JOB_EVENTS_INTERVAL_SECONDS, NOTION_DB, NOTION_PHONE_PROP, TZ, WEBHOOK_REPLAY_CONCURRENCY
+from services.notion_service import get_data_source_id, notion_find_lead, notion_find_page
+from services.placement_test_service import placement_test_service
+from services.queue_service import DONE, FAILED, enqueue, get_item, report_progress
+from services.scheduling_service import schedule_lead_messages
+from services.sweep_run_service import RUNNING as RUN_RUNNING, get_live_run, get_run
+from services.webhook_replay_service import replay_events
+
+# Operações longas disparadas pelos endpoints de teste: rodam no consumidor da fila
+PLACEMENT_SWEEP = "admin_placement_sweep"
+NOTION_API_CHECK = "admin_notion_api_check"
+SCHEDULE_LEAD_MESSAGES = "admin_schedule_lead_messages"
+WEBHOOK_REPLAY = "admin_webhook_replay"
+ADMIN_JOB_KINDS = (PLACEMENT_SWEEP, NOTION_API_CHECK, SCHEDULE_LEAD_MESSAGES, WEBHOOK_REPLAY)
+
+# Sem mudanças, um comentário SSE a cada intervalo destes mantém a conexão aberta
+KEEPALIVE_SECONDS = 15
+
+
+async def handle_placement_sweep(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Varredura de testes de nivelamento; o progresso vem do registro da execução."""
+    if not placement_test_service.enabled:
+        return {"success": False, "error": "PlacementTestService desabilitado: FLEXGE_API_KEY não configurada"}
+
+    def link_run(run: Dict[str, Any]) -> None:
+        report_progress({"run_id": run["id"]})
+
+    run_id = await placement_test_service.process_all_students(force=bool(payload.get("force")), on_run=link_run)
+    if run_id is None:
+        # Já havia uma varredura rodando (agendada ou de outro job): acompanha aquela
+        live = await asyncio.to_thread(get_live_run, NOTION_DB)
+        return {"success": True, "run_id": live["id"] if live else None, "attached": True}
+    return {"success": True, "run_id": run_id}
+
+
+def enqueue_placement_sweep() -> None:
+    """Job periódico no modo SCHEDULER_MODE=external: o /tick só enfileira a varredura."""
+    submit_job(PLACEMENT_SWEEP, {"force": False})
+
+
+def handle_notion_api_check(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Testa a compatibilidade com a nova API do Notion 2025-09-03."""
+    try:
+        # Testa descoberta de data_source_id
+        data_source_id = get_data_source_id(NOTION_DB)
+        if not data_source_id:
+            return {
+                "success": False,
+                "error": "Não foi possível descobrir data_source_id",
+                "api_version": "2025-09-03"
+            }
+
+        # Testa busca de página (simulando busca por email)
+        page_id = notion_find_page("test@example.com", "email")
+        return {
+            "success": True,
+            "message": "API do Notion 2025-09-03 funcionando corretamente",
+            "data_source_id": data_source_id,
+            "database_id": NOTION_DB,
+            "api_version": "2025-09-03",
+            "test_search_worked": page_id is not None or True  # True se não encontrou (esperado)
+        }
+    except Exception as e:
+        return {"success": False, "error": str(e), "api_version": "2025-09-03"}
+
+
+def handle_schedule_lead_messages(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Agenda as mensagens de um lead buscando o telefone no Notion."""
+    try:
+        dt = datetime.fromisoformat(payload["meeting_datetime"])
+        page = notion_find_lead(payload["email"], by="email")
+        if not page:
+            return {"success": False, "error": "Lead não encontrado no Notion"}
+
+        phone = page.get("properties", {}).get(NOTION_PHONE_PROP, {}).get("phone_number")
+
+        if not phone:
+            return {"success": False, "error": "Telefone não encontrado para o lead no Notion"}
+
+        schedule_lead_messages(scheduler, payload["first_name"], phone, dt)
+        return {"success": True, "scheduled_for": payload["meeting_datetime"], "phone": phone}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+def handle_webhook_replay(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Reprocessa webhooks gravados (período e/ou uids); o progresso fica no resultado do job."""
+    since, until = payload.get("since"), payload.get("until")
+    return replay_events(
+        scheduler,
+        since=datetime.fromisoformat(since) if since else None,
+        until=datetime.fromisoformat(until) if until else None,
+        uids=payload.get("uids"),
+        tenant_id=payload.get("tenant"),
+        notify_lead=bool(payload.get("notify_lead")),
+        notify_admins=bool(payload.get("notify_admins")),
+        include_processed=bool(payload.get("include_processed")),
+        include_past=bool(payload.get("include_past")),
+        concurrency=payload.get("concurrency") or WEBHOOK_REPLAY_CONCURRENCY,
+        dry_run=bool(payload.get("dry_run")),
+        on_progress=lambda summary: report_progress({"progress": summary}),
+    )
+
+
+def submit_job(kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Enfileira a operação e retorna o id para acompanhar o progresso."""
+    job_id = enqueue(kind, payload)
+    print(f"🧾 Job {job_id} ({kind}) enfileirado")
+    return {
+        "success": True,
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+    }
+
+
+def _iso(ts: float | None) -> str | None:
+    return datetime.fromtimestamp(ts, tz=TZ).isoformat() if ts else None
+
+
+def job_snapshot(job_id: int) -> Optional[Dict[str, Any]]:
+    """Estado do job na fila e, para varreduras, os contadores da execução vinculada."""
+    item = get_item(job_id)
+    if item is None or item["kind"] not in ADMIN_JOB_KINDS:
+        return None
+
+    result = item["result"] if isinstance(item["result"], dict) else {}
+    snapshot: Dict[str, Any] = {
+        "job_id": item["id"],
+        "kind": item["kind"],
+        "status": item["status"],
+        "attempts": item["attempts"],
+        "created_at": _iso(item["created_at"]),
+        "updated_at": _iso(item["updated_at"]),
+        "last_error": item["last_error"],
+        "result": item["result"] if item["status"] == DONE else None,
+    }
+
+    run = get_run(result["run_id"], limit=0) if result.get("run_id") else None
+    if run is not None:
+        run.pop("items", None)
+        snapshot["run"] = run
+        snapshot["progress"] = {
+            "processed": run["processed"],
+            "updated": run["tests_done"],
+            "failed": run["errors"],
+            "items_per_second": run["items_per_second"],
+        }
+
+    elif item["status"] not in (DONE, FAILED) and "progress" in result:
+        # Jobs sem execução vinculada (ex.: replay de webhooks) reportam o progresso no resultado
+        snapshot["progress"] = result["progress"]
+
+    job_over = item["status"] in (DONE, FAILED)
+    snapshot["finished"] = job_over and (run is None or run["status"] != RUN_RUNNING)
+    return snapshot
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def job_events(job_id: int, is_disconnected: Callable[[], Awaitable[bool]]) -> AsyncIterator[str]:
+    """Server-Sent Events com o progresso do job até ele (e a execução vinculada) terminar."""
+    last: str | None = None
+    idle = 0.0
+    while not await is_disconnected():
+        snapshot = await asyncio.to_thread(job_snapshot, job_id)
+        if snapshot is None:
+            yield _sse("error", {"detail": "Job not found"})
+            return
+        if snapshot["finished"]:
+            yield _sse("done", snapshot)
+            return
+
+        current = json.dumps(snapshot, default=str)
+        if current != last:
+            last, idle = current, 0.0
+            yield _sse("progress", snapshot)
+        elif idle >= KEEPALIVE_SECONDS:
+            idle = 0.0
+            yield ": keep-alive\n\n"
+
+        await asyncio.sleep(JOB_EVENTS_INTERVAL_SECONDS)
+        idle += JOB_EVENTS_INTERVAL_SECONDS
@@ -0,0 +1,111 @@
+# services/admission_service.py
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+from config import (
+    WEBHOOK_MAX_IN_FLIGHT, WEBHOOK_MAX_QUEUED, WEBHOOK_QUEUE_TIMEOUT_SECONDS, WEBHOOK_RETRY_AFTER_SECONDS,
+)
+
+
+class OverloadedError(Exception):
+    """Levantada quando não há vaga nem lugar na fila de espera: o cliente deve tentar mais tarde."""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"'{name}' saturado; tente novamente em {retry_after:.0f}s")
+
+
+class AdmissionController:
+    """
+    Controle de admissão de um caminho de ingestão (ex.: webhooks do Cal.com).
+
+    - Até `max_in_flight` execuções simultâneas; as demais esperam em uma fila
+      limitada a `max_queued`, por no máximo `queue_timeout` segundos.
+    - Fila cheia (ou espera estourada): OverloadedError, para o chamador responder
+      503 com Retry-After e deixar o reenvio do cliente absorver o excesso.
+
+    Assim a vazão fica no máximo sustentável dos upstreams em vez de todas as
+    requisições disputarem o rate limit ao mesmo tempo. Vale por processo (event loop).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT,
+        max_queued: int = WEBHOOK_MAX_QUEUED,
+        queue_timeout: float = WEBHOOK_QUEUE_TIMEOUT_SECONDS,
+        retry_after: float = WEBHOOK_RETRY_AFTER_SECONDS,
+    ):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._in_flight = 0
+        self._queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_in_flight > 0
+
+    def _reject(self) -> OverloadedError:
+        self.rejected += 1
+        print(
+            f"🚦 {self.name} saturado ({self._in_flight} em execução, {self._queued} na fila): "
+            f"recusando com Retry-After {self.retry_after:.0f}s"
+        )
+        return OverloadedError(self.name, self.retry_after)
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """Ocupa uma vaga durante o bloco, esperando na fila se preciso."""
+        if not self.enabled:
+            yield
+            return
+
+        if self._slots.locked():
+            if self._queued >= self.max_queued:
+                raise self._reject()
+            self._queued += 1
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise self._reject()
+            finally:
+                self._queued -= 1
+            print(f"🚦 {self.name}: admitido após {time.monotonic() - started:.1f}s na fila")
+        else:
+            await self._slots.acquire()
+
+        self._in_flight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado para o health check."""
+        return {
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queued": self.max_queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+# Processamento inline dos webhooks do Cal.com (APP_ROLE=all); com APP_ROLE=web a
+# fila durável já faz esse papel e o worker consome no ritmo do QUEUE_BATCH_SIZE
+webhook_admission = AdmissionController("webhook do Cal.com")
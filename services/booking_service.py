@@ -0,0 +1,201 @@
+# services/booking_service.py
+from datetime import datetime
+from typing import Any, Dict
+from apscheduler.schedulers.base import BaseScheduler
+from config import TZ, NOTION_STATUS_VALUE, ADMIN_DIGEST_ENABLED, ADMIN_BOOKINGS_SUMMARY_MINUTES, NOTION_OUTBOX_ENABLED
+from models import Attendee, CalWebhookPayload
+from services.notion_service import (
+    notion_find_lead,
+    notion_update_meeting_date,
+    notion_update_status,
+    notion_update_email,
+    notion_create_page,
+)
+from services.notion_client import NotionUnavailableError
+from services.notion_outbox_service import is_provisional, record_provisional_lead
+from services.queue_service import completed_step, record_step
+from services.tenant_service import current_tenant
+from services.whatsapp_service import send_immediate_booking_notifications
+from services.scheduling_service import schedule_messages, schedule_lead_messages, schedule_placement_refresh
+from services.admin_digest_service import record_meeting, schedule_new_bookings_summary
+from utils import format_pt_br
+
+# Eventos do Cal.com que geram/atualizam um agendamento
+BOOKING_EVENTS = {"BOOKING_CREATED", "BOOKING_RESCHEDULED", "BOOKING_REQUESTED"}
+
+
+def extract_whatsapp(data: CalWebhookPayload) -> str | None:
+    """Extrai o WhatsApp informado no formulário do Cal.com, se houver."""
+    ufr = data.payload.userFieldsResponses
+    if ufr and ufr.WhatsApp and 'value' in ufr.WhatsApp:
+        return ufr.WhatsApp['value']
+    return None
+
+
+def lead_key(data: CalWebhookPayload) -> str:
+    """Agrupa agendamentos do mesmo lead, para não criar a mesma página duas vezes em paralelo."""
+    whatsapp = extract_whatsapp(data)
+    if whatsapp:
+        return "phone:" + ''.join(filter(str.isdigit, whatsapp))
+    return "email:" + (data.payload.attendees[0].email or "").strip().lower()
+
+
+def booking_start(data: CalWebhookPayload) -> datetime:
+    """Horário da reunião já convertido para o fuso da aplicação."""
+    return datetime.fromisoformat(data.payload.start_time.replace("Z", "+00:00")).astimezone(TZ)
+
+
+def resolve_lead_page(
+    attendee: Attendee,
+    whatsapp: str | None,
+    formatted_pt: str,
+    update_existing: bool = True,
+    provisional: bool = NOTION_OUTBOX_ENABLED,
+) -> str | None:
+    """Encontra o lead (por telefone, depois e-mail) e atualiza, ou cria uma nova página.
+
+    Com `update_existing=False` uma página já existente não é alterada (usado ao importar
+    reuniões passadas, para não voltar o status de leads que já avançaram).
+    Com o Notion fora do ar e `provisional=True`, retorna um id provisório ("local-...")
+    e a busca/criação fica no outbox; sem ele, levanta NotionUnavailableError.
+    """
+    lead = {
+        "name": attendee.name,
+        "email": attendee.email,
+        "phone": whatsapp,
+        "meeting_date": formatted_pt,
+        "status": NOTION_STATUS_VALUE,
+        "update_existing": update_existing,
+    }
+    try:
+        return find_or_create_lead_page(lead)
+    except NotionUnavailableError as e:
+        if not provisional:
+            raise
+        print(f"⚠️ Notion indisponível ({e}); seguindo com lead provisório")
+        return record_provisional_lead(lead)
+
+
+def _edited_since(page: Dict[str, Any], enqueued_at: float) -> bool:
+    """A página foi editada depois de `enqueued_at`?
+
+    O Notion arredonda last_edited_time para o minuto: uma edição no mesmo minuto conta
+    como posterior, para não arriscar sobrescrever dados mais novos.
+    """
+    edited = page.get("last_edited_time")
+    if not edited:
+        return False
+    edited_at = datetime.fromisoformat(edited.replace("Z", "+00:00")).timestamp()
+    return edited_at >= enqueued_at - enqueued_at % 60
+
+
+def find_or_create_lead_page(lead: Dict[str, Any]) -> str | None:
+    """Busca/atualização/criação do lead no Notion (também usada pelo outbox ao reprocessar).
+
+    Vindo do outbox (`enqueued_at` no lead), uma página editada depois do enfileiramento
+    não é alterada: a data/status dela são mais recentes que os do agendamento guardado.
+    Levanta NotionUnavailableError se a busca ou a criação não puderem ser concluídas.
+    """
+    page = None
+    if lead["phone"]:
+        page = notion_find_lead(lead["phone"], by="phone")
+    if not page and lead["email"]:
+        page = notion_find_lead(lead["email"], by="email")
+
+    if page:
+        page_id = page["id"]
+        print(f"Página do Notion encontrada: {page_id}")
+        if not lead["update_existing"]:
+            return page_id
+        if lead.get("enqueued_at") and _edited_since(page, lead["enqueued_at"]):
+            print(f"⏭️ Página {page_id} editada depois do lead provisório; mantendo os dados atuais")
+            return page_id
+        notion_update_meeting_date(page_id, lead["meeting_date"])
+        notion_update_status(page_id, lead["status"])
+        if lead["email"]:
+            notion_update_email(page_id, lead["email"])
+        return page_id
+
+    print("Lead não encontrado. Criando novo registro no Notion...")
+    return notion_create_page(
+        name=lead["name"],
+        email=lead["email"],
+        phone=lead["phone"],
+        meeting_date=lead["meeting_date"],
+        status=lead["status"]
+    )
+
+
+def process_booking(
+    scheduler: BaseScheduler, data: CalWebhookPayload, notify_lead: bool = True, notify_admins: bool = True
+) -> dict:
+    """Fluxo completo de um agendamento: Notion, confirmação ao lead, Zaia e lembretes.
+
+    Com `notify_lead=False` (reprocessamento) a confirmação imediata ao lead e o contexto
+    da Zaia não são enviados; com `notify_admins=False`, nem o aviso "Nova Reunião
+    Agendada" aos admins (nem a entrada no resumo de novos agendamentos).
+    Notion e lembretes (ids fixos por horário) são idempotentes.
+    Pela fila, cada etapa com efeito externo fica registrada no item: uma nova tentativa
+    depois de uma falha não reenvia a confirmação ao lead nem o aviso aos admins.
+    """
+    attendee = data.payload.attendees[0]
+    start_dt = booking_start(data)
+    formatted_pt = format_pt_br(start_dt)
+
+    print(f"\nDetalhes do agendamento: Nome: {attendee.name}, Email: {attendee.email}, Data: {formatted_pt}")
+
+    # 1. Extrair WhatsApp do payload
+    whatsapp = extract_whatsapp(data)
+    if whatsapp:
+        print(f"WhatsApp extraído do payload: {whatsapp}")
+
+    # 2. Encontrar ou criar página no Notion
+    page_id = completed_step("notion_page")
+    if not page_id:
+        page_id = resolve_lead_page(attendee, whatsapp, formatted_pt)
+        if page_id:
+            record_step("notion_page", page_id)
+
+    # Enviar notificações e agendar mensagens
+    if not page_id:
+        print("✗ Não foi possível encontrar ou criar uma página no Notion. O fluxo de notificação para o lead pode não funcionar.")
+
+    # Resumo de novos agendamentos: o aviso aos admins sai agrupado, não um por agendamento
+    summarize = notify_admins and bool(page_id and whatsapp) and ADMIN_BOOKINGS_SUMMARY_MINUTES > 0
+    if page_id and (ADMIN_DIGEST_ENABLED or summarize) and not completed_step("meeting_recorded"):
+        record_meeting(page_id, attendee.name, start_dt, whatsapp, announce=summarize)
+        record_step("meeting_recorded")
+
+    if whatsapp:
+        # Lead e admins em envios separados: se o aviso aos admins falhar, a nova
+        # tentativa não manda a confirmação ao lead outra vez
+        if notify_lead and not completed_step("lead_notified"):
+            send_immediate_booking_notifications(attendee.name, whatsapp, start_dt, notify_admins=False)
+            record_step("lead_notified")
+        if notify_admins and not summarize and not completed_step("admins_notified"):
+            send_immediate_booking_notifications(attendee.name, whatsapp, start_dt, notify_lead=False)
+            record_step("admins_notified")
+        if summarize:
+            schedule_new_bookings_summary(scheduler)
+        schedule_lead_messages(scheduler, attendee.name, whatsapp, start_dt)
+        # A confirmação leva o link do teste: verifica o lead em alguns minutos
+        # Lead provisório ainda não existe no Notion: a verificação procura pelo e-mail
+        schedule_placement_refresh(scheduler, attendee.email, None if is_provisional(page_id) else page_id)
+        print("✓ Notificações para o lead enviadas e agendadas.")
+
+        # ✅ NOVO: Envia contexto para a Zaia sobre o agendamento
+        if notify_lead and not completed_step("zaia_context"):
+            try:
+                context_message = f"Reunião agendada para {attendee.name} em {formatted_pt}"
+                current_tenant().zaia.send_meeting_confirmation(whatsapp, context_message)
+                print("✓ Contexto enviado para a Zaia com sucesso.")
+                record_step("zaia_context")
+            except Exception as e:
+                print(f"⚠️ Erro ao enviar contexto para Zaia: {e}")
+
+    # Notificações para admins, somente se tivermos uma página no Notion
+    if page_id:
+        schedule_messages(scheduler, attendee.name, start_dt, page_id, whatsapp)
+        print("✓ Lembretes para admins agendados.")
+
+    return {"success": True}
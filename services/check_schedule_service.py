@@ -0,0 +1,75 @@
+# services/check_schedule_service.py
+import time
+from typing import Any, Dict, Iterable
+from sqlalchemy import Column, Float, Integer, String, Table, select
+from config import (
+    PLACEMENT_RECENT_DAYS, PLACEMENT_RECENT_INTERVAL_MINUTES,
+    PLACEMENT_BACKOFF_BASE_HOURS, PLACEMENT_BACKOFF_MAX_HOURS,
+)
+from database import get_engine, metadata
+
+PENDING = "pending"
+COMPLETED = "completed"
+
+# Agenda de verificação por lead: quando o teste de nivelamento deve ser consultado de novo
+placement_checks = Table(
+    "placement_checks",
+    metadata,
+    Column("page_id", String(64), primary_key=True),
+    Column("email", String(320)),
+    Column("state", String(16), nullable=False),
+    Column("last_checked_at", Float),
+    Column("next_check_at", Float, index=True),
+    # Verificações sem teste desde que o lead deixou de ser recente (expoente do back-off)
+    Column("misses", Integer, nullable=False, default=0),
+)
+
+
+def load_schedule(page_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Agenda dos leads informados (uma consulta por lote da varredura)."""
+    page_ids = list(page_ids)
+    if not page_ids:
+        return {}
+    with get_engine().begin() as conn:
+        rows = conn.execute(select(placement_checks).where(placement_checks.c.page_id.in_(page_ids))).mappings()
+        return {row["page_id"]: dict(row) for row in rows}
+
+
+def is_due(entry: Dict[str, Any] | None, now: float | None = None) -> bool:
+    """Lead nunca verificado, ou cuja próxima verificação já venceu."""
+    if entry is None or entry["state"] == COMPLETED:
+        # COMPLETED só chega aqui se o Notion deixou de marcar o teste (ex.: edição manual)
+        return True
+    now = now or time.time()
+    return entry["next_check_at"] is None or entry["next_check_at"] <= now
+
+
+def next_check_delay(last_activity: float | None, misses: int, now: float) -> float:
+    """Segundos até a próxima verificação de um lead ainda sem teste."""
+    if last_activity and now - last_activity < PLACEMENT_RECENT_DAYS * 86400:
+        return PLACEMENT_RECENT_INTERVAL_MINUTES * 60
+    hours = min(PLACEMENT_BACKOFF_BASE_HOURS * 2 ** max(misses - 1, 0), PLACEMENT_BACKOFF_MAX_HOURS)
+    return hours * 3600
+
+
+def record_check(
+    page_id: str, email: str | None, test_found: bool, last_activity: float | None,
+    previous: Dict[str, Any] | None = None,
+) -> float | None:
+    """Grava o resultado da verificação e retorna o próximo horário (None = não verificar mais)."""
+    now = time.time()
+    recent = bool(last_activity and now - last_activity < PLACEMENT_RECENT_DAYS * 86400)
+    if test_found:
+        state, misses, next_check_at = COMPLETED, 0, None
+    else:
+        misses = 0 if recent else (previous["misses"] if previous else 0) + 1
+        state, next_check_at = PENDING, now + next_check_delay(last_activity, misses, now)
+
+    values = dict(email=email, state=state, last_checked_at=now, next_check_at=next_check_at, misses=misses)
+    with get_engine().begin() as conn:
+        updated = conn.execute(
+            placement_checks.update().where(placement_checks.c.page_id == page_id).values(**values)
+        ).rowcount
+        if not updated:
+            conn.execute(placement_checks.insert().values(page_id=page_id, **values))
+    return next_check_at
@@ -0,0 +1,161 @@
+# services/context_marker_service.py
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+import httpx
+from config import (
+    CONTEXT_MARKER_MODE, CONTEXT_MARKER_URL, CONTEXT_MARKER_BATCH_URL, CONTEXT_MARKER_FLUSH_SECONDS,
+    CONTEXT_MARKER_BATCH_SIZE, CONTEXT_MARKER_MAX_PENDING, CONTEXT_MARKER_TIMEOUT_SECONDS,
+)
+from services.resilience import CircuitOpenError, guarded_request
+
+Marker = Dict[str, str]
+
+# Espera máxima da thread antes de conferir se foi pedido o encerramento
+STOP_CHECK_SECONDS = 0.5
+
+
+def _normalize_phone(phone: str) -> str:
+    clean_phone = ''.join(filter(str.isdigit, str(phone)))
+    if not clean_phone.startswith('55'):
+        clean_phone = '55' + clean_phone
+    return clean_phone
+
+
+class ContextMarkerSink:
+    """
+    Destino das marcações "mensagem enviada pelo sistema" usadas pelo agente da Zaia.
+
+    - `http`: as marcações entram numa fila em memória e uma thread as envia em lotes
+      a cada `flush_seconds` (ou ao juntar `batch_size`), fora do caminho do webhook.
+    - `disabled`: descarta.
+
+    A marcação é best-effort: se o destino estiver fora do ar, o lote é descartado.
+    """
+
+    def __init__(
+        self,
+        mode: str = CONTEXT_MARKER_MODE,
+        url: str = CONTEXT_MARKER_URL,
+        batch_url: str | None = CONTEXT_MARKER_BATCH_URL,
+        flush_seconds: float = CONTEXT_MARKER_FLUSH_SECONDS,
+        batch_size: int = CONTEXT_MARKER_BATCH_SIZE,
+        max_pending: int = CONTEXT_MARKER_MAX_PENDING,
+        timeout: float = CONTEXT_MARKER_TIMEOUT_SECONDS,
+        breaker_name: str = "context_marker",
+    ):
+        if mode not in ("http", "disabled"):
+            print(f"⚠️ CONTEXT_MARKER_MODE '{mode}' não suportado; marcações desabilitadas")
+            mode = "disabled"
+        self.mode = mode
+        self.url = url
+        self.batch_url = batch_url
+        self.flush_seconds = flush_seconds
+        self.batch_size = max(batch_size, 1)
+        self.timeout = timeout
+        self.breaker_name = breaker_name
+        self._pending: "queue.Queue[Marker]" = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.dropped = 0
+
+    def mark(self, phone: str, message_type: str) -> bool:
+        """Registra a marcação sem bloquear; retorna False se ela foi descartada."""
+        marker = {"type": "system_message_sent", "phone": _normalize_phone(phone), "message_type": message_type}
+
+        if self.mode == "disabled":
+            return False
+
+        self._ensure_thread()
+        try:
+            self._pending.put_nowait(marker)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f"⚠️ Fila de marcações cheia; contexto de {marker['phone']} descartado")
+            return False
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="context-marker-sink", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self) -> List[Marker]:
+        """Espera a primeira marcação e junta as que chegarem até o fim do intervalo."""
+        try:
+            batch = [self._pending.get(timeout=min(self.flush_seconds, STOP_CHECK_SECONDS))]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=min(remaining, STOP_CHECK_SECONDS)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _drain(self) -> List[Marker]:
+        batch: List[Marker] = []
+        while True:
+            try:
+                batch.append(self._pending.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _run(self) -> None:
+        with httpx.Client() as client:
+            while not self._stop.is_set():
+                batch = self._next_batch()
+                if batch:
+                    self._send(client, batch)
+            # Encerramento: envia o que sobrou
+            rest = self._drain()
+            for start in range(0, len(rest), self.batch_size):
+                self._send(client, rest[start:start + self.batch_size])
+
+    def _send(self, client: httpx.Client, batch: List[Marker]) -> None:
+        # Marcações repetidas (mesmo telefone e tipo) no mesmo lote viram uma só
+        unique = list({(m["phone"], m["message_type"]): m for m in batch}.values())
+        try:
+            if self.batch_url:
+                body = {"type": "system_message_batch", "messages": unique}
+                sent = len(unique) if self._post(client, self.batch_url, body) else 0
+            else:
+                sent = sum(self._post(client, self.url, marker) for marker in unique)
+        except CircuitOpenError as e:
+            self.dropped += len(unique)
+            print(f"⚠️ Marcações descartadas: {e}")
+            return
+        except Exception as e:
+            self.dropped += len(unique)
+            print(f"⚠️ Erro de conexão ao marcar contexto: {e}")
+            return
+        self.dropped += len(unique) - sent
+        if sent:
+            print(f"✅ Contexto marcado para {sent} mensagem(ns) do sistema")
+
+    def _post(self, client: httpx.Client, url: str, body: Dict) -> bool:
+        """Envia ao receptor; False (marcação descartada) se ele não responder 200."""
+        response = guarded_request(self.breaker_name, "POST", url, self.timeout, client=client, json=body)
+        if response.status_code != 200:
+            print(f"⚠️ Erro ao marcar contexto: {response.status_code} - {response.text}")
+            return False
+        return True
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Envia as marcações pendentes e encerra a thread (chamado no shutdown)."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+# Instância do tenant padrão (os demais tenants têm a própria, com o destino deles)
+context_marker_sink = ContextMarkerSink()
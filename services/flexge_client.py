@@ -0,0 +1,254 @@
+# services/flexge_client.py
+import asyncio
+import math
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import httpx
+from config import (
+    FLEXGE_API_KEY, FLEXGE_BASE_URL, FLEXGE_TIMEOUT_SECONDS,
+    FLEXGE_PAGE_WINDOW, FLEXGE_RATE_PER_SECOND, FLEXGE_MAX_PAGES, FLEXGE_INDEX_TTL_SECONDS,
+)
+from services.pagination import prefetch_pages
+from services.resilience import RateLimiter, guarded_request_async, parse_retry_after
+
+MAX_RETRIES = 3
+
+
+def normalize_email(e: str | None) -> str:
+    s = (e or "").strip().lower()
+    # Normalização simples para gmail: remove sufixo +tag e pontos na parte local
+    if "@gmail.com" in s:
+        local, _, domain = s.partition("@")
+        local = local.split("+")[0].replace(".", "")
+        return f"{local}@{domain}"
+    return s
+
+
+def is_completed_placement(t: Dict[str, Any]) -> bool:
+    """Filtros de consistência: teste de placement concluído e não apagado."""
+    if t.get("deleted") is True:
+        return False
+    # Alguns payloads não possuem `type`; se houver, validar PLACEMENT
+    t_type = (t.get("type") or "").upper()
+    if t_type and t_type != "PLACEMENT":
+        return False
+    student = t.get("student", {})
+    if student.get("deleted") is True:
+        return False
+    if not t.get("completedAt"):
+        return False
+    return True
+
+
+def _created_at(t: Dict[str, Any]) -> float | None:
+    try:
+        return datetime.fromisoformat(t["createdAt"].replace("Z", "+00:00")).timestamp()
+    except (KeyError, AttributeError, ValueError):
+        return None
+
+
+def _extract_tests(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Suporta formatos { data: [...] } e { docs: [...], total: N }
+    tests = data.get("data")
+    if tests is None:
+        tests = data.get("docs")
+    return tests or []
+
+
+def _next_cursor(data: Dict[str, Any]) -> str | None:
+    return data.get("next_cursor") or data.get("nextCursor")
+
+
+def _total_pages(data: Dict[str, Any], page_size: int) -> int | None:
+    """Número de páginas, se a resposta informar (`totalPages`/`pages` ou `total`)."""
+    for key in ("totalPages", "pages"):
+        if isinstance(data.get(key), int):
+            return data[key]
+    if isinstance(data.get("total"), int) and page_size:
+        return math.ceil(data["total"] / page_size)
+    return None
+
+
+class FlexgeClient:
+    """
+    Listagem de testes de nivelamento do Flexge (mais recentes primeiro).
+
+    Quando a API pagina por número (`page=N`), as páginas seguintes são buscadas em
+    janelas de `window` requisições paralelas, sob um limite de req/s; se a resposta só
+    traz `next_cursor`, a paginação é sequencial pelo cursor.
+    """
+
+    def __init__(
+        self,
+        api_key: str | None = FLEXGE_API_KEY,
+        base_url: str = FLEXGE_BASE_URL,
+        window: int = FLEXGE_PAGE_WINDOW,
+        rate: float = FLEXGE_RATE_PER_SECOND,
+        max_pages: int = FLEXGE_MAX_PAGES,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.window = max(window, 1)
+        self.max_pages = max_pages
+        # Mesmo token bucket + janela AIMD usados para o Notion
+        self.limiter = RateLimiter(rate=rate, burst=self.window, max_concurrency=self.window)
+        # (timestamp da leitura, índice) da última leitura completa
+        self._index: Tuple[float, Dict[str, Dict[str, Any]]] | None = None
+        self._index_lock = asyncio.Lock()
+
+    async def _get(self, client: httpx.AsyncClient, page: int, cursor: str | None = None) -> Dict[str, Any]:
+        params = f"page={page}&sort=createdAt&order=desc"
+        if cursor:
+            params += f"&cursor={cursor}"
+        headers = {"accept": "application/json", "x-api-key": self.api_key}
+        attempt = 0
+        while True:
+            wait = self.limiter.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self.limiter.enter_async()
+            try:
+                response = await guarded_request_async(
+                    client, "flexge", "GET", f"{self.base_url}?{params}", FLEXGE_TIMEOUT_SECONDS, headers=headers
+                )
+            finally:
+                self.limiter.leave()
+            if response.status_code == 429 and attempt < MAX_RETRIES:
+                attempt += 1
+                self.limiter.on_throttled(parse_retry_after(response.headers.get("Retry-After")))
+                continue
+            response.raise_for_status()
+            self.limiter.on_success()
+            return response.json()
+
+    def iter_pages(self, client: httpx.AsyncClient) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Gera as páginas em ordem; termina na primeira página vazia ou em `max_pages`."""
+        first: Dict[str, Any] = {}
+
+        async def fetch(state: Tuple[str, int, Optional[str]]):
+            mode, page, cursor = state
+            if mode == "first":
+                data = await self._get(client, 1)
+                first.update(data)
+                tests = _extract_tests(data)
+                if not tests or self.max_pages <= 1:
+                    return [tests], None
+                total = _total_pages(data, len(tests))
+                if total is not None and total <= 1:
+                    return [tests], None
+                cursor = _next_cursor(data)
+                if cursor and total is None:
+                    # Só cursor: não dá para pedir páginas fora de ordem
+                    return [tests], ("cursor", 2, cursor)
+                return [tests], ("window", 2, None)
+
+            if mode == "cursor":
+                data = await self._get(client, page, cursor)
+                tests = _extract_tests(data)
+                cursor = _next_cursor(data)
+                done = not tests or not cursor or page >= self.max_pages
+                return [tests], None if done else ("cursor", page + 1, cursor)
+
+            # Janela de páginas numeradas em paralelo
+            total = _total_pages(first, len(_extract_tests(first)))
+            last = min(total or self.max_pages, self.max_pages)
+            numbers = range(page, min(page + self.window, last + 1))
+            results = await asyncio.gather(*(self._get(client, n) for n in numbers))
+            pages: List[List[Dict[str, Any]]] = []
+            for data in results:
+                tests = _extract_tests(data)
+                if not tests:
+                    return pages, None
+                pages.append(tests)
+            next_page = numbers[-1] + 1
+            return pages, ("window", next_page, None) if next_page <= last else None
+
+        async def flatten() -> AsyncIterator[List[Dict[str, Any]]]:
+            windows = prefetch_pages(fetch, ("first", 1, None))
+            try:
+                async for pages in windows:
+                    for tests in pages:
+                        yield tests
+            finally:
+                await windows.aclose()
+
+        return flatten()
+
+    async def find_test(
+        self, client: httpx.AsyncClient, email: str, created_after: float | None = None
+    ) -> Optional[Dict[str, Any]]:
+        """Teste concluído mais recente do email (placement-only tem preferência na mesma página).
+
+        Com `created_after` a leitura para na primeira página só com testes mais antigos.
+        """
+        target = normalize_email(email)
+        pages = self.iter_pages(client)
+        try:
+            async for number, tests in _enumerate_pages(pages):
+                fallback = None
+                for test in tests:
+                    if not is_completed_placement(test):
+                        continue
+                    student = test.get("student", {})
+                    if normalize_email(student.get("email")) != target:
+                        continue
+                    if student.get("isPlacementTestOnly") is True:
+                        print(f"✅ Teste placement-only CONCLUÍDO encontrado para {email} na página {number}")
+                        return test
+                    fallback = fallback or test
+                if fallback:
+                    print(f"✅ Fallback: teste CONCLUÍDO encontrado para {email} na página {number}")
+                    return fallback
+                oldest = _created_at(tests[-1])
+                if created_after is not None and oldest is not None and oldest < created_after:
+                    break
+        finally:
+            await pages.aclose()
+        return None
+
+    async def build_email_index(self, client: httpx.AsyncClient) -> Dict[str, Dict[str, Any]]:
+        """Lê a listagem inteira uma vez e devolve email normalizado → teste (mesma regra de `find_test`)."""
+        index: Dict[str, Tuple[int, Dict[str, Any], bool]] = {}
+        pages = 0
+        started = time.time()
+        async for number, tests in _enumerate_pages(self.iter_pages(client)):
+            pages = number
+            for test in tests:
+                if not is_completed_placement(test):
+                    continue
+                student = test.get("student", {})
+                email = normalize_email(student.get("email"))
+                if not email:
+                    continue
+                placement_only = student.get("isPlacementTestOnly") is True
+                current = index.get(email)
+                # Vale a primeira página com teste do email; nela, placement-only tem preferência
+                if current is None or (current[0] == number and placement_only and not current[2]):
+                    index[email] = (number, test, placement_only)
+        print(f"📇 Índice do Flexge: {len(index)} email(s) em {pages} página(s)")
+        result = {email: entry[1] for email, entry in index.items()}
+        self._index = (started, result)
+        return result
+
+    async def get_index(
+        self, client: httpx.AsyncClient, max_age: float = FLEXGE_INDEX_TTL_SECONDS
+    ) -> Tuple[float, Dict[str, Dict[str, Any]]]:
+        """(início da leitura, índice), reaproveitando o último índice se tiver menos de `max_age`s."""
+        async with self._index_lock:
+            if self._index is None or time.time() - self._index[0] > max_age:
+                await self.build_email_index(client)
+            return self._index
+
+
+async def _enumerate_pages(pages: AsyncIterator[List[Dict[str, Any]]]):
+    number = 0
+    async for tests in pages:
+        if not tests:
+            break
+        number += 1
+        yield number, tests
+
+
+# Instância compartilhada (o limite de req/s vale para o processo inteiro)
+flexge_client = FlexgeClient()
@@ -0,0 +1,468 @@
+# services/jobstore.py
+import os
+import pickle
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+from sqlalchemy import Column, Float, Integer, LargeBinary, String, Table, Unicode, and_, exists, func, select
+from config import (
+    APP_ROLE, JOB_LEASE_SECONDS, JOBSTORE_MODE, JOBSTORE_FLUSH_SECONDS, JOBSTORE_SNAPSHOT_SECONDS,
+    JOBSTORE_SNAPSHOT_WAL_ROWS, SCHEDULER_MODE,
+)
+from database import get_engine
+from services.queue_service import enqueue
+
+# Operações gravadas no WAL do HybridJobStore
+WAL_UPSERT = "upsert"
+WAL_REMOVE = "remove"
+WAL_CLEAR = "clear"
+# Item da fila durável que avisa o processo do scheduler de jobs gravados por outro processo
+JOBSTORE_RELOAD = "jobstore_reload"
+
+
+class LeasedSQLAlchemyJobStore(SQLAlchemyJobStore):
+    """
+    SQLAlchemyJobStore seguro para várias instâncias apontando para o mesmo banco.
+
+    Ao buscar os jobs vencidos, cada instância "arrenda" a execução (job_id + horário)
+    por `lease_seconds` na tabela `<tablename>_leases`. Outra instância que enxergar o
+    mesmo job antes do próximo horário ser gravado o ignora, então cada execução roda
+    em exatamente uma instância.
+
+    No Postgres as linhas são travadas com `SELECT ... FOR UPDATE SKIP LOCKED`; no
+    SQLite a transação começa com uma escrita, o que serializa as instâncias.
+    """
+
+    def __init__(self, *args, lease_seconds: float = JOB_LEASE_SECONDS, owner: str | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lease_seconds = lease_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leases_t = Table(
+            f"{self.jobs_t.name}_leases",
+            self.jobs_t.metadata,
+            Column("job_id", Unicode(191), primary_key=True),
+            Column("run_time", Float(25), nullable=False),
+            Column("owner", Unicode(191), nullable=False),
+            Column("expires_at", Float(25), nullable=False, index=True),
+            schema=self.jobs_t.schema,
+        )
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        self.leases_t.create(self.engine, checkfirst=True)
+
+    def get_due_jobs(self, now):
+        timestamp = datetime_to_utc_timestamp(now)
+        wall_now = time.time()
+        jobs: List[Job] = []
+        failed_job_ids = set()
+
+        with self.engine.begin() as conn:
+            # Primeiro uma escrita: limpa leases vencidos e, no SQLite, já pega o lock de escrita
+            conn.execute(self.leases_t.delete().where(self.leases_t.c.expires_at < wall_now))
+
+            due = (
+                select(self.jobs_t.c.id, self.jobs_t.c.next_run_time, self.jobs_t.c.job_state)
+                .where(self.jobs_t.c.next_run_time <= timestamp)
+                .order_by(self.jobs_t.c.next_run_time)
+            )
+            if self.engine.dialect.name == "postgresql":
+                due = due.with_for_update(skip_locked=True)
+            rows = conn.execute(due).all()
+            if not rows:
+                return []
+
+            leased = {
+                lease.job_id: lease
+                for lease in conn.execute(
+                    select(self.leases_t).where(self.leases_t.c.job_id.in_([r.id for r in rows]))
+                )
+            }
+            claimed = []
+            for row in rows:
+                lease = leased.get(row.id)
+                if lease and lease.run_time == row.next_run_time and lease.owner != self.owner:
+                    continue  # esta execução já pertence a outra instância
+                claimed.append(row)
+
+            if claimed:
+                conn.execute(self.leases_t.delete().where(self.leases_t.c.job_id.in_([r.id for r in claimed])))
+                conn.execute(self.leases_t.insert(), [
+                    {
+                        "job_id": row.id,
+                        "run_time": row.next_run_time,
+                        "owner": self.owner,
+                        "expires_at": wall_now + self.lease_seconds,
+                    }
+                    for row in claimed
+                ])
+
+            for row in claimed:
+                try:
+                    jobs.append(self._reconstitute_job(row.job_state))
+                except BaseException:
+                    self._logger.exception('Unable to restore job "%s" -- removing it', row.id)
+                    failed_job_ids.add(row.id)
+            if failed_job_ids:
+                conn.execute(self.jobs_t.delete().where(self.jobs_t.c.id.in_(failed_job_ids)))
+
+        return jobs
+
+    def get_next_run_time(self):
+        """Próximo horário a acordar, sem contar execuções arrendadas por outra instância.
+
+        Um job vencido que outra instância está executando não deve fazer o scheduler
+        daqui acordar sem parar: para ele vale o fim do lease (se a outra instância
+        morrer, a execução volta a ser elegível nesse momento).
+        """
+        wall_now = time.time()
+        leased_elsewhere = and_(
+            self.leases_t.c.job_id == self.jobs_t.c.id,
+            self.leases_t.c.run_time == self.jobs_t.c.next_run_time,
+            self.leases_t.c.owner != self.owner,
+            self.leases_t.c.expires_at >= wall_now,
+        )
+        with self.engine.begin() as conn:
+            next_free = conn.execute(
+                select(func.min(self.jobs_t.c.next_run_time))
+                .where(self.jobs_t.c.next_run_time.isnot(None), ~exists().where(leased_elsewhere))
+            ).scalar()
+            lease_expiry = conn.execute(
+                select(func.min(self.leases_t.c.expires_at)).select_from(self.leases_t.join(self.jobs_t, leased_elsewhere))
+            ).scalar()
+        candidates = [t for t in (next_free, lease_expiry) if t is not None]
+        return utc_timestamp_to_datetime(min(candidates)) if candidates else None
+
+
+class HybridJobStore(MemoryJobStore):
+    """
+    Jobstore em memória com persistência assíncrona (write-behind) no DATABASE_URL.
+
+    Leituras, `get_due_jobs` e o cálculo do próximo horário são feitos em memória.
+    Cada alteração vira uma entrada de WAL (tabela `<tablename>_wal`) que uma thread
+    grava em lote a cada `flush_seconds`; periodicamente as alterações são compactadas
+    em um snapshot na própria tabela `<tablename>` (mesmo formato do SQLAlchemyJobStore)
+    e o WAL aplicado é apagado. Na partida: carrega o snapshot e reaplica o WAL.
+
+    Só serve para um único processo dono dos jobs: outra instância não enxerga jobs que
+    ainda estão só na memória. Alterações feitas há menos de `flush_seconds` se perdem
+    se o processo morrer sem shutdown.
+    """
+
+    def __init__(
+        self,
+        engine,
+        tablename: str = "apscheduler_jobs",
+        flush_seconds: float = JOBSTORE_FLUSH_SECONDS,
+        snapshot_seconds: float = JOBSTORE_SNAPSHOT_SECONDS,
+        snapshot_wal_rows: int = JOBSTORE_SNAPSHOT_WAL_ROWS,
+    ):
+        super().__init__()
+        # Reaproveita a definição da tabela (e o pickle) do jobstore SQL
+        self._sql = SQLAlchemyJobStore(engine=engine, tablename=tablename)
+        self.engine = self._sql.engine
+        self.jobs_t = self._sql.jobs_t
+        self.pickle_protocol = self._sql.pickle_protocol
+        self.wal_t = Table(
+            f"{tablename}_wal",
+            self.jobs_t.metadata,
+            Column("seq", Integer, primary_key=True, autoincrement=True),
+            Column("op", String(16), nullable=False),
+            Column("job_id", Unicode(191)),
+            Column("next_run_time", Float(25)),
+            Column("job_state", LargeBinary),
+            Column("created_at", Float(25), nullable=False),
+        )
+        self.flush_seconds = flush_seconds
+        self.snapshot_seconds = snapshot_seconds
+        self.snapshot_wal_rows = snapshot_wal_rows
+
+        self._wal_lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        # Jobs alterados desde o último snapshot; `_cleared`: todos foram removidos
+        self._dirty: set = set()
+        self._cleared = False
+        self._wal_rows = 0
+        self._last_snapshot = time.monotonic()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._recovering = False
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        self._sql._scheduler = scheduler
+        self._sql._alias = alias
+        self.jobs_t.create(self.engine, checkfirst=True)
+        self.wal_t.create(self.engine, checkfirst=True)
+        self._recover()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="hybrid-jobstore", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 30) -> None:
+        """Grava o que estiver pendente (WAL + snapshot) e encerra a thread de persistência."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def shutdown(self):
+        self.close()
+        # Limpa só a memória: os jobs continuam persistidos
+        self._jobs = []
+        self._jobs_index = {}
+
+    def _recover(self) -> None:
+        """Carrega o snapshot e reaplica as entradas do WAL, em ordem."""
+        started = time.monotonic()
+        self._recovering = True
+        try:
+            with self.engine.begin() as conn:
+                rows = conn.execute(select(self.jobs_t.c.id, self.jobs_t.c.job_state)).all()
+                wal = conn.execute(select(self.wal_t).order_by(self.wal_t.c.seq)).all()
+            states: Dict[str, bytes] = {row.id: row.job_state for row in rows}
+            for entry in wal:
+                if entry.op == WAL_CLEAR:
+                    states.clear()
+                elif entry.op == WAL_REMOVE:
+                    states.pop(entry.job_id, None)
+                else:
+                    states[entry.job_id] = entry.job_state
+
+            self._jobs = []
+            self._jobs_index = {}
+            for job_id, job_state in states.items():
+                try:
+                    super().add_job(self._sql._reconstitute_job(job_state))
+                except BaseException:
+                    self._logger.exception('Unable to restore job "%s" -- removing it', job_id)
+                    self._record(WAL_REMOVE, job_id)
+            self._wal_rows = len(wal)
+        finally:
+            self._recovering = False
+        print(
+            f"🗂️ Jobstore híbrido: {len(self._jobs)} job(s) recuperado(s) "
+            f"({len(rows)} do snapshot, {len(wal)} do WAL) em {time.monotonic() - started:.2f}s"
+        )
+        if wal:
+            # Compacta já na partida (regravando todos os jobs) para não reaplicar o mesmo WAL
+            with self._wal_lock:
+                self._cleared = True
+            self._snapshot()
+
+    # ------------------------------------------------------------------
+    # Alterações: memória primeiro, persistência depois
+    # ------------------------------------------------------------------
+    def _record(self, op: str, job_id: str | None = None, job: Job | None = None) -> None:
+        entry = {"op": op, "job_id": job_id, "next_run_time": None, "job_state": None, "created_at": time.time()}
+        if job is not None:
+            entry["next_run_time"] = datetime_to_utc_timestamp(job.next_run_time)
+            entry["job_state"] = pickle.dumps(job.__getstate__(), self.pickle_protocol)
+        with self._wal_lock:
+            self._pending.append(entry)
+            if op == WAL_CLEAR:
+                self._cleared = True
+                self._dirty.clear()
+            else:
+                self._dirty.add(job_id)
+
+    def add_job(self, job):
+        super().add_job(job)
+        if not self._recovering:
+            self._record(WAL_UPSERT, job.id, job)
+
+    def update_job(self, job):
+        super().update_job(job)
+        self._record(WAL_UPSERT, job.id, job)
+
+    def remove_job(self, job_id):
+        super().remove_job(job_id)
+        self._record(WAL_REMOVE, job_id)
+
+    def remove_all_jobs(self):
+        super().remove_all_jobs()
+        self._record(WAL_CLEAR)
+
+    # ------------------------------------------------------------------
+    # Thread de persistência
+    # ------------------------------------------------------------------
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            stopping = self._stop.is_set()
+            try:
+                self._flush()
+                due = time.monotonic() - self._last_snapshot >= self.snapshot_seconds
+                if stopping or due or self._wal_rows >= self.snapshot_wal_rows:
+                    self._snapshot()
+            except Exception as e:
+                # Tenta de novo no próximo ciclo; as entradas continuam pendentes
+                print(f"⚠️ Erro ao persistir o jobstore híbrido: {e}")
+            if stopping:
+                return
+
+    def _flush(self) -> None:
+        """Grava as entradas pendentes no WAL (um INSERT em lote)."""
+        with self._wal_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(self.wal_t.insert(), batch)
+        except Exception:
+            with self._wal_lock:
+                self._pending = batch + self._pending
+            raise
+        self._wal_rows += len(batch)
+
+    def _snapshot(self) -> None:
+        """Regrava no snapshot os jobs alterados e apaga o WAL que já foi aplicado."""
+        with self._wal_lock:
+            if self._pending:
+                # Só compacta o que já está no WAL; o resto entra no próximo ciclo
+                return
+            dirty, cleared = self._dirty, self._cleared
+            self._dirty, self._cleared = set(), False
+        rows: List[Dict[str, Any]] = []
+        for job_id in dirty:
+            job = self.lookup_job(job_id)
+            if job is not None:
+                rows.append({
+                    "id": job.id,
+                    "next_run_time": datetime_to_utc_timestamp(job.next_run_time),
+                    "job_state": pickle.dumps(job.__getstate__(), self.pickle_protocol),
+                })
+        if cleared:
+            rows = [
+                {
+                    "id": job.id,
+                    "next_run_time": datetime_to_utc_timestamp(job.next_run_time),
+                    "job_state": pickle.dumps(job.__getstate__(), self.pickle_protocol),
+                }
+                for job in self.get_all_jobs()
+            ]
+        try:
+            with self.engine.begin() as conn:
+                last_seq = conn.execute(select(func.max(self.wal_t.c.seq))).scalar()
+                if cleared:
+                    conn.execute(self.jobs_t.delete())
+                elif dirty:
+                    conn.execute(self.jobs_t.delete().where(self.jobs_t.c.id.in_(list(dirty))))
+                if rows:
+                    conn.execute(self.jobs_t.insert(), rows)
+                if last_seq is not None:
+                    conn.execute(self.wal_t.delete().where(self.wal_t.c.seq <= last_seq))
+        except Exception:
+            with self._wal_lock:
+                self._dirty |= dirty
+                self._cleared = self._cleared or cleared
+            raise
+        self._wal_rows = 0
+        self._last_snapshot = time.monotonic()
+
+    def read_jobs(self, job_ids: Iterable[str]) -> List[Tuple[str, bytes]]:
+        """Estado gravado na tabela para `job_ids` (jobs escritos por outro processo)."""
+        with self.engine.begin() as conn:
+            return [
+                (row.id, row.job_state)
+                for row in conn.execute(
+                    select(self.jobs_t.c.id, self.jobs_t.c.job_state).where(self.jobs_t.c.id.in_(list(job_ids)))
+                )
+            ]
+
+    def load_jobs(self, rows: Iterable[Tuple[str, bytes]]) -> int:
+        """Coloca na memória (e no WAL) os jobs lidos por `read_jobs`, substituindo os de mesmo id.
+
+        Deve rodar no event loop do scheduler, como as demais alterações do jobstore.
+        """
+        loaded = 0
+        for job_id, job_state in rows:
+            try:
+                job = self._sql._reconstitute_job(job_state)
+            except BaseException:
+                self._logger.exception('Unable to restore job "%s" -- skipping it', job_id)
+                continue
+            if self.lookup_job(job_id) is None:
+                self.add_job(job)
+            else:
+                self.update_job(job)
+            loaded += 1
+        return loaded
+
+    def snapshot_info(self) -> Dict[str, Any]:
+        with self._wal_lock:
+            pending = len(self._pending)
+        return {
+            "mode": "hybrid",
+            "jobs": len(self._jobs),
+            "pending_wal_entries": pending,
+            "wal_rows": self._wal_rows,
+            "seconds_since_snapshot": round(time.monotonic() - self._last_snapshot, 1),
+        }
+
+
+def jobstore_info(store: BaseJobStore) -> Dict[str, Any]:
+    """Resumo do jobstore para o health check."""
+    if isinstance(store, HybridJobStore):
+        return store.snapshot_info()
+    return {"mode": "sql"}
+
+
+def build_jobstore() -> BaseJobStore:
+    """Jobstore do scheduler (tabela `apscheduler_jobs` no DATABASE_URL).
+
+    Com JOBSTORE_MODE=hybrid e um único processo dono dos jobs (APP_ROLE=all,
+    SCHEDULER_MODE=internal) usa o HybridJobStore; caso contrário, o SQL com leases.
+    """
+    if JOBSTORE_MODE == "hybrid":
+        if APP_ROLE == "all" and SCHEDULER_MODE == "internal":
+            return HybridJobStore(engine=get_engine())
+        print("⚠️ JOBSTORE_MODE=hybrid exige APP_ROLE=all e SCHEDULER_MODE=internal; usando o jobstore SQL")
+    return LeasedSQLAlchemyJobStore(engine=get_engine())
+
+
+def bulk_upsert_jobs(store: SQLAlchemyJobStore, jobs: Iterable[Job], now: datetime | None = None) -> int:
+    """Grava vários jobs de uma vez, em uma única transação.
+
+    Equivale a `add_job(..., replace_existing=True)` para cada job, mas com um DELETE e
+    um INSERT em lote. Jobs sem próxima execução futura são ignorados.
+    Como a escrita não passa pelo scheduler do serviço, um item JOBSTORE_RELOAD na fila
+    durável avisa o processo dele: o scheduler acorda e o jobstore híbrido carrega os jobs.
+    Retorna quantos jobs foram gravados.
+    """
+    rows: Dict[str, dict] = {}
+    for job in jobs:
+        if job.next_run_time is None:
+            continue
+        if now is not None and job.next_run_time <= now:
+            continue
+        # O último job com o mesmo id vence, como no replace_existing
+        rows[job.id] = {
+            "id": job.id,
+            "next_run_time": datetime_to_utc_timestamp(job.next_run_time),
+            "job_state": pickle.dumps(job.__getstate__(), store.pickle_protocol),
+        }
+    if not rows:
+        return 0
+
+    # Garante a tabela mesmo fora do scheduler (ex.: comandos de linha de comando)
+    store.jobs_t.create(store.engine, checkfirst=True)
+    with store.engine.begin() as conn:
+        conn.execute(store.jobs_t.delete().where(store.jobs_t.c.id.in_(list(rows))))
+        conn.execute(store.jobs_t.insert(), list(rows.values()))
+    enqueue(JOBSTORE_RELOAD, {"job_ids": list(rows)})
+    return len(rows)
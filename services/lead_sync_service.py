@@ -0,0 +1,164 @@
+# services/lead_sync_service.py
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+from sqlalchemy import Boolean, Column, Float, String, Table, Text, func, select
+from config import (
+    NOTION_DB, NOTION_EMAIL_PROP, NOTION_PHONE_PROP, NOTION_STATUS_PROP, NOTION_DATE_PROP,
+    NOTION_TEST_PROP, NOTION_LINK_PROP, NOTION_LEVEL_PROP,
+    LEAD_SYNC_OVERLAP_SECONDS, LEAD_FULL_RECONCILE_HOURS,
+)
+from database import get_engine, get_state, metadata, set_state
+from services.notion_client import NotionUnavailableError
+from services.notion_service import get_data_source_id, notion_query_batches
+
+# Status dos leads acompanhados pela varredura de testes de nivelamento
+ACTIVE_STATUSES = [
+    "Em atendimento pela IA",
+    "Qualificado pela IA",
+    "Já entrei em contato",
+    "Agendado reunião",
+    "Reunião Realizada",
+    "Aguardando resposta",
+]
+
+# Cópia local das páginas do database de leads do Notion
+notion_leads = Table(
+    "notion_leads",
+    metadata,
+    Column("page_id", String(64), primary_key=True),
+    Column("database_id", String(64), nullable=False, index=True),
+    Column("email", String(320), index=True),
+    Column("phone", String(64), index=True),
+    Column("status", String(128), index=True),
+    Column("test_done", Boolean, nullable=False, default=False),
+    Column("level", Text),
+    Column("link", Text),
+    Column("meeting_date", String(64)),
+    Column("created_time", Float),
+    Column("last_edited_time", Float),
+    Column("synced_at", Float, nullable=False),
+)
+
+
+def _timestamp(value: str | None) -> float | None:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() if value else None
+
+
+def _plain_text(prop: Dict[str, Any]) -> str:
+    return "".join(t.get("plain_text", "") for t in prop.get("rich_text") or []).strip()
+
+
+def lead_from_page(page: Dict[str, Any], database_id: str, synced_at: float) -> Dict[str, Any]:
+    """Converte uma página do Notion em uma linha de `notion_leads`."""
+    props = page.get("properties", {})
+    status = props.get(NOTION_STATUS_PROP, {}).get("status") or {}
+    return {
+        "page_id": page["id"],
+        "database_id": database_id,
+        "email": props.get(NOTION_EMAIL_PROP, {}).get("email"),
+        "phone": props.get(NOTION_PHONE_PROP, {}).get("phone_number"),
+        "status": status.get("name"),
+        "test_done": props.get(NOTION_TEST_PROP, {}).get("checkbox") is True,
+        "level": _plain_text(props.get(NOTION_LEVEL_PROP, {})),
+        "link": props.get(NOTION_LINK_PROP, {}).get("url") or "",
+        "meeting_date": _plain_text(props.get(NOTION_DATE_PROP, {})),
+        "created_time": _timestamp(page.get("created_time")),
+        "last_edited_time": _timestamp(page.get("last_edited_time")),
+        "synced_at": synced_at,
+    }
+
+
+def _apply_pages(database_id: str, pages: List[Dict[str, Any]], synced_at: float) -> int:
+    """Grava um lote de páginas (DELETE + INSERT em lote); páginas arquivadas são removidas."""
+    live = [lead_from_page(p, database_id, synced_at) for p in pages if not (p.get("archived") or p.get("in_trash"))]
+    with get_engine().begin() as conn:
+        conn.execute(notion_leads.delete().where(notion_leads.c.page_id.in_([p["id"] for p in pages])))
+        if live:
+            conn.execute(notion_leads.insert(), live)
+    return len(pages) - len(live)
+
+
+def upsert_page(database_id: str, page: Dict[str, Any]) -> Dict[str, Any]:
+    """Grava uma página lida diretamente do Notion e retorna a linha correspondente."""
+    _apply_pages(database_id, [page], time.time())
+    return lead_from_page(page, database_id, time.time())
+
+
+def get_lead(database_id: str, page_id: str | None = None, email: str | None = None) -> Dict[str, Any] | None:
+    """Lead da cópia local, por page_id ou email (sem diferenciar maiúsculas)."""
+    query = select(notion_leads).where(notion_leads.c.database_id == database_id)
+    if page_id:
+        query = query.where(notion_leads.c.page_id == page_id)
+    elif email:
+        query = query.where(func.lower(notion_leads.c.email) == email.strip().lower())
+    else:
+        return None
+    with get_engine().begin() as conn:
+        row = conn.execute(query.limit(1)).mappings().first()
+    return dict(row) if row else None
+
+
+def _remove_unseen(database_id: str, synced_before: float) -> int:
+    with get_engine().begin() as conn:
+        return conn.execute(
+            notion_leads.delete().where(
+                notion_leads.c.database_id == database_id, notion_leads.c.synced_at < synced_before
+            )
+        ).rowcount
+
+
+async def sync_leads(database_id: str = NOTION_DB, full: bool = False) -> Dict[str, Any]:
+    """Atualiza a cópia local com as páginas editadas desde a última sincronização.
+
+    A cada LEAD_FULL_RECONCILE_HOURS (ou com `full=True`) lê o database inteiro e remove
+    as linhas que não apareceram, o que cobre páginas apagadas.
+    """
+    data_source_id = await asyncio.to_thread(get_data_source_id, database_id)
+    if not data_source_id:
+        raise NotionUnavailableError("data_source_id indisponível para Notion")
+
+    state_key = f"lead_sync:{database_id}"
+    state = await asyncio.to_thread(get_state, state_key, {})
+    started = time.time()
+    full = (
+        full
+        or not state.get("last_sync")
+        or started - state.get("last_full", 0) > LEAD_FULL_RECONCILE_HOURS * 3600
+    )
+
+    body: Dict[str, Any] = {}
+    if not full:
+        since = datetime.fromtimestamp(state["last_sync"] - LEAD_SYNC_OVERLAP_SECONDS, tz=timezone.utc)
+        body["filter"] = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since.isoformat()}}
+        body["sorts"] = [{"timestamp": "last_edited_time", "direction": "ascending"}]
+
+    fetched = removed = 0
+    # O próximo lote é buscado no Notion enquanto o atual é gravado
+    async for pages in notion_query_batches(data_source_id, body):
+        fetched += len(pages)
+        removed += await asyncio.to_thread(_apply_pages, database_id, pages, started)
+
+    if full:
+        # Tudo que não foi visto nesta leitura completa não existe mais no Notion
+        removed += await asyncio.to_thread(_remove_unseen, database_id, started)
+        state["last_full"] = started
+    state["last_sync"] = started
+    await asyncio.to_thread(set_state, state_key, state)
+
+    result = {"mode": "full" if full else "incremental", "fetched": fetched, "removed": removed}
+    print(f"🔄 Leads sincronizados do Notion: {result}")
+    return result
+
+
+def list_active_leads(database_id: str, after_page_id: str | None = None, limit: int = 100) -> List[Dict[str, Any]]:
+    """Leads com status ativo em ordem de page_id, a partir de `after_page_id` (paginação por chave)."""
+    query = select(notion_leads).where(
+        notion_leads.c.database_id == database_id, notion_leads.c.status.in_(ACTIVE_STATUSES)
+    )
+    if after_page_id:
+        query = query.where(notion_leads.c.page_id > after_page_id)
+    with get_engine().begin() as conn:
+        rows = conn.execute(query.order_by(notion_leads.c.page_id).limit(limit)).mappings().all()
+    return [dict(row) for row in rows]
@@ -0,0 +1,150 @@
+# services/notion_client.py
+import time
+import asyncio
+import threading
+from typing import Optional
+import httpx
+from config import (
+    HEADERS_NOTION,
+    NOTION_TIMEOUT_SECONDS,
+    NOTION_RATE_PER_SECOND,
+    NOTION_BURST,
+    NOTION_MAX_CONCURRENCY,
+    NOTION_MAX_RETRIES,
+)
+from services.resilience import (
+    CircuitOpenError,
+    DeadlineExceeded,
+    RateLimiter,
+    guarded_request,
+    guarded_request_async,
+    parse_retry_after,
+    remaining_budget,
+)
+
+
+class NotionUnavailableError(Exception):
+    """O Notion não respondeu de forma utilizável (fora do ar, circuito aberto, prazo esgotado).
+
+    Diferente de "não encontrado": quem chama não deve tratar como ausência do registro.
+    """
+
+
+class NotionRateLimitedError(NotionUnavailableError):
+    """O Notion continuou respondendo 429 depois de todas as tentativas."""
+
+
+class NotionClient:
+    """Cliente HTTP do Notion com rate limit, back-off em 429 e circuit breaker.
+
+    Uma única instância por integração (`notion_client` para o tenant padrão) é usada
+    pelo webhook e pela varredura de testes de nivelamento, para que juntos respeitem o
+    limite da integração. Cada tenant tem a sua (token, limite e circuito próprios).
+    As chamadas síncronas reaproveitam as conexões de um `httpx.Client` da instância,
+    aberto na primeira requisição e fechado no shutdown (`close`).
+    """
+
+    def __init__(
+        self,
+        limiter: Optional[RateLimiter] = None,
+        max_retries: int = NOTION_MAX_RETRIES,
+        headers: Optional[dict] = None,
+        breaker_name: str = "notion",
+    ):
+        self.limiter = limiter or RateLimiter(NOTION_RATE_PER_SECOND, NOTION_BURST, NOTION_MAX_CONCURRENCY)
+        self.max_retries = max_retries
+        self.headers = headers or HEADERS_NOTION
+        self.breaker_name = breaker_name
+        self._http: Optional[httpx.Client] = None
+        self._http_lock = threading.Lock()
+
+    @property
+    def http(self) -> httpx.Client:
+        with self._http_lock:
+            if self._http is None:
+                self._http = httpx.Client()
+            return self._http
+
+    def close(self) -> None:
+        with self._http_lock:
+            http, self._http = self._http, None
+        if http is not None:
+            http.close()
+
+    @staticmethod
+    def _check_wait(wait: float) -> None:
+        remaining = remaining_budget()
+        if remaining is not None and wait >= remaining:
+            raise DeadlineExceeded(f"Espera de {wait:.1f}s pelo rate limit do Notion excede o orçamento")
+
+    def _throttled(self, resp: httpx.Response, attempt: int) -> float:
+        retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+        self.limiter.on_throttled(retry_after)
+        print(f"⏳ Notion 429 (tentativa {attempt + 1}); aguardando {retry_after:.1f}s")
+        return retry_after
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Requisição síncrona ao Notion. Levanta NotionUnavailableError se não houver resposta útil."""
+        kwargs.setdefault("headers", self.headers)
+        for attempt in range(self.max_retries + 1):
+            try:
+                wait = self.limiter.reserve()
+                self._check_wait(wait)
+                if wait > 0:
+                    time.sleep(wait)
+                self.limiter.enter()
+                try:
+                    resp = guarded_request(
+                        self.breaker_name, method, url, NOTION_TIMEOUT_SECONDS, throttle_is_failure=False,
+                        client=self.http, **kwargs
+                    )
+                finally:
+                    self.limiter.leave()
+            except (CircuitOpenError, DeadlineExceeded, httpx.TransportError) as e:
+                raise NotionUnavailableError(str(e)) from e
+
+            if resp.status_code != 429:
+                if resp.status_code < 500:
+                    self.limiter.on_success()
+                    return resp
+                raise NotionUnavailableError(f"Notion respondeu {resp.status_code}")
+            self._throttled(resp, attempt)
+        raise NotionRateLimitedError(f"Notion continuou com 429 após {self.max_retries + 1} tentativas")
+
+    async def arequest(
+        self, method: str, url: str, client: Optional[httpx.AsyncClient] = None, **kwargs
+    ) -> httpx.Response:
+        """Versão assíncrona de `request`; reutiliza o `client` informado quando houver."""
+        kwargs.setdefault("headers", self.headers)
+        if client is None:
+            async with httpx.AsyncClient() as own_client:
+                return await self.arequest(method, url, client=own_client, **kwargs)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                wait = self.limiter.reserve()
+                self._check_wait(wait)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                await self.limiter.enter_async()
+                try:
+                    resp = await guarded_request_async(
+                        client, self.breaker_name, method, url, NOTION_TIMEOUT_SECONDS,
+                        throttle_is_failure=False, **kwargs
+                    )
+                finally:
+                    self.limiter.leave()
+            except (CircuitOpenError, DeadlineExceeded, httpx.TransportError) as e:
+                raise NotionUnavailableError(str(e)) from e
+
+            if resp.status_code != 429:
+                if resp.status_code < 500:
+                    self.limiter.on_success()
+                    return resp
+                raise NotionUnavailableError(f"Notion respondeu {resp.status_code}")
+            self._throttled(resp, attempt)
+        raise NotionRateLimitedError(f"Notion continuou com 429 após {self.max_retries + 1} tentativas")
+
+
+# Instância compartilhada pelo webhook e pela varredura
+notion_client = NotionClient()
@@ -0,0 +1,126 @@
+# services/notion_outbox_drainer.py
+import asyncio
+from typing import Any, Dict, List
+import httpx
+from apscheduler.schedulers.base import BaseScheduler
+from sqlalchemy.exc import IntegrityError
+from config import NOTION_OUTBOX_BATCH_SIZE, WORKER_POLL_SECONDS
+from database import get_engine
+from services.admin_digest_service import admin_meetings
+from services.booking_service import find_or_create_lead_page
+from services.notion_client import NotionUnavailableError
+from services.notion_outbox_service import (
+    RESOLVE, claim, complete, fail, is_provisional, mark_resolved, resolved_page_id,
+)
+from services.notion_service import flush_notion_writes, notion_patch_page
+from services.tenant_service import get_tenant, tenant_scope
+from utils import notion_page_url
+
+
+class PermanentOutboxError(Exception):
+    """A operação não vai dar certo com novas tentativas (ex.: 400/404 do Notion)."""
+
+
+def _replace(value: Any, replacements: Dict[str, str]) -> Any:
+    if isinstance(value, str):
+        for old, new in replacements.items():
+            value = value.replace(old, new)
+        return value
+    if isinstance(value, (list, tuple)):
+        return type(value)(_replace(v, replacements) for v in value)
+    if isinstance(value, dict):
+        return {k: _replace(v, replacements) for k, v in value.items()}
+    return value
+
+
+def reconcile(scheduler: BaseScheduler, local_id: str, page_id: str) -> int:
+    """Troca o id provisório pelo real nos lembretes já agendados e nas reuniões dos admins.
+
+    Retorna quantos jobs foram alterados.
+    """
+    mark_resolved(local_id, page_id)
+    # Links do Notion primeiro (sem hífens), depois o id em si (ex.: kwargs page_id)
+    replacements = {notion_page_url(local_id): notion_page_url(page_id), local_id: page_id}
+
+    changed = 0
+    for job in scheduler.get_jobs():
+        args, kwargs = _replace(job.args, replacements), _replace(job.kwargs, replacements)
+        if args != job.args or kwargs != job.kwargs:
+            scheduler.modify_job(job.id, args=args, kwargs=kwargs)
+            changed += 1
+
+    with get_engine().begin() as conn:
+        try:
+            with conn.begin_nested():
+                conn.execute(
+                    admin_meetings.update().where(admin_meetings.c.page_id == local_id).values(page_id=page_id)
+                )
+        except IntegrityError:
+            # A página real já tinha uma reunião registrada: fica a mais recente (a real)
+            conn.execute(admin_meetings.delete().where(admin_meetings.c.page_id == local_id))
+
+    print(f"🔗 Lead provisório {local_id} reconciliado com a página {page_id} ({changed} lembrete(s) atualizado(s))")
+    return changed
+
+
+def _apply(op: Dict[str, Any], scheduler: BaseScheduler) -> None:
+    if op["op"] == RESOLVE:
+        page_id = find_or_create_lead_page(op["payload"])
+        if page_id is None:
+            raise PermanentOutboxError("Notion recusou a criação da página")
+        # As atualizações de uma página encontrada saem antes das próximas operações do lead
+        flush_notion_writes()
+        reconcile(scheduler, op["page_key"], page_id)
+        return
+
+    target = op["page_key"]
+    if is_provisional(target):
+        target = resolved_page_id(target)
+        if target is None:
+            raise PermanentOutboxError(f"Lead provisório {op['page_key']} nunca foi criado no Notion")
+    try:
+        notion_patch_page(target, op["payload"]["properties"])
+    except httpx.HTTPStatusError as e:
+        raise PermanentOutboxError(str(e)) from e
+
+
+def apply_ops(ops: List[Dict[str, Any]], scheduler: BaseScheduler) -> None:
+    """Aplica as operações reservadas, cada uma no contexto do seu tenant."""
+    for op in ops:
+        tenant = get_tenant(op["tenant"])
+        try:
+            if tenant is None:
+                raise PermanentOutboxError(f"Tenant '{op['tenant']}' não configurado")
+            with tenant_scope(tenant):
+                _apply(op, scheduler)
+            complete(op["id"])
+            print(f"✓ Outbox do Notion: {op['op']} de {op['page_key']} aplicado")
+        except PermanentOutboxError as e:
+            print(f"❌ Outbox do Notion: {op['op']} de {op['page_key']} descartado: {e}")
+            fail(op["id"], op["attempts"], str(e), permanent=True)
+        except NotionUnavailableError as e:
+            print(f"⏳ Outbox do Notion: Notion ainda indisponível ({e}); nova tentativa mais tarde")
+            fail(op["id"], op["attempts"], str(e))
+        except Exception as e:
+            print(f"❌ Outbox do Notion: erro em {op['op']} de {op['page_key']}: {e}")
+            fail(op["id"], op["attempts"], str(e))
+
+
+async def run_outbox_drainer(owner: str, scheduler: BaseScheduler, stop_event: asyncio.Event) -> None:
+    """Aplica o outbox do Notion até `stop_event` ser sinalizado."""
+    print(f"📮 Drainer do outbox do Notion iniciado ({owner})")
+    while not stop_event.is_set():
+        try:
+            ops = await asyncio.to_thread(claim, owner, NOTION_OUTBOX_BATCH_SIZE)
+        except Exception as e:
+            print(f"❌ Erro ao buscar operações do outbox: {e}")
+            ops = []
+
+        if ops:
+            await asyncio.to_thread(apply_ops, ops, scheduler)
+            continue
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=WORKER_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+    print("📮 Drainer do outbox do Notion encerrado")
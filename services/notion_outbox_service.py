@@ -0,0 +1,207 @@
+# services/notion_outbox_service.py
+import json
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from sqlalchemy import Column, Float, Integer, String, Table, Text, and_, exists, func, select
+from sqlalchemy.orm import aliased
+from config import NOTION_OUTBOX_MAX_ATTEMPTS, QUEUE_LEASE_SECONDS
+from database import fetch_all_async, get_engine, metadata
+from services.tenant_service import current_tenant
+
+PENDING = "pending"
+RUNNING = "running"
+FAILED = "failed"
+
+# Operações
+RESOLVE = "resolve"  # encontra (por telefone/e-mail) ou cria a página de um lead provisório
+UPDATE = "update"    # PATCH de properties
+
+# Ids de leads criados enquanto o Notion estava fora; viram o id real na reconciliação
+PROVISIONAL_PREFIX = "local-"
+
+# Escritas no Notion que não puderam ser feitas na hora, aplicadas em ordem por página
+notion_outbox = Table(
+    "notion_outbox",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("tenant", String(64), nullable=False),
+    # Id da página (real ou provisório): operações da mesma chave são aplicadas em ordem
+    Column("page_key", String(64), nullable=False, index=True),
+    Column("op", String(16), nullable=False),
+    Column("payload", Text, nullable=False),
+    Column("status", String(16), nullable=False, default=PENDING, index=True),
+    Column("attempts", Integer, nullable=False, default=0),
+    Column("available_at", Float, nullable=False, index=True),
+    Column("locked_by", String(191)),
+    Column("locked_until", Float),
+    Column("created_at", Float, nullable=False),
+    Column("updated_at", Float, nullable=False),
+    Column("last_error", Text),
+)
+
+# Lead provisório -> página real (preenchida quando o RESOLVE é aplicado)
+notion_provisional_pages = Table(
+    "notion_provisional_pages",
+    metadata,
+    Column("local_id", String(64), primary_key=True),
+    Column("tenant", String(64), nullable=False),
+    Column("page_id", String(64)),
+    Column("created_at", Float, nullable=False),
+    Column("resolved_at", Float),
+)
+
+
+def is_provisional(page_id: str | None) -> bool:
+    return bool(page_id) and page_id.startswith(PROVISIONAL_PREFIX)
+
+
+def _insert_op(conn, tenant_id: str, page_key: str, op: str, payload: Dict[str, Any], now: float) -> int:
+    result = conn.execute(notion_outbox.insert().values(
+        tenant=tenant_id,
+        page_key=page_key,
+        op=op,
+        payload=json.dumps(payload),
+        status=PENDING,
+        attempts=0,
+        available_at=now,
+        created_at=now,
+        updated_at=now,
+    ))
+    return result.inserted_primary_key[0]
+
+
+def record_provisional_lead(lead: Dict[str, Any]) -> str:
+    """Cria um lead provisório e agenda a busca/criação da página real no Notion.
+
+    `lead` tem name, email, phone, meeting_date, status e update_existing (mesmos
+    argumentos de `resolve_lead_page`). Retorna o id provisório ("local-...").
+    O payload leva `enqueued_at`, para o RESOLVE não sobrescrever uma página editada depois.
+    """
+    tenant_id = current_tenant().id
+    local_id = f"{PROVISIONAL_PREFIX}{uuid.uuid4().hex}"
+    now = time.time()
+    with get_engine().begin() as conn:
+        conn.execute(notion_provisional_pages.insert().values(
+            local_id=local_id, tenant=tenant_id, page_id=None, created_at=now, resolved_at=None,
+        ))
+        _insert_op(conn, tenant_id, local_id, RESOLVE, {**lead, "enqueued_at": now}, now)
+    print(f"📮 Lead {lead.get('name')} registrado como {local_id}; o Notion será atualizado quando voltar")
+    return local_id
+
+
+def record_update(page_key: str, properties: Dict[str, Any], tenant_id: str | None = None) -> int:
+    """Guarda um PATCH de properties para ser aplicado pelo drainer."""
+    with get_engine().begin() as conn:
+        op_id = _insert_op(conn, tenant_id or current_tenant().id, page_key, UPDATE, {"properties": properties}, time.time())
+    print(f"📮 Atualização de {', '.join(properties)} da página {page_key} guardada no outbox")
+    return op_id
+
+
+def has_pending(page_key: str) -> bool:
+    """Há operações ainda não aplicadas para a página? (novas escritas devem ir atrás delas)"""
+    with get_engine().begin() as conn:
+        return conn.execute(
+            select(notion_outbox.c.id)
+            .where(notion_outbox.c.page_key == page_key, notion_outbox.c.status.in_((PENDING, RUNNING)))
+            .limit(1)
+        ).first() is not None
+
+
+def resolved_page_id(local_id: str) -> Optional[str]:
+    """Página real de um lead provisório (None enquanto não foi criada/encontrada)."""
+    with get_engine().begin() as conn:
+        return conn.execute(
+            select(notion_provisional_pages.c.page_id).where(notion_provisional_pages.c.local_id == local_id)
+        ).scalar()
+
+
+def mark_resolved(local_id: str, page_id: str) -> None:
+    with get_engine().begin() as conn:
+        conn.execute(
+            notion_provisional_pages.update()
+            .where(notion_provisional_pages.c.local_id == local_id)
+            .values(page_id=page_id, resolved_at=time.time())
+        )
+
+
+def claim(owner: str, limit: int) -> List[Dict[str, Any]]:
+    """Reserva operações prontas, só a mais antiga pendente de cada página.
+
+    Uma operação não é elegível enquanto houver outra mais antiga da mesma página
+    pendente ou em execução, o que mantém a ordem mesmo com vários drainers.
+    """
+    engine = get_engine()
+    now = time.time()
+    older = aliased(notion_outbox)
+    with engine.begin() as conn:
+        conn.execute(
+            notion_outbox.update()
+            .where(notion_outbox.c.status == RUNNING, notion_outbox.c.locked_until < now)
+            .values(status=PENDING, locked_by=None, locked_until=None, updated_at=now)
+        )
+        query = (
+            select(notion_outbox)
+            .where(
+                notion_outbox.c.status == PENDING,
+                notion_outbox.c.available_at <= now,
+                ~exists().where(and_(
+                    older.c.page_key == notion_outbox.c.page_key,
+                    older.c.id < notion_outbox.c.id,
+                    older.c.status.in_((PENDING, RUNNING)),
+                )),
+            )
+            .order_by(notion_outbox.c.id)
+            .limit(limit)
+        )
+        if engine.dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        rows = [dict(r) for r in conn.execute(query).mappings()]
+        if not rows:
+            return []
+        conn.execute(
+            notion_outbox.update()
+            .where(notion_outbox.c.id.in_([r["id"] for r in rows]))
+            .values(
+                status=RUNNING,
+                locked_by=owner,
+                locked_until=now + QUEUE_LEASE_SECONDS,
+                attempts=notion_outbox.c.attempts + 1,
+                updated_at=now,
+            )
+        )
+    for row in rows:
+        row["payload"] = json.loads(row["payload"])
+        row["attempts"] += 1
+    return rows
+
+
+def complete(op_id: int) -> None:
+    """Operação aplicada: sai do outbox (as que falharam de vez ficam para inspeção)."""
+    with get_engine().begin() as conn:
+        conn.execute(notion_outbox.delete().where(notion_outbox.c.id == op_id))
+
+
+def fail(op_id: int, attempts: int, error: str, permanent: bool = False) -> None:
+    """Reagenda com back-off exponencial; desiste após NOTION_OUTBOX_MAX_ATTEMPTS (ou se `permanent`)."""
+    now = time.time()
+    final = permanent or attempts >= NOTION_OUTBOX_MAX_ATTEMPTS
+    with get_engine().begin() as conn:
+        conn.execute(
+            notion_outbox.update().where(notion_outbox.c.id == op_id).values(
+                status=FAILED if final else PENDING,
+                locked_by=None,
+                locked_until=None,
+                available_at=now + min(2 ** attempts * 5, 3600),
+                last_error=error[:2000],
+                updated_at=now,
+            )
+        )
+
+
+async def outbox_snapshot() -> Dict[str, int]:
+    """Contagem de operações por status (health check)."""
+    rows = await fetch_all_async(
+        select(notion_outbox.c.status, func.count()).group_by(notion_outbox.c.status)
+    )
+    return {status: count for status, count in rows}
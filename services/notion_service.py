@@ -1,38 +1,262 @@
 import httpx
 import json
-from typing import Optional, Dict, Any
+import time
+import threading
+from typing import Optional, Dict, Any, AsyncIterator, List
 from config import (
-    NOTION_DB, HEADERS_NOTION, NOTION_PHONE_PROP, NOTION_EMAIL_PROP,
-    NOTION_NAME_PROP, NOTION_STATUS_PROP, NOTION_DATE_PROP
+    NOTION_PHONE_PROP, NOTION_EMAIL_PROP,
+    NOTION_NAME_PROP, NOTION_STATUS_PROP, NOTION_DATE_PROP, NOTION_SCHEMA_TTL_SECONDS,
+    NOTION_WRITE_COALESCE_SECONDS, NOTION_OUTBOX_ENABLED,
+    NOTION_TEST_PROP, NOTION_TEST_OPTION_ID_SIM, NOTION_TEST_OPTION_ID_NAO
 )
+from services.notion_client import NotionUnavailableError
+from services.tenant_service import current_tenant
+from services.notion_outbox_service import has_pending, is_provisional, record_update
+from services.pagination import prefetch_items, prefetch_pages
 
-# Cache simples para data_source_id
-_data_source_cache: Dict[str, str] = {}
+def _notion_request(method: str, url: str, **kwargs) -> httpx.Response:
+    """Chamada ao Notion via cliente do tenant atual (rate limit, back-off em 429, circuit breaker)."""
+    return current_tenant().notion.request(method, url, **kwargs)
 
-def get_data_source_id(database_id: str) -> Optional[str]:
-    if database_id in _data_source_cache:
-        return _data_source_cache[database_id]
+# -----------------------------------------------------------------------------
+# Cache de schema (database / data source) com TTL
+# -----------------------------------------------------------------------------
+class _SchemaCache:
+    """Guarda objetos de schema do Notion por chave, expirando após `ttl` segundos."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[str, tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                return entry[1]
+            return None
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), data)
+
+    def invalidate(self, key: str | None = None) -> None:
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+_schema_cache = _SchemaCache(NOTION_SCHEMA_TTL_SECONDS)
+
+# -----------------------------------------------------------------------------
+# Buffer de escrita por página
+# -----------------------------------------------------------------------------
+class _PageWriteBuffer:
+    """
+    Junta as atualizações de properties de uma mesma página em um único PATCH.
+
+    A primeira escrita abre uma janela de `window` segundos; as que chegam nela são
+    mescladas (a última vence, por property) e uma thread envia tudo junto ao fim da
+    janela. Leitores do processo enxergam as escritas pendentes via `overlay`.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        # page_id -> {"tenant", "properties", "due"}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # Escritas já retiradas da fila, com o PATCH em andamento
+        self._in_flight: Dict[str, Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def write(self, page_id: str, properties: Dict[str, Any]) -> None:
+        if self.window <= 0:
+            self._patch(current_tenant(), page_id, properties)
+            return
+        with self._cond:
+            entry = self._pending.get(page_id)
+            if entry is None:
+                entry = self._pending[page_id] = {
+                    "tenant": current_tenant(),
+                    "properties": {},
+                    "due": time.monotonic() + self.window,
+                }
+            entry["properties"].update(properties)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="notion-write-buffer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def take(self, page_id: str) -> Dict[str, Any]:
+        """Retira as escritas pendentes da página (quem chama passa a ser responsável por elas)."""
+        with self._cond:
+            entry = self._pending.pop(page_id, None)
+        return entry["properties"] if entry else {}
+
+    def pending(self, page_id: str) -> Dict[str, Any]:
+        with self._cond:
+            merged = dict(self._in_flight.get(page_id, {}))
+            entry = self._pending.get(page_id)
+            if entry:
+                merged.update(entry["properties"])
+        return merged
+
+    def overlay(self, page: Dict[str, Any]) -> Dict[str, Any]:
+        """A página como ficará depois das escritas pendentes (read-your-writes no processo)."""
+        pending = self.pending(page.get("id", ""))
+        if not pending:
+            return page
+        properties = dict(page.get("properties") or {})
+        for name, value in pending.items():
+            properties[name] = {**properties.get(name, {}), **_as_read_value(value)}
+        return {**page, "properties": properties}
+
+    def _due(self) -> List[tuple[str, Dict[str, Any]]]:
+        now = time.monotonic()
+        due = [page_id for page_id, entry in self._pending.items() if entry["due"] <= now]
+        batch = [(page_id, self._pending.pop(page_id)) for page_id in due]
+        for page_id, entry in batch:
+            self._in_flight[page_id] = entry["properties"]
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                batch = self._due()
+                while not batch:
+                    timeout = min((e["due"] for e in self._pending.values()), default=None)
+                    self._cond.wait(None if timeout is None else max(timeout - time.monotonic(), 0))
+                    batch = self._due()
+            for page_id, entry in batch:
+                try:
+                    self._patch(entry["tenant"], page_id, entry["properties"])
+                finally:
+                    with self._cond:
+                        self._in_flight.pop(page_id, None)
+
+    def _patch(self, tenant, page_id: str, properties: Dict[str, Any]) -> None:
+        # Lead provisório ou escritas anteriores ainda no outbox: vai para a fila atrás delas
+        if NOTION_OUTBOX_ENABLED and (is_provisional(page_id) or has_pending(page_id)):
+            record_update(page_id, properties, tenant.id)
+            return
+        try:
+            resp = tenant.notion.request(
+                "PATCH",
+                f"https://api.notion.com/v1/pages/{page_id}",
+                json={"properties": properties},
+            )
+            resp.raise_for_status()
+            print(f"✓ Página {page_id} atualizada no Notion: {', '.join(properties)}")
+        except NotionUnavailableError as e:
+            if NOTION_OUTBOX_ENABLED:
+                print(f"⚠️ Notion indisponível ao atualizar a página {page_id}: {e}")
+                record_update(page_id, properties, tenant.id)
+            else:
+                print(f"✗ Erro ao atualizar {', '.join(properties)} da página {page_id} no Notion: {e}")
+        except Exception as e:
+            print(f"✗ Erro ao atualizar {', '.join(properties)} da página {page_id} no Notion: {e}")
+
+    def flush(self) -> None:
+        """Envia agora todas as escritas pendentes (shutdown e scripts)."""
+        with self._cond:
+            batch = list(self._pending.items())
+            self._pending.clear()
+        for page_id, entry in batch:
+            self._patch(entry["tenant"], page_id, entry["properties"])
+
+
+def _as_read_value(value: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte o valor de escrita de uma property no formato de leitura (textos com plain_text)."""
+    converted = {}
+    for kind, content in value.items():
+        if kind in ("rich_text", "title") and isinstance(content, list):
+            content = [
+                {**item, "plain_text": item.get("text", {}).get("content", "")} for item in content
+            ]
+        converted[kind] = content
+    return converted
+
+
+_write_buffer = _PageWriteBuffer(NOTION_WRITE_COALESCE_SECONDS)
+
+def notion_write_properties(page_id: str, properties: Dict[str, Any]) -> None:
+    """Agenda a atualização de properties da página (mesclada com as pendentes)."""
+    _write_buffer.write(page_id, properties)
+
+def notion_pending_overlay(page: Dict[str, Any]) -> Dict[str, Any]:
+    """Aplica à página lida do Notion as escritas deste processo que ainda não foram enviadas."""
+    return _write_buffer.overlay(page)
+
+def flush_notion_writes() -> None:
+    """Envia imediatamente as escritas pendentes no buffer."""
+    _write_buffer.flush()
+
+def _get_schema(kind: str, object_id: str, force_refresh: bool = False) -> Dict[str, Any] | None:
+    """Obtém o objeto `databases/{id}` ou `data_sources/{id}`, usando o cache quando válido."""
+    key = f"{kind}:{object_id}"
+    if not force_refresh:
+        cached = _schema_cache.get(key)
+        if cached is not None:
+            return cached
     try:
-        resp = httpx.get(
-            f"https://api.notion.com/v1/databases/{database_id}",
-            headers=HEADERS_NOTION,
-            timeout=15,
-        )
+        resp = _notion_request("GET", f"https://api.notion.com/v1/{kind}/{object_id}")
         resp.raise_for_status()
         data = resp.json()
-        data_sources = data.get("data_sources", [])
-        if not data_sources:
-            print(f"⚠️ Nenhum data_source para database {database_id}")
-            return None
-        ds_id = data_sources[0].get("id")
-        if ds_id:
-            _data_source_cache[database_id] = ds_id
-            return ds_id
-        return None
+        _schema_cache.put(key, data)
+        return data
     except Exception as e:
-        print(f"❌ Erro ao obter data_source_id: {e}")
+        print(f"❌ Erro ao obter schema ({kind}) {object_id}: {e}")
         return None
 
+def invalidate_schema_cache(database_id: str | None = None) -> None:
+    """Descarta o schema em cache (de um database e do seu data source, ou tudo)."""
+    if database_id is None:
+        _schema_cache.invalidate()
+        return
+    database = _schema_cache.get(f"databases:{database_id}")
+    for ds in (database or {}).get("data_sources", []):
+        if ds.get("id"):
+            _schema_cache.invalidate(f"data_sources:{ds['id']}")
+    _schema_cache.invalidate(f"databases:{database_id}")
+
+def get_data_source_id(database_id: str, force_refresh: bool = False) -> Optional[str]:
+    data = _get_schema("databases", database_id, force_refresh=force_refresh)
+    if data is None:
+        return None
+    data_sources = data.get("data_sources", [])
+    if not data_sources:
+        print(f"⚠️ Nenhum data_source para database {database_id}")
+        return None
+    return data_sources[0].get("id")
+
+def _query_fetcher(data_source_id: str, body: Dict[str, Any] | None, client: httpx.AsyncClient | None):
+    url = f"https://api.notion.com/v1/data_sources/{data_source_id}/query"
+
+    async def fetch(start_cursor: str | None):
+        payload = {"page_size": 100, **(body or {})}
+        if start_cursor:
+            payload["start_cursor"] = start_cursor
+        resp = await current_tenant().notion.arequest("POST", url, client=client, json=payload)
+        resp.raise_for_status()
+        data = resp.json()
+        results = [_write_buffer.overlay(page) for page in data.get("results") or []]
+        return results, data.get("next_cursor") if data.get("has_more") else None
+
+    return fetch
+
+def notion_query_batches(
+    data_source_id: str, body: Dict[str, Any] | None = None, client: httpx.AsyncClient | None = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Gera os lotes (até 100 páginas) de uma consulta ao data source, pré-carregando o próximo."""
+    return prefetch_pages(_query_fetcher(data_source_id, body, client))
+
+def notion_query_items(
+    data_source_id: str, body: Dict[str, Any] | None = None, client: httpx.AsyncClient | None = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Como `notion_query_batches`, mas gera página por página do Notion."""
+    return prefetch_items(_query_fetcher(data_source_id, body, client))
+
 def clean_phone_number(phone: str) -> str:
     """Limpa e padroniza o número de telefone para o formato 55..."""
     clean_phone = ''.join(filter(str.isdigit, phone))
@@ -48,12 +272,22 @@ def clean_phone_number(phone: str) -> str:
     return clean_phone
 
 def notion_find_page(identifier: str | None, by: str = "phone") -> Optional[str]:
+    """Busca a página do lead. Retorna None só quando o Notion confirma que não existe.
+
+    Levanta NotionUnavailableError se o Notion estiver indisponível ou limitando (429),
+    para que o chamador não confunda falha com "não encontrado" e crie duplicatas.
+    """
+    page = notion_find_lead(identifier, by)
+    return page["id"] if page else None
+
+def notion_find_lead(identifier: str | None, by: str = "phone") -> Optional[Dict[str, Any]]:
+    """Como `notion_find_page`, mas retorna o objeto da página (com last_edited_time)."""
     if not identifier:
         return None
 
-    data_source_id = get_data_source_id(NOTION_DB)
+    data_source_id = get_data_source_id(current_tenant().notion_db)
     if not data_source_id:
-        return None
+        raise NotionUnavailableError("data_source_id indisponível")
 
     if by == "phone":
         search_value = clean_phone_number(identifier)
@@ -66,82 +300,50 @@ def notion_find_page(identifier: str | None, by: str = "phone") -> Optional[str]
     print(f"Buscando no Notion com filtro: {json.dumps(filter_json, indent=2)}")
 
     try:
-        resp = httpx.post(
+        resp = _notion_request(
+            "POST",
             f"https://api.notion.com/v1/data_sources/{data_source_id}/query",
-            headers=HEADERS_NOTION,
             json={"filter": filter_json},
-            timeout=15,
         )
         resp.raise_for_status()
         results = resp.json().get("results", [])
 
         if results:
             print(f"Encontrou página no Notion: {results[0]['id']}")
-            return results[0]["id"]
+            return results[0]
         else:
             print("Nenhuma página encontrada no Notion")
             return None
+    except NotionUnavailableError as e:
+        print(f"✗ Notion indisponível ao buscar página: {e}")
+        raise
     except Exception as e:
         print(f"Erro ao buscar página no Notion: {e}")
         return None
 
+def notion_patch_page(page_id: str, properties: Dict[str, Any]) -> None:
+    """PATCH imediato de properties (sem buffer); levanta exceção em qualquer falha."""
+    resp = _notion_request(
+        "PATCH",
+        f"https://api.notion.com/v1/pages/{page_id}",
+        json={"properties": properties},
+    )
+    resp.raise_for_status()
+
 def notion_update_meeting_date(page_id: str, when: str) -> None:
-    """Atualiza apenas a data da reunião na página do Notion."""
+    """Atualiza apenas a data da reunião na página do Notion (via buffer de escrita)."""
     print(f"Atualizando data de reunião da página {page_id} para {when}")
-    payload = {
-        "properties": {NOTION_DATE_PROP: {"rich_text": [{"text": {"content": when}}]}}
-    }
-    try:
-        resp = httpx.patch(
-            f"https://api.notion.com/v1/pages/{page_id}",
-            headers=HEADERS_NOTION,
-            json=payload,
-            timeout=15,
-        )
-        resp.raise_for_status()
-        print(f"✓ Data de reunião no Notion atualizada com sucesso.")
-    except Exception as e:
-        print(f"✗ Erro ao atualizar data de reunião no Notion: {str(e)}")
+    notion_write_properties(page_id, {NOTION_DATE_PROP: {"rich_text": [{"text": {"content": when}}]}})
 
 def notion_update_status(page_id: str, status_name: str) -> None:
-    """Atualiza apenas o status na página do Notion."""
+    """Atualiza apenas o status na página do Notion (via buffer de escrita)."""
     print(f"Atualizando status da página {page_id} para '{status_name}'")
-    payload = {
-        "properties": {NOTION_STATUS_PROP: {"status": {"name": status_name}}}
-    }
-    try:
-        resp = httpx.patch(
-            f"https://api.notion.com/v1/pages/{page_id}",
-            headers=HEADERS_NOTION,
-            json=payload,
-            timeout=15,
-        )
-        resp.raise_for_status()
-        print(f"✓ Status no Notion atualizado com sucesso.")
-    except Exception as e:
-        print(f"✗ Erro ao atualizar status no Notion: {str(e)}")
+    notion_write_properties(page_id, {NOTION_STATUS_PROP: {"status": {"name": status_name}}})
 
 def notion_update_email(page_id: str, email: str) -> None:
     print(f"Atualizando e-mail da página {page_id} para {email}")
-    payload = {
-        "properties": {
-            NOTION_EMAIL_PROP: {
-                "email": email
-            }
-        }
-    }
-    try:
-        resp = httpx.patch(
-            f"https://api.notion.com/v1/pages/{page_id}",
-            headers=HEADERS_NOTION,
-            json=payload,
-            timeout=15,
-        )
-        resp.raise_for_status()
-        print(f"E-mail no Notion atualizado com sucesso: {resp.status_code}")
-    except Exception as e:
-        print(f"Erro ao atualizar e-mail no Notion: {str(e)}")
-        # Não levantar exceção para não parar o fluxo principal
+    # Erros não levantam exceção para não parar o fluxo principal
+    notion_write_properties(page_id, {NOTION_EMAIL_PROP: {"email": email}})
 
 def notion_create_page(
     name: str,
@@ -150,13 +352,15 @@ def notion_create_page(
     meeting_date: str,
     status: str
 ) -> str | None:
-    """Cria uma nova página no Notion para um novo lead com todos os detalhes."""
+    """Cria uma nova página no Notion para um novo lead com todos os detalhes.
+
+    Levanta NotionUnavailableError se o Notion estiver fora do ar; outros erros retornam None.
+    """
     print(f"Criando nova página no Notion para: {name}")
 
-    data_source_id = get_data_source_id(NOTION_DB)
+    data_source_id = get_data_source_id(current_tenant().notion_db)
     if not data_source_id:
-        print("❌ data_source_id indisponível")
-        return None
+        raise NotionUnavailableError("data_source_id indisponível")
 
     properties = {
         NOTION_NAME_PROP: {"title": [{"text": {"content": name}}]},
@@ -174,78 +378,117 @@ def notion_create_page(
     }
 
     try:
-        resp = httpx.post(
+        resp = _notion_request(
+            "POST",
             "https://api.notion.com/v1/pages",
-            headers=HEADERS_NOTION,
             json=payload,
-            timeout=15,
         )
         resp.raise_for_status()
         new_page_id = resp.json()["id"]
         print(f"✓ Nova página criada no Notion com sucesso: {new_page_id}")
         return new_page_id
+    except NotionUnavailableError as e:
+        print(f"✗ Notion indisponível ao criar página: {e}")
+        raise
     except Exception as e:
         print(f"✗ Erro ao criar página no Notion: {str(e)}")
         print(f"Payload enviado: {json.dumps(payload, indent=2)}")
         return None
 
-async def notion_update_page_property(page_id: str, property_name: str, property_type: str, value: any) -> bool:
-    """Atualiza uma propriedade específica de uma página no Notion."""
+async def notion_update_page_properties(page_id: str, properties: Dict[str, Any]) -> Dict[str, Any] | None:
+    """Atualiza várias propriedades de uma página em um único PATCH; retorna a página atualizada.
+
+    Escritas ainda no buffer para a mesma página vão junto (as propriedades informadas
+    aqui são mais novas e prevalecem); se o PATCH falhar, elas voltam para o buffer.
+    """
+    buffered = _write_buffer.take(page_id)
     try:
-        # Constrói o payload baseado no tipo da propriedade
-        if property_type == "url":
-            property_value = value if value else None
-        elif property_type == "select":
-            property_value = value
-        elif property_type == "rich_text":
-            property_value = value
-        else:
-            property_value = value
-        
-        payload = {
-            "properties": {
-                property_name: {
-                    property_type: property_value
-                }
-            }
-        }
-        
-        resp = httpx.patch(
+        resp = await current_tenant().notion.arequest(
+            "PATCH",
             f"https://api.notion.com/v1/pages/{page_id}",
-            headers=HEADERS_NOTION,
-            json=payload,
-            timeout=15,
+            json={"properties": {**buffered, **properties}},
         )
         resp.raise_for_status()
-        return True
+        return resp.json()
     except Exception as e:
-        print(f"❌ Erro ao atualizar propriedade {property_name} no Notion: {e}")
-        return False 
+        print(f"❌ Erro ao atualizar propriedades {list(properties)} no Notion: {e}")
+        if buffered:
+            _write_buffer.write(page_id, buffered)
+        return None
 
-def get_database_properties() -> Dict[str, Any] | None:
-    """Obtém o schema (properties) do database no Notion."""
-    try:
-        resp = httpx.get(
-            f"https://api.notion.com/v1/databases/{NOTION_DB}",
-            headers=HEADERS_NOTION,
-            timeout=15,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("properties", {})
-    except Exception as e:
-        print(f"❌ Erro ao obter schema do database: {e}")
+def _schema_source(force_refresh: bool = False) -> tuple[str, str, Dict[str, Any]] | None:
+    """Retorna (tipo, id, objeto) de onde vêm as properties.
+
+    Na API 2025-09-03 as properties ficam no data source; o database só as traz em
+    versões antigas. O resultado vem do cache de schema.
+    """
+    database_id = current_tenant().notion_db
+    database = _get_schema("databases", database_id, force_refresh=force_refresh)
+    if database is None:
         return None
+    if database.get("properties"):
+        return "databases", database_id, database
+    data_source_id = get_data_source_id(database_id)
+    if not data_source_id:
+        return None
+    data_source = _get_schema("data_sources", data_source_id, force_refresh=force_refresh)
+    if data_source is None:
+        return None
+    return "data_sources", data_source_id, data_source
+
+def get_database_properties(force_refresh: bool = False) -> Dict[str, Any] | None:
+    """Obtém o schema (properties) do database no Notion (com cache e TTL)."""
+    source = _schema_source(force_refresh=force_refresh)
+    if source is None:
+        return None
+    return source[2].get("properties", {})
+
+def _option_map(prop: Dict[str, Any]) -> Dict[str, str]:
+    prop_type = prop.get("type")
+    options = prop.get(prop_type, {}).get("options", []) if prop_type else []
+    return {opt.get("name"): opt.get("id") for opt in options if opt.get("name") and opt.get("id")}
+
+def get_option_ids(property_name: str, force_refresh: bool = False) -> Dict[str, str]:
+    """Mapa nome->id das opções de uma propriedade select/multi_select/status (do cache)."""
+    properties = get_database_properties(force_refresh=force_refresh) or {}
+    prop = properties.get(property_name)
+    if not prop:
+        return {}
+    return _option_map(prop)
+
+def get_test_option_ids() -> Dict[str, str]:
+    """IDs das opções "Sim"/"Não" de NOTION_TEST_PROP; variáveis de ambiente têm prioridade."""
+    resolved = {}
+    if NOTION_TEST_OPTION_ID_SIM:
+        resolved["Sim"] = NOTION_TEST_OPTION_ID_SIM
+    if NOTION_TEST_OPTION_ID_NAO:
+        resolved["Não"] = NOTION_TEST_OPTION_ID_NAO
+    if len(resolved) < 2:
+        option_ids = get_option_ids(NOTION_TEST_PROP)
+        for name in ("Sim", "Não"):
+            if name not in resolved and name in option_ids:
+                resolved[name] = option_ids[name]
+    return resolved
 
 def ensure_multi_select_options(property_name: str, desired_names: list[str]) -> Dict[str, str]:
     """Garante que as opções informadas existam na propriedade multi_select.
     Retorna um mapa nome->id das opções solicitadas (criando-as se necessário).
+    Quando todas já existem, a resposta sai do cache de schema, sem chamadas ao Notion.
     """
-    properties = get_database_properties()
-    if properties is None:
+    source = _schema_source()
+    if source is None:
         return {}
 
-    prop = properties.get(property_name)
+    prop = source[2].get("properties", {}).get(property_name)
+    name_to_id = _option_map(prop) if prop else {}
+    if prop and any(n not in name_to_id for n in desired_names):
+        # O cache pode estar desatualizado (opção criada por fora): confirma uma vez
+        source = _schema_source(force_refresh=True)
+        if source is None:
+            return {}
+        prop = source[2].get("properties", {}).get(property_name)
+        name_to_id = _option_map(prop) if prop else {}
+
     if not prop:
         print(f"❌ Propriedade '{property_name}' não encontrada no database")
         return {}
@@ -254,11 +497,10 @@ def ensure_multi_select_options(property_name: str, desired_names: list[str]) ->
         print(f"❌ Propriedade '{property_name}' não é do tipo multi_select (é {prop.get('type')})")
         return {}
 
-    options = prop.get("multi_select", {}).get("options", [])
-    name_to_id: Dict[str, str] = {opt.get("name"): opt.get("id") for opt in options if opt.get("name") and opt.get("id")}
-
     missing = [n for n in desired_names if n not in name_to_id]
     if missing:
+        kind, object_id, _ = source
+        options = prop.get("multi_select", {}).get("options", [])
         updated_options = options + [{"name": n} for n in missing]
         payload = {
             "properties": {
@@ -270,19 +512,21 @@ def ensure_multi_select_options(property_name: str, desired_names: list[str]) ->
             }
         }
         try:
-            resp = httpx.patch(
-                f"https://api.notion.com/v1/databases/{NOTION_DB}",
-                headers=HEADERS_NOTION,
+            resp = _notion_request(
+                "PATCH",
+                f"https://api.notion.com/v1/{kind}/{object_id}",
                 json=payload,
-                timeout=15,
             )
             resp.raise_for_status()
-            properties = get_database_properties() or {}
-            prop = properties.get(property_name, {})
-            options = prop.get("multi_select", {}).get("options", [])
-            name_to_id = {opt.get("name"): opt.get("id") for opt in options if opt.get("name") and opt.get("id")}
+            # A resposta do PATCH já traz o schema atualizado: vira o novo cache
+            _schema_cache.invalidate(f"{kind}:{object_id}")
+            updated = resp.json()
+            if updated.get("properties"):
+                _schema_cache.put(f"{kind}:{object_id}", updated)
+                prop = updated["properties"].get(property_name, {})
+                name_to_id = _option_map(prop)
             print(f"✓ Opções adicionadas à propriedade '{property_name}': {', '.join(missing)}")
         except Exception as e:
             print(f"❌ Erro ao atualizar opções da propriedade '{property_name}': {e}")
 
-    return {name: name_to_id.get(name) for name in desired_names if name in name_to_id}
\ No newline at end of file
+    return {name: name_to_id.get(name) for name in desired_names if name in name_to_id}
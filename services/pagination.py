@@ -0,0 +1,39 @@
+# services/pagination.py
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+# fetch(estado) -> (itens da página, estado da próxima página ou None se acabou)
+PageFetcher = Callable[[Any], Awaitable[Tuple[List[Any], Optional[Any]]]]
+
+
+async def prefetch_pages(fetch: PageFetcher, first_state: Any = None) -> AsyncIterator[List[Any]]:
+    """Gera as páginas de uma listagem, buscando a próxima enquanto a atual é consumida.
+
+    No máximo duas páginas ficam em memória (a atual e a pré-carregada), então o uso de
+    memória não cresce com o tamanho da listagem. Se o consumidor parar antes do fim, a
+    busca pendente é cancelada.
+    """
+    pending: Optional[asyncio.Task] = asyncio.ensure_future(fetch(first_state))
+    try:
+        while pending is not None:
+            items, next_state = await pending
+            pending = asyncio.ensure_future(fetch(next_state)) if next_state is not None else None
+            yield items
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+async def prefetch_items(fetch: PageFetcher, first_state: Any = None) -> AsyncIterator[Any]:
+    """Como `prefetch_pages`, mas gera item por item."""
+    pages = prefetch_pages(fetch, first_state)
+    try:
+        async for items in pages:
+            for item in items:
+                yield item
+    finally:
+        await pages.aclose()
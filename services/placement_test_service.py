@@ -1,16 +1,28 @@
 # services/placement_test_service.py
 import httpx
 import asyncio
-from typing import List, Dict, Any, Optional
+import os
+import socket
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
 from config import (
-    NOTION_TOKEN, NOTION_DB, FLEXGE_API_KEY, FLEXGE_BASE_URL, NOTION_LINK_PROP,
-    NOTION_TEST_PROP,
-    NOTION_STATUS_PROP, NOTION_IA_ATTENDANCE_PROP, NOTION_EMAIL_PROP, HEADERS_NOTION
+    NOTION_DB, FLEXGE_API_KEY, FLEXGE_BASE_URL, NOTION_LINK_PROP, NOTION_TEST_PROP, NOTION_LEVEL_PROP, TZ
 )
-from services.notion_service import notion_find_page, notion_update_page_property, get_data_source_id
+from services.notion_service import notion_find_page, notion_pending_overlay, notion_update_page_properties
+from services.notion_client import notion_client
+from services.resilience import CircuitOpenError
+from services.flexge_client import flexge_client, normalize_email
+from services.check_schedule_service import is_due, load_schedule, record_check
+from services.lead_sync_service import get_lead, list_active_leads, sync_leads, upsert_page
+from services.sweep_run_service import (
+    COMPLETED, INTERRUPTED, OUTCOME_ERROR, OUTCOME_NO_TEST, OUTCOME_SKIPPED, OUTCOME_TEST_DONE,
+    finish_run, record_item, start_or_resume_run,
+)
+
+class PlacementUpstreamError(Exception):
+    """Flexge ou Notion responderam com erro ao atualizar um lead (o endpoint responde 502)."""
 
-# Nomes das propriedades no Notion
-NOTION_LEVEL_PROP = "Nível Flexge"
 
 class PlacementTestService:
     def __init__(self):
@@ -42,306 +54,256 @@ class PlacementTestService:
             return s.replace("mailto:", "").strip()
         return s
         
-    async def get_all_emails_from_notion(self) -> List[str]:
-        """Busca todos os emails do database do Notion, aplicando filtros para otimização."""
+    @staticmethod
+    def _lead_last_activity(lead: Dict[str, Any]) -> float | None:
+        """Timestamp mais recente entre a criação da página e a data da reunião agendada."""
+        candidates = [lead["created_time"]] if lead.get("created_time") else []
         try:
-            data_source_id = get_data_source_id(self.notion_db)
-            if not data_source_id:
-                print("❌ data_source_id indisponível para Notion")
-                return []
-            url = f"https://api.notion.com/v1/data_sources/{data_source_id}/query"
-            headers = HEADERS_NOTION
-            
-            # Filtros por Status ativos
-            filters = {
-                "filter": {
-                    "or": [
-                        {"property": NOTION_STATUS_PROP, "status": {"equals": "Em atendimento pela IA"}},
-                        {"property": NOTION_STATUS_PROP, "status": {"equals": "Qualificado pela IA"}},
-                        {"property": NOTION_STATUS_PROP, "status": {"equals": "Já entrei em contato"}},
-                        {"property": NOTION_STATUS_PROP, "status": {"equals": "Agendado reunião"}},
-                        {"property": NOTION_STATUS_PROP, "status": {"equals": "Reunião Realizada"}},
-                        {"property": NOTION_STATUS_PROP, "status": {"equals": "Aguardando resposta"}},
-                    ]
-                }
-            }
-            
-            all_emails = []
-            start_cursor = None
-            
-            while True:
-                payload = {"page_size": 100, **filters}
-                if start_cursor:
-                    payload["start_cursor"] = start_cursor
-                
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(url, headers=headers, json=payload)
-                    response.raise_for_status()
-                    data = response.json()
-                
-                results = data.get("results") or []
-                if not results:
-                    break
-                
-                for page in results:
-                    properties = page.get("properties", {})
-                    email_prop = properties.get(NOTION_EMAIL_PROP, {})
-                    if email_prop.get("type") == "email" and email_prop.get("email"):
-                        all_emails.append(email_prop["email"])
-                
-                if not data.get("has_more"):
-                    break
-                start_cursor = data.get("next_cursor")
-            
-            print(f"✓ Encontrados {len(all_emails)} emails no Notion")
-            return all_emails
-            
-        except Exception as e:
-            print(f"❌ Erro ao buscar emails do Notion: {e}")
-            return []
-    
-    async def check_placement_test_status(self, email: str) -> Optional[Dict[str, Any]]:
-        """Verifica o status do teste de nivelamento para um email específico, buscando em todas as páginas."""
+            # Mesmo formato gravado por format_pt_br
+            meeting = datetime.strptime(lead.get("meeting_date") or "", "%d/%m/%Y as %H:%M")
+            candidates.append(TZ.localize(meeting).timestamp())
+        except ValueError:
+            pass
+        return max(candidates) if candidates else None
+
+    async def check_placement_test_status(
+        self, email: str, index: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Verifica o status do teste de nivelamento para um email específico.
+
+        Com `index` (ver `FlexgeClient.build_email_index`) a consulta é local; sem ele a
+        listagem do Flexge é percorrida até achar o teste.
+        """
+        if index is not None:
+            return index.get(normalize_email(email))
         try:
-            headers = {
-                "accept": "application/json",
-                "x-api-key": self.api_key
-            }
-            
-            def normalize_email(e: str | None) -> str:
-                s = (e or "").strip().lower()
-                # Normalização simples para gmail: remove sufixo +tag e pontos na parte local
-                if "@gmail.com" in s:
-                    local, _, domain = s.partition("@")
-                    local = local.split("+")[0].replace(".", "")
-                    return f"{local}@{domain}"
-                return s
-            
-            target_email = normalize_email(email)
-            
-            page = 1
-            has_more = True
-            next_cursor = None
-            pages_visited = 0
-            
             async with httpx.AsyncClient() as client:
-                while True:
-                    params = f"page={page}&sort=createdAt&order=desc"
-                    if next_cursor:
-                        params += f"&cursor={next_cursor}"
-                    url = f"{self.base_url}?{params}"
-                    print(f"🔍 Buscando na página {page} (ordem desc) para {email}")
-                    
-                    response = await client.get(url, headers=headers)
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    # Suporta formatos { data: [...] } e { docs: [...], total: N }
-                    tests = data.get("data")
-                    if tests is None:
-                        tests = data.get("docs")
-                    if tests is None:
-                        tests = []
-                    
-                    if not tests:
-                        # Página vazia: encerramos a paginação
-                        break
-                    pages_visited += 1
-                    
-                    try:
-                        tests = sorted(
-                            tests,
-                            key=lambda t: (t.get("createdAt") or t.get("updatedAt") or ""),
-                            reverse=True,
-                        )
-                    except Exception:
-                        pass
-                    
-                    # Filtros de consistência
-                    def is_completed_valid(t: Dict[str, Any]) -> bool:
-                        if t.get("deleted") is True:
-                            return False
-                        # Alguns payloads não possuem `type`; se houver, validar PLACEMENT
-                        t_type = (t.get("type") or "").upper()
-                        if t_type and t_type != "PLACEMENT":
-                            return False
-                        student = t.get("student", {})
-                        if student.get("deleted") is True:
-                            return False
-                        if not t.get("completedAt"):
-                            return False
-                        return True
-                    
-                    # 1) Preferir placement-only
-                    for test in tests:
-                        if not is_completed_valid(test):
-                            continue
-                        student = test.get("student", {})
-                        if normalize_email(student.get("email")) == target_email and student.get("isPlacementTestOnly") is True:
-                            print(f"✅ Teste placement-only CONCLUÍDO encontrado para {email} na página {page}")
-                            return test
-                    
-                    # 2) Fallback concluído
-                    for test in tests:
-                        if not is_completed_valid(test):
-                            continue
-                        student = test.get("student", {})
-                        if normalize_email(student.get("email")) == target_email:
-                            print(f"✅ Fallback: teste CONCLUÍDO encontrado para {email} na página {page}")
-                            return test
-                    
-                    # Avança paginação
-                    has_more = data.get("has_more") or data.get("hasMore") or False
-                    next_cursor = data.get("next_cursor") or data.get("nextCursor")
-                    page += 1
-                    
-                    if not has_more and not next_cursor:
-                        # Se não há pistas de continuidade, paramos quando a próxima vier vazia
-                        pass
-                    
-                    if page > 200:
-                        print(f"⚠️ Limite de páginas atingido para {email}")
-                        break
-                    await asyncio.sleep(0.1)
-            
-            print(f"ℹ️ Nenhum teste CONCLUÍDO encontrado para {email} após verificar {pages_visited} página(s)")
-            return None
-            
+                test = await flexge_client.find_test(client, email)
+            if test is None:
+                print(f"ℹ️ Nenhum teste CONCLUÍDO encontrado para {email}")
+            return test
         except Exception as e:
             print(f"❌ Erro ao verificar teste para {email}: {e}")
             return None
     
     async def update_notion_test_status(self, page_id: str, test_data: Optional[Dict[str, Any]]) -> bool:
-        """Atualiza o status do teste no Notion."""
+        """Atualiza o status do teste no Notion (link, nível e checkbox em um único PATCH)."""
         # Observação: a propriedade "Teste de Nivelamento" é do tipo checkbox
         # True = fez o teste | False = não fez (mantemos "Nível Flexge" como "Pendente")
+        properties: Dict[str, Any] = {}
+        if test_data:
+            # Constrói o link do teste usando o ID
+            test_id = test_data.get("id")
+            if test_id:
+                properties[NOTION_LINK_PROP] = {"url": f"https://app.flexge.com/placement-tests/{test_id}"}
+
+            # Verifica se tem nível alcançado
+            reached_level = test_data.get("reachedLevel", {})
+            if reached_level and not reached_level.get("deleted", True):
+                level_name = reached_level.get("course", {}).get("name", "")
+                if level_name:
+                    properties[NOTION_LEVEL_PROP] = {"rich_text": [{"text": {"content": level_name}}]}
+        else:
+            # Aluno não fez o teste: limpa o link e marca nível como Pendente
+            properties[NOTION_LINK_PROP] = {"url": None}
+            properties[NOTION_LEVEL_PROP] = {"rich_text": [{"text": {"content": "Pendente"}}]}
+        properties[NOTION_TEST_PROP] = {"checkbox": bool(test_data)}
+
+        page = await notion_update_page_properties(page_id, properties)
+        if page is None:
+            print(f"❌ Erro ao atualizar Notion para {page_id}")
+            return False
+
+        # A resposta do PATCH já traz a página atualizada: confirma sem uma nova leitura
+        cb = page.get("properties", {}).get(NOTION_TEST_PROP, {}).get("checkbox")
+        if cb is not bool(test_data):
+            print(f"⚠️ Aviso: '{NOTION_TEST_PROP}' não refletiu '{bool(test_data)}' após PATCH. Atual: {cb}")
+        print(f"✓ Status do teste atualizado para: {'Sim' if test_data else 'Não'}")
+        return True
+
+    async def _apply_result(self, lead: Dict[str, Any], test_data: Optional[Dict[str, Any]]) -> tuple:
+        """Grava o resultado no Notion se algo mudou; retorna (outcome, detalhe)."""
+        if not test_data and (lead["test_done"], lead["level"], lead["link"]) == (False, "Pendente", ""):
+            # Nada mudou: evita a escrita no Notion
+            return OUTCOME_NO_TEST, "sem alterações"
+        if not await self.update_notion_test_status(lead["page_id"], test_data):
+            return OUTCOME_ERROR, "falha ao atualizar o Notion"
+        if test_data:
+            return OUTCOME_TEST_DONE, test_data.get("id")
+        return OUTCOME_NO_TEST, None
+
+    async def _find_lead_test(self, email: str) -> Optional[Dict[str, Any]]:
+        """Teste de um lead usando o índice do Flexge; só lê as páginas mais novas que o índice."""
+        async with httpx.AsyncClient() as client:
+            built_at, index = await flexge_client.get_index(client)
+            test = index.get(normalize_email(email))
+            if test is None:
+                # Testes começados antes da leitura podem ter sido concluídos depois dela
+                test = await flexge_client.find_test(client, email, created_after=built_at - 3 * 3600)
+        return test
+
+    async def refresh_lead(self, email: str | None = None, page_id: str | None = None) -> Dict[str, Any]:
+        """Atualiza o teste de um único lead (por email ou page_id), sem rodar a varredura."""
+        if not self.enabled:
+            return {"success": False, "error": "PlacementTestService desabilitado: FLEXGE_API_KEY não configurada"}
+
+        lead = await asyncio.to_thread(get_lead, self.notion_db, page_id, email)
+        if lead is None:
+            if not page_id and email:
+                page_id = await asyncio.to_thread(notion_find_page, email, "email")
+            if not page_id:
+                return {"success": False, "error": "Lead não encontrado no Notion"}
+            resp = await notion_client.arequest("GET", f"https://api.notion.com/v1/pages/{page_id}")
+            if resp.status_code == 404:
+                return {"success": False, "error": "Lead não encontrado no Notion"}
+            if resp.status_code != 200:
+                raise PlacementUpstreamError(f"Notion respondeu {resp.status_code} ao ler a página {page_id}")
+            page = notion_pending_overlay(resp.json())
+            lead = await asyncio.to_thread(upsert_page, self.notion_db, page)
+
+        clean_email = self._sanitize_email(lead.get("email") or email)
+        if not clean_email:
+            return {"success": False, "page_id": lead["page_id"], "error": "Lead sem email"}
+
+        print(f"🔍 Atualizando teste de nivelamento de {clean_email}")
         try:
-            if test_data:
-                # Aluno fez o teste
-                test_status = "Sim"
-                
-                # Constrói o link do teste usando o ID
-                test_id = test_data.get("id")
-                if test_id:
-                    test_url = f"https://app.flexge.com/placement-tests/{test_id}"
-                    # Atualiza o link do teste
-                    await notion_update_page_property(
-                        page_id, 
-                        NOTION_LINK_PROP, 
-                        "url", 
-                        test_url
-                    )
-                    print(f"✓ Link do teste atualizado: {test_url}")
-                
-                # Verifica se tem nível alcançado
-                reached_level = test_data.get("reachedLevel", {})
-                if reached_level and not reached_level.get("deleted", True):
-                    course = reached_level.get("course", {})
-                    level_name = course.get("name", "")
-                    if level_name:
-                        # Atualiza o nível
-                        await notion_update_page_property(
-                            page_id, 
-                            NOTION_LEVEL_PROP, 
-                            "rich_text", 
-                            [{"text": {"content": level_name}}]
-                        )
-                        print(f"✓ Nível atualizado para {level_name}")
-            else:
-                # Aluno não fez o teste
-                test_status = "Não"
-                # Limpa o link se não fez o teste
-                await notion_update_page_property(
-                    page_id, 
-                    NOTION_LINK_PROP, 
-                    "url", 
-                    ""
-                )
-                # Marca nível como Pendente
-                await notion_update_page_property(
-                    page_id,
-                    NOTION_LEVEL_PROP,
-                    "rich_text",
-                    [{"text": {"content": "Pendente"}}]
-                )
-            
-            # Atualiza a propriedade como checkbox (True para Sim, False para Não)
-            await notion_update_page_property(
-                page_id,
-                NOTION_TEST_PROP,
-                "checkbox",
-                (test_status == "Sim")
+            test_data = await self._find_lead_test(clean_email)
+        except (httpx.HTTPError, CircuitOpenError) as e:
+            raise PlacementUpstreamError(f"Erro ao consultar o Flexge: {e}") from e
+        outcome, detail = await self._apply_result(lead, test_data)
+        if outcome != OUTCOME_ERROR:
+            schedule = (await asyncio.to_thread(load_schedule, [lead["page_id"]])).get(lead["page_id"])
+            await asyncio.to_thread(
+                record_check, lead["page_id"], clean_email, bool(test_data),
+                self._lead_last_activity(lead), schedule,
             )
+        return {
+            "success": outcome != OUTCOME_ERROR,
+            "page_id": lead["page_id"],
+            "email": clean_email,
+            "outcome": outcome,
+            "detail": detail,
+        }
 
-            # Confirma a atualização lendo a página
-            try:
-                headers = {
-                    "Authorization": f"Bearer {NOTION_TOKEN}",
-                    "Content-Type": "application/json",
-                    "Notion-Version": "2022-06-28",
-                }
-                async with httpx.AsyncClient() as client:
-                    resp = await client.get(f"https://api.notion.com/v1/pages/{page_id}", headers=headers)
-                    resp.raise_for_status()
-                    data = resp.json()
-                    cb = data.get("properties", {}).get(NOTION_TEST_PROP, {}).get("checkbox")
-                    expected = (test_status == "Sim")
-                    if cb is expected:
-                        print(f"✓ Confirmação: '{NOTION_TEST_PROP}' (checkbox) atualizado para {expected}.")
-                    else:
-                        print(f"⚠️ Aviso: '{NOTION_TEST_PROP}' não refletiu '{expected}' após PATCH. Atual: {cb}")
-            except Exception as confirm_err:
-                print(f"⚠️ Erro ao confirmar atualização de '{NOTION_TEST_PROP}': {confirm_err}")
-            
-            print(f"✓ Status do teste atualizado para: {test_status}")
-            return True
-            
+    async def _process_page(
+        self, run_id: int, lead: Dict[str, Any], schedule: Dict[str, Any] | None,
+        index: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> None:
+        """Verifica o teste de um lead, grava o resultado na execução e agenda a próxima verificação."""
+        page_id = lead["page_id"]
+        clean_email = self._sanitize_email(lead.get("email"))
+        if not clean_email:
+            await asyncio.to_thread(record_item, run_id, page_id, None, OUTCOME_SKIPPED, "sem email")
+            return
+
+        try:
+            print(f"🔍 Verificando: {clean_email}")
+            # Verifica o status do teste
+            test_data = await self.check_placement_test_status(clean_email, index)
+            # Atualiza o Notion
+            outcome, detail = await self._apply_result(lead, test_data)
         except Exception as e:
-            print(f"❌ Erro ao atualizar Notion para {page_id}: {e}")
+            print(f"❌ Erro ao processar {clean_email}: {e}")
+            outcome, detail = OUTCOME_ERROR, str(e)
+
+        if outcome != OUTCOME_ERROR:
+            await asyncio.to_thread(
+                record_check, page_id, clean_email, outcome == OUTCOME_TEST_DONE,
+                self._lead_last_activity(lead), schedule,
+            )
+        await asyncio.to_thread(record_item, run_id, page_id, clean_email, outcome, detail)
+        # Pequena pausa para não sobrecarregar a API
+        await asyncio.sleep(0.5)
+
+    @staticmethod
+    def _needs_check(lead: Dict[str, Any], schedule: Dict[str, Any] | None, force: bool) -> bool:
+        """Leads com teste concluído no Notion não são verificados de novo, salvo `force`."""
+        if force:
+            return True
+        if lead["test_done"] and lead["level"] and lead["level"] != "Pendente":
             return False
-    
-    async def process_all_students(self) -> None:
-        """Processa todos os alunos verificando seus testes de nivelamento."""
+        return is_due(schedule)
+
+    async def _sweep(self, run: Dict[str, Any], force: bool = False) -> None:
+        """Sincroniza a cópia local dos leads e percorre os ativos a partir do cursor da execução."""
+        await sync_leads(self.notion_db)
+
+        after = run["last_page_id"]
+        not_due = 0
+        # Índice email → teste do Flexge, montado uma única vez (só se algum lead precisar)
+        index: Optional[Dict[str, Dict[str, Any]]] = None
+        while True:
+            leads = await asyncio.to_thread(list_active_leads, self.notion_db, after, 100)
+            if not leads:
+                break
+            schedules = await asyncio.to_thread(load_schedule, [lead["page_id"] for lead in leads])
+            for lead in leads:
+                schedule = schedules.get(lead["page_id"])
+                if not self._needs_check(lead, schedule, force):
+                    not_due += 1
+                    continue
+                if index is None:
+                    async with httpx.AsyncClient() as client:
+                        index = await flexge_client.build_email_index(client)
+                await self._process_page(run["id"], lead, schedule, index)
+            after = leads[-1]["page_id"]
+
+        print(f"ℹ️ {not_due} lead(s) fora da janela de verificação ou com teste já concluído")
+
+    async def process_all_students(
+        self, force: bool = False, on_run: Optional[Callable[[Dict[str, Any]], Any]] = None
+    ) -> Optional[int]:
+        """Processa os alunos cuja verificação venceu (`force=True` verifica todos).
+
+        O progresso fica gravado em `placement_sweep_runs`: se a instância cair no meio,
+        a próxima execução retoma a partir do último lead concluído. A agenda de cada
+        lead fica em `placement_checks` (recentes com frequência, antigos com back-off,
+        concluídos nunca).
+
+        `on_run` recebe a execução assim que ela é aberta (ou retomada). Retorna o id
+        da execução, ou None se outra já estava em andamento.
+        """
         if not self.enabled:
             print("⚠️ PlacementTestService desabilitado. Verificação de testes não executada.")
-            return
-            
-        print("🔄 Iniciando verificação de testes de nivelamento...")
-        
-        # Busca todos os emails do Notion
-        emails = await self.get_all_emails_from_notion()
-        if not emails:
-            print("⚠️ Nenhum email encontrado no Notion")
-            return
-        
-        print(f"📧 Verificando {len(emails)} emails...")
-        
-        # Para cada email, verifica o status do teste
-        for email in emails:
-            try:
-                clean_email = self._sanitize_email(email)
-                print(f"🔍 Verificando: {clean_email}")
-                
-                # Busca a página no Notion pelo email
-                page_id = notion_find_page(clean_email, "email")
-                if not page_id:
-                    print(f"⚠️ Página não encontrada para {clean_email}")
-                    continue
-                
-                # Verifica o status do teste
-                test_data = await self.check_placement_test_status(clean_email)
-                
-                # Atualiza o Notion
-                await self.update_notion_test_status(page_id, test_data)
-                
-                # Pequena pausa para não sobrecarregar a API
-                await asyncio.sleep(0.5)
-                
-            except Exception as e:
-                print(f"❌ Erro ao processar {email}: {e}")
-                continue
-        
-        print("✅ Verificação de testes concluída!")
+            return None
+
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        run = await asyncio.to_thread(start_or_resume_run, owner, self.notion_db)
+        if run is None:
+            print("⏭️ Outra verificação de testes está em andamento; execução ignorada")
+            return None
+        if on_run is not None:
+            await asyncio.to_thread(on_run, run)
+
+        if run["resumes"]:
+            print(f"↩️ Retomando verificação de testes #{run['id']} ({run['processed']} leads já processados)")
+        else:
+            print(f"🔄 Iniciando verificação de testes de nivelamento (#{run['id']})...")
+
+        try:
+            await self._sweep(run, force)
+        except (Exception, asyncio.CancelledError) as e:
+            # Fica marcada como interrompida; a próxima execução continua do cursor salvo
+            reason = str(e) or type(e).__name__
+            await asyncio.to_thread(finish_run, run["id"], INTERRUPTED, reason)
+            print(f"❌ Verificação de testes #{run['id']} interrompida: {reason}")
+            raise
+
+        await asyncio.to_thread(finish_run, run["id"], COMPLETED)
+        print(f"✅ Verificação de testes #{run['id']} concluída!")
+        return run["id"]
 
 # Instância global do serviço
 placement_test_service = PlacementTestService()
+
+async def run_lead_refresh(email: str | None = None, page_id: str | None = None) -> None:
+    """Job agendado após a confirmação da reunião (que envia o link do teste)."""
+    await placement_test_service.refresh_lead(email=email, page_id=page_id)
+
+async def run_placement_sweep() -> None:
+    """Ponto de entrada do job agendado.
+
+    O jobstore guarda uma referência textual à função; um método ligado à instância
+    não sobrevive à serialização, então o job aponta para esta função de módulo.
+    """
+    await placement_test_service.process_all_students()
@@ -0,0 +1,263 @@
+# services/profiling_service.py
+import heapq
+import itertools
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from types import CodeType
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.job import Job
+from apscheduler.util import iscoroutinefunction_partial
+from config import PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS, PROFILE_KEEP, PROFILE_MAX_DEPTH, TZ
+
+
+class _Session:
+    """Uma execução sendo amostrada (webhook ou job)."""
+
+    def __init__(self, name: str, thread_id: int, root_code: Optional[CodeType]):
+        self.name = name
+        self.thread_id = thread_id
+        # Em corrotinas a thread é a do event loop: só contam as amostras cuja pilha passa
+        # pela função raiz (as demais são de outras tasks ou do loop esperando I/O)
+        self.root_code = root_code
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.active_samples = 0
+        self.upstream: Dict[str, Dict[str, float]] = {}
+
+    def add_upstream(self, name: str, seconds: float) -> None:
+        entry = self.upstream.setdefault(name, {"seconds": 0.0, "calls": 0})
+        entry["seconds"] += seconds
+        entry["calls"] += 1
+
+
+_current_session: ContextVar[Optional[_Session]] = ContextVar("profile_session", default=None)
+
+
+def record_upstream(name: str, seconds: float) -> None:
+    """Soma o tempo de uma chamada a upstream (Notion, Z-API...) à execução amostrada atual."""
+    session = _current_session.get()
+    if session is not None:
+        session.add_upstream(name, seconds)
+
+
+def _fold(frame, max_depth: int) -> str:
+    parts = []
+    while frame is not None and len(parts) < max_depth:
+        code = frame.f_code
+        parts.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+def _contains(frame, code: CodeType) -> bool:
+    while frame is not None:
+        if frame.f_code is code:
+            return True
+        frame = frame.f_back
+    return False
+
+
+class SamplingProfiler:
+    """
+    Profiler por amostragem, opcional, para webhooks e jobs lentos.
+
+    - Só uma fração (`sample_rate`) das execuções é amostrada; com 0 nada é feito.
+    - Uma thread lê a pilha da thread da execução a cada `interval` segundos
+      (`sys._current_frames`), sem instrumentar cada chamada.
+    - O tempo de parede é dividido em upstream (chamadas HTTP via circuit breaker),
+      CPU e o resto (rate limit, banco, locks).
+    - Ficam guardados só os `keep` perfis mais lentos.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        interval: float = PROFILE_INTERVAL_MS / 1000,
+        keep: int = PROFILE_KEEP,
+        max_depth: int = PROFILE_MAX_DEPTH,
+    ):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        self.max_depth = max_depth
+        self._sessions: List[_Session] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._ids = itertools.count(1)
+        # Min-heap por tempo de parede: o topo é o mais rápido, descartado primeiro
+        self._slowest: List[tuple] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def should_sample(self) -> bool:
+        """Sorteia se a próxima execução será amostrada (nunca dentro de outra amostrada)."""
+        return self.enabled and _current_session.get() is None and random.random() < self.sample_rate
+
+    # --- thread de amostragem ---
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                sessions = list(self._sessions)
+                if not sessions:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for session in sessions:
+                frame = frames.get(session.thread_id)
+                if frame is None:
+                    continue
+                session.samples += 1
+                if session.root_code is not None and not _contains(frame, session.root_code):
+                    continue
+                session.active_samples += 1
+                session.stacks[_fold(frame, self.max_depth)] += 1
+            del frames
+            time.sleep(self.interval)
+
+    # --- sessões ---
+    @contextmanager
+    def session(self, name: str, root_code: Optional[CodeType] = None) -> Iterator[_Session]:
+        """Amostra o bloco (rodando na thread atual) e guarda o perfil se estiver entre os mais lentos."""
+        session = _Session(name, threading.get_ident(), root_code)
+        token = _current_session.set(session)
+        with self._lock:
+            self._sessions.append(session)
+            self._ensure_thread()
+        started_at = time.time()
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield session
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            with self._lock:
+                self._sessions.remove(session)
+            _current_session.reset(token)
+            if root_code is not None:
+                # A thread do loop também executa outras tasks: estima pela fração de amostras ativas
+                cpu = self.interval * session.active_samples
+            self._store(session, started_at, wall, cpu)
+
+    def _store(self, session: _Session, started_at: float, wall: float, cpu: float) -> None:
+        upstream = sum((u["seconds"] for u in session.upstream.values()), 0.0)
+        cpu = min(cpu, max(wall - upstream, 0.0))
+        profile = {
+            "id": next(self._ids),
+            "name": session.name,
+            "started_at": datetime.fromtimestamp(started_at, tz=TZ).isoformat(),
+            "wall_seconds": round(wall, 4),
+            "upstream_seconds": round(upstream, 4),
+            "cpu_seconds": round(cpu, 4),
+            "other_seconds": round(max(wall - upstream - cpu, 0.0), 4),
+            "upstream": {
+                name: {"seconds": round(u["seconds"], 4), "calls": int(u["calls"])}
+                for name, u in sorted(session.upstream.items(), key=lambda item: -item[1]["seconds"])
+            },
+            "samples": session.samples,
+            "interval_ms": self.interval * 1000,
+            "stacks": dict(session.stacks),
+        }
+        with self._lock:
+            entry = (wall, profile["id"], profile)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            elif wall > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+        print(
+            f"🔬 Perfil {profile['id']} ({session.name}): {wall:.2f}s "
+            f"(upstream {upstream:.2f}s, CPU {cpu:.2f}s)"
+        )
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """`func` (síncrona) amostrada com probabilidade `sample_rate`; para rodar em outra thread."""
+        if not self.should_sample():
+            return func
+
+        def profiled(*args, **kwargs):
+            with self.session(name):
+                return func(*args, **kwargs)
+        return profiled
+
+    async def run_async(self, name: str, coro: Awaitable, root_code: Optional[CodeType]) -> Any:
+        """Aguarda a corrotina dentro de uma sessão (a decisão de amostrar é de quem chama)."""
+        with self.session(name, root_code=root_code):
+            return await coro
+
+    # --- consulta ---
+    def profiles(self) -> List[Dict[str, Any]]:
+        """Resumo dos perfis guardados, do mais lento para o mais rápido."""
+        with self._lock:
+            entries = sorted(self._slowest, reverse=True)
+        return [{k: v for k, v in p.items() if k != "stacks"} for _, _, p in entries]
+
+    def get(self, profile_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return next((p for _, _, p in self._slowest if p["id"] == profile_id), None)
+
+    @staticmethod
+    def folded(profile: Dict[str, Any]) -> str:
+        """Pilhas no formato "folded" (flamegraph.pl, speedscope, inferno)."""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(profile["stacks"].items()))
+
+
+# Instância compartilhada do processo
+profiler = SamplingProfiler()
+
+
+class _ProfiledJob:
+    """Vista de um job do APScheduler com `func` trocada pela versão amostrada."""
+
+    def __init__(self, job: Job, func: Callable):
+        self._job = job
+        self.func = func
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._job, name)
+
+
+def _job_name(job: Job) -> str:
+    """Nome do perfil pela função do job, não pelo id (ids podem levar o e-mail do lead)."""
+    ref = job.func_ref
+    # Jobs de tenants adicionais rodam via run_in_tenant(tenant, func_ref, ...)
+    if ref.rsplit(":", 1)[-1] in ("run_in_tenant", "run_in_tenant_async") and len(job.args) >= 2:
+        ref = str(job.args[1])
+    return f"job:{ref.rsplit(':', 1)[-1]}"
+
+
+def profiled_job(job: Job) -> Any:
+    """O próprio job ou, se sorteado, uma vista dele cuja execução é amostrada."""
+    if not profiler.should_sample():
+        return job
+    name = _job_name(job)
+    func = job.func
+    if iscoroutinefunction_partial(func):
+        root_code = getattr(func, "__code__", None)
+
+        async def profiled(*args, **kwargs):
+            return await profiler.run_async(name, func(*args, **kwargs), root_code)
+    else:
+        def profiled(*args, **kwargs):
+            with profiler.session(name):
+                return func(*args, **kwargs)
+    return _ProfiledJob(job, profiled)
+
+
+class ProfilingAsyncIOExecutor(AsyncIOExecutor):
+    """Executor padrão do scheduler: igual ao AsyncIOExecutor, com amostragem dos jobs."""
+
+    def _do_submit_job(self, job, run_times):
+        super()._do_submit_job(profiled_job(job), run_times)
@@ -0,0 +1,55 @@
+# services/queue_handlers.py
+import asyncio
+from typing import Any, Dict
+from app_scheduler import jobstores, scheduler
+from config import WEBHOOK_DEADLINE_SECONDS
+from models import CalWebhookPayload
+from services.admin_job_service import (
+    NOTION_API_CHECK, PLACEMENT_SWEEP, SCHEDULE_LEAD_MESSAGES, WEBHOOK_REPLAY,
+    handle_notion_api_check, handle_placement_sweep, handle_schedule_lead_messages, handle_webhook_replay,
+)
+from services.booking_service import process_booking
+from services.jobstore import JOBSTORE_RELOAD, HybridJobStore
+from services.profiling_service import profiler
+from services.queue_service import register_handler
+from services.resilience import deadline_budget
+from services.tenant_service import DEFAULT_TENANT, TENANT_PAYLOAD_KEY, get_tenant, tenant_scope
+from services.webhook_log_service import EVENT_PAYLOAD_KEY, mark_processed
+
+
+def handle_cal_booking(payload: Dict[str, Any]) -> dict:
+    """Processa um webhook do Cal.com enfileirado pelo processo web."""
+    payload = dict(payload)
+    tenant_id = payload.pop(TENANT_PAYLOAD_KEY, DEFAULT_TENANT)
+    event_id = payload.pop(EVENT_PAYLOAD_KEY, None)
+    tenant = get_tenant(tenant_id)
+    if tenant is None:
+        raise ValueError(f"Tenant '{tenant_id}' não configurado neste processo")
+    data = CalWebhookPayload.model_validate(payload)
+    with tenant_scope(tenant), deadline_budget(WEBHOOK_DEADLINE_SECONDS):
+        result = profiler.wrap(f"webhook:{data.trigger_event}", process_booking)(scheduler, data)
+    mark_processed(event_id)
+    return result
+
+
+async def handle_jobstore_reload(payload: Dict[str, Any]) -> dict:
+    """Jobs gravados direto na tabela por outro processo (backfill/replay pela linha de comando)."""
+    store = jobstores['default']
+    loaded = None
+    if isinstance(store, HybridJobStore):
+        # O híbrido só lê a tabela na partida: carrega os jobs na memória (no event loop)
+        rows = await asyncio.to_thread(store.read_jobs, payload["job_ids"])
+        loaded = store.load_jobs(rows)
+    # O próximo horário pode ser anterior ao que o scheduler estava esperando
+    scheduler.wakeup()
+    return {"jobs": len(payload["job_ids"]), "loaded": loaded}
+
+
+def register_queue_handlers() -> None:
+    register_handler("cal_booking", handle_cal_booking)
+    register_handler(JOBSTORE_RELOAD, handle_jobstore_reload)
+    # Jobs administrativos (endpoints de teste): a varredura não segura o lote da fila
+    register_handler(PLACEMENT_SWEEP, handle_placement_sweep, background=True)
+    register_handler(NOTION_API_CHECK, handle_notion_api_check)
+    register_handler(SCHEDULE_LEAD_MESSAGES, handle_schedule_lead_messages)
+    register_handler(WEBHOOK_REPLAY, handle_webhook_replay, background=True)
@@ -0,0 +1,305 @@
+# services/queue_service.py
+import asyncio
+import contextvars
+import inspect
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+from sqlalchemy import Column, Float, Integer, String, Table, Text, select
+from config import QUEUE_BATCH_SIZE, QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS, WORKER_POLL_SECONDS
+from database import execute_async, get_engine, metadata
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Fila durável compartilhada entre o processo web (que enfileira) e o worker (que executa)
+work_queue = Table(
+    "work_queue",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("kind", String(64), nullable=False),
+    Column("payload", Text, nullable=False),
+    Column("status", String(16), nullable=False, default=PENDING, index=True),
+    Column("attempts", Integer, nullable=False, default=0),
+    Column("available_at", Float, nullable=False, index=True),
+    Column("locked_by", String(191)),
+    Column("locked_until", Float),
+    Column("created_at", Float, nullable=False),
+    Column("updated_at", Float, nullable=False),
+    Column("last_error", Text),
+    # Resultado final; enquanto o item roda, guarda o último progresso informado
+    Column("result", Text),
+)
+
+Handler = Callable[[Dict[str, Any]], Any]
+_handlers: Dict[str, Handler] = {}
+# Tipos demorados: rodam fora do lote do consumidor, renovando o lock enquanto executam
+_background_kinds: Set[str] = set()
+_background_tasks: Set[asyncio.Task] = set()
+# Item em execução no contexto atual (usado por `report_progress`)
+_current_item: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("queue_current_item", default=None)
+# Etapas já concluídas do item em execução, preservadas entre as tentativas
+_current_steps: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("queue_current_steps", default=None)
+
+
+def register_handler(kind: str, handler: Handler, background: bool = False) -> None:
+    """Registra a função que processa itens de um tipo (síncrona ou async).
+
+    Com `background=True` o item não segura o lote do consumidor: ele roda em uma
+    task própria e o lock é renovado até terminar (ex.: varredura de testes).
+    """
+    _handlers[kind] = handler
+    if background:
+        _background_kinds.add(kind)
+    else:
+        _background_kinds.discard(kind)
+
+
+def _insert_item(kind: str, payload: Dict[str, Any], delay_seconds: float):
+    now = time.time()
+    return work_queue.insert().values(
+        kind=kind,
+        payload=json.dumps(payload),
+        status=PENDING,
+        attempts=0,
+        available_at=now + delay_seconds,
+        created_at=now,
+        updated_at=now,
+    )
+
+
+def enqueue(kind: str, payload: Dict[str, Any], delay_seconds: float = 0) -> int:
+    """Grava um item na fila e retorna o id."""
+    with get_engine().begin() as conn:
+        return conn.execute(_insert_item(kind, payload, delay_seconds)).inserted_primary_key[0]
+
+
+async def enqueue_async(kind: str, payload: Dict[str, Any], delay_seconds: float = 0) -> int:
+    """`enqueue` para corrotinas (ingestão de webhooks), pelo driver assíncrono."""
+    return await execute_async(_insert_item(kind, payload, delay_seconds))
+
+
+def get_item(item_id: int) -> Optional[Dict[str, Any]]:
+    with get_engine().begin() as conn:
+        row = conn.execute(select(work_queue).where(work_queue.c.id == item_id)).mappings().first()
+    if row is None:
+        return None
+    item = dict(row)
+    item["payload"] = json.loads(item["payload"])
+    item["result"] = json.loads(item["result"]) if item["result"] else None
+    return item
+
+
+def claim(owner: str, limit: int = QUEUE_BATCH_SIZE) -> List[Dict[str, Any]]:
+    """Reserva até `limit` itens disponíveis para `owner` (um único worker por item).
+
+    Itens "running" cujo lock expirou (worker morreu) voltam a ser elegíveis.
+    """
+    engine = get_engine()
+    now = time.time()
+    with engine.begin() as conn:
+        # Escrita primeiro: no SQLite já pega o lock de escrita e serializa os workers
+        conn.execute(
+            work_queue.update()
+            .where(work_queue.c.status == RUNNING, work_queue.c.locked_until < now)
+            .values(status=PENDING, locked_by=None, locked_until=None, updated_at=now)
+        )
+        query = (
+            select(work_queue)
+            .where(work_queue.c.status == PENDING, work_queue.c.available_at <= now)
+            .order_by(work_queue.c.available_at, work_queue.c.id)
+            .limit(limit)
+        )
+        if engine.dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        rows = [dict(r) for r in conn.execute(query).mappings()]
+        if not rows:
+            return []
+        conn.execute(
+            work_queue.update()
+            .where(work_queue.c.id.in_([r["id"] for r in rows]))
+            .values(
+                status=RUNNING,
+                locked_by=owner,
+                locked_until=now + QUEUE_LEASE_SECONDS,
+                attempts=work_queue.c.attempts + 1,
+                updated_at=now,
+            )
+        )
+    for row in rows:
+        row["payload"] = json.loads(row["payload"])
+        row["attempts"] += 1
+    return rows
+
+
+def extend_lease(item_id: int, owner: str) -> bool:
+    """Renova o lock de um item em execução; False se ele não pertence mais a `owner`."""
+    now = time.time()
+    with get_engine().begin() as conn:
+        return conn.execute(
+            work_queue.update()
+            .where(work_queue.c.id == item_id, work_queue.c.status == RUNNING, work_queue.c.locked_by == owner)
+            .values(locked_until=now + QUEUE_LEASE_SECONDS, updated_at=now)
+        ).rowcount == 1
+
+
+def report_progress(progress: Dict[str, Any]) -> None:
+    """Grava o progresso do item em execução (chamado de dentro do handler)."""
+    item_id = _current_item.get()
+    if item_id is None:
+        return
+    with get_engine().begin() as conn:
+        conn.execute(
+            work_queue.update()
+            .where(work_queue.c.id == item_id, work_queue.c.status == RUNNING)
+            .values(result=json.dumps(progress, default=str), updated_at=time.time())
+        )
+
+
+def _saved_steps(result: Optional[str]) -> Dict[str, Any]:
+    """Etapas gravadas por `record_step` numa tentativa anterior (ficam em `result` até o fim)."""
+    try:
+        saved = json.loads(result) if result else None
+    except ValueError:
+        return {}
+    return dict(saved.get("steps") or {}) if isinstance(saved, dict) else {}
+
+
+def completed_step(name: str) -> Any:
+    """Valor gravado por `record_step` numa tentativa anterior deste item (None fora da fila)."""
+    steps = _current_steps.get()
+    return None if steps is None else steps.get(name)
+
+
+def record_step(name: str, value: Any = True) -> None:
+    """Marca uma etapa com efeito externo (ex.: mensagem enviada) como concluída.
+
+    Se o item falhar depois, a nova tentativa consulta `completed_step` e não repete a etapa.
+    Fora de um item da fila (processamento inline, replay) não faz nada.
+    """
+    steps = _current_steps.get()
+    if steps is None:
+        return
+    steps[name] = value
+    report_progress({"steps": steps})
+
+
+def _owned(item_id: int, owner: Optional[str]):
+    """Filtro do item; com `owner`, só enquanto o lock ainda for dele."""
+    clause = work_queue.c.id == item_id
+    if owner is not None:
+        clause = clause & (work_queue.c.status == RUNNING) & (work_queue.c.locked_by == owner)
+    return clause
+
+
+def complete(item_id: int, result: Any = None, owner: Optional[str] = None) -> None:
+    with get_engine().begin() as conn:
+        conn.execute(
+            work_queue.update().where(_owned(item_id, owner)).values(
+                status=DONE,
+                locked_by=None,
+                locked_until=None,
+                result=json.dumps(result, default=str) if result is not None else None,
+                updated_at=time.time(),
+            )
+        )
+
+
+def fail(item_id: int, attempts: int, error: str, owner: Optional[str] = None) -> None:
+    """Registra a falha; reagenda com back-off exponencial até QUEUE_MAX_ATTEMPTS."""
+    now = time.time()
+    final = attempts >= QUEUE_MAX_ATTEMPTS
+    with get_engine().begin() as conn:
+        conn.execute(
+            work_queue.update().where(_owned(item_id, owner)).values(
+                status=FAILED if final else PENDING,
+                locked_by=None,
+                locked_until=None,
+                available_at=now + min(2 ** attempts * 5, 3600),
+                last_error=error[:2000],
+                updated_at=now,
+            )
+        )
+
+
+async def _dispatch(item: Dict[str, Any]) -> Any:
+    handler = _handlers.get(item["kind"])
+    if handler is None:
+        raise RuntimeError(f"Nenhum handler registrado para '{item['kind']}'")
+    if inspect.iscoroutinefunction(handler):
+        return await handler(item["payload"])
+    return await asyncio.to_thread(handler, item["payload"])
+
+
+async def _keep_lease(item_id: int, owner: str, work: asyncio.Task) -> bool:
+    """Renova o lock enquanto `work` roda; se o lock foi perdido, cancela `work` e retorna True."""
+    while True:
+        await asyncio.sleep(QUEUE_LEASE_SECONDS / 3)
+        try:
+            if not await asyncio.to_thread(extend_lease, item_id, owner):
+                # Outro worker já pode ter pego o item: esta execução não deve continuar
+                print(f"⚠️ Item {item_id} perdeu o lock; execução cancelada")
+                work.cancel()
+                return True
+        except Exception as e:
+            print(f"⚠️ Erro ao renovar o lock do item {item_id}: {e}")
+
+
+async def _handle(item: Dict[str, Any], owner: str) -> None:
+    _current_item.set(item["id"])
+    _current_steps.set(_saved_steps(item.get("result")))
+    work = asyncio.create_task(_dispatch(item))
+    lease = (
+        asyncio.create_task(_keep_lease(item["id"], owner, work)) if item["kind"] in _background_kinds else None
+    )
+    try:
+        result = await work
+        # Só grava se o lock ainda for deste worker (handlers síncronos não param ao cancelar)
+        await asyncio.to_thread(complete, item["id"], result, owner)
+        print(f"✓ Item {item['id']} ({item['kind']}) processado")
+    except asyncio.CancelledError:
+        if lease is None or not lease.done() or lease.cancelled() or not lease.result():
+            raise
+        # Lock perdido: o resultado é descartado e o item fica com quem o pegou
+    except Exception as e:
+        print(f"❌ Erro ao processar item {item['id']} ({item['kind']}): {e}")
+        await asyncio.to_thread(fail, item["id"], item["attempts"], str(e), owner)
+    finally:
+        if lease is not None:
+            lease.cancel()
+        work.cancel()
+
+
+async def run_queue_consumer(owner: str, stop_event: asyncio.Event) -> None:
+    """Consome a fila até `stop_event` ser sinalizado."""
+    print(f"📥 Consumidor da fila iniciado ({owner})")
+    while not stop_event.is_set():
+        try:
+            items = await asyncio.to_thread(claim, owner)
+        except Exception as e:
+            print(f"❌ Erro ao buscar itens da fila: {e}")
+            items = []
+
+        batch = []
+        for item in items:
+            if item["kind"] in _background_kinds:
+                task = asyncio.create_task(_handle(item, owner))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+            else:
+                batch.append(_handle(item, owner))
+        await asyncio.gather(*batch)
+
+        if not items:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=WORKER_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    # Itens demorados ainda em execução ficam "running"; outro worker os retoma quando o lock expirar
+    for task in list(_background_tasks):
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    print("📥 Consumidor da fila encerrado")
@@ -0,0 +1,367 @@
+# services/resilience.py
+import httpx
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, Iterator, Optional
+from config import (
+    CIRCUIT_WINDOW_SIZE,
+    CIRCUIT_MIN_CALLS,
+    CIRCUIT_FAILURE_RATE,
+    CIRCUIT_OPEN_SECONDS,
+    CIRCUIT_HALF_OPEN_CALLS,
+)
+from services.profiling_service import record_upstream
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Levantada quando o circuito do upstream está aberto e a chamada é recusada."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuito '{name}' aberto; tente novamente em {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Levantada quando o orçamento de tempo da requisição atual acabou."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por upstream (closed/open/half-open).
+
+    Abre quando a taxa de falhas nas últimas `window_size` chamadas passa de
+    `failure_rate` (com pelo menos `min_calls` amostras). Depois de `open_seconds`
+    libera até `half_open_calls` chamadas de teste; se todas passarem, fecha.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = CIRCUIT_WINDOW_SIZE,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        failure_rate: float = CIRCUIT_FAILURE_RATE,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        half_open_calls: int = CIRCUIT_HALF_OPEN_CALLS,
+    ):
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self._lock = threading.Lock()
+        self._outcomes: Deque[bool] = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+            print(f"🟡 Circuito '{self.name}' em half-open: liberando chamadas de teste")
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        print(f"🔴 Circuito '{self.name}' ABERTO por {self.open_seconds:.0f}s")
+
+    def before_call(self) -> None:
+        """Reserva uma chamada ou levanta CircuitOpenError se o upstream estiver bloqueado."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == OPEN:
+                retry_after = self.open_seconds - (time.monotonic() - self._opened_at)
+                raise CircuitOpenError(self.name, max(retry_after, 0.0))
+            if self._state == HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_calls:
+                    raise CircuitOpenError(self.name, self.open_seconds)
+                self._half_open_in_flight += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+                self._half_open_successes += 1
+                if self._half_open_successes >= self.half_open_calls:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    print(f"🟢 Circuito '{self.name}' fechado novamente")
+                return
+            self._outcomes.append(True)
+
+    def release(self) -> None:
+        """Devolve a vaga de uma chamada interrompida (ex.: cancelada) sem contar resultado."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._open()
+                return
+            if self._state == OPEN:
+                return
+            self._outcomes.append(False)
+            calls = len(self._outcomes)
+            if calls >= self.min_calls:
+                failures = calls - sum(self._outcomes)
+                if failures / calls >= self.failure_rate:
+                    self._open()
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            self._maybe_half_open()
+            calls = len(self._outcomes)
+            return {
+                "state": self._state,
+                "calls": calls,
+                "failures": calls - sum(self._outcomes),
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Retorna (criando se necessário) o circuit breaker compartilhado de um upstream."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def breakers_snapshot() -> Dict[str, Dict[str, object]]:
+    with _breakers_lock:
+        items = list(_breakers.items())
+    return {name: breaker.snapshot() for name, breaker in items}
+
+
+# -----------------------------------------------------------------------------
+# Rate limit (token bucket + janela de concorrência) por upstream
+# -----------------------------------------------------------------------------
+def parse_retry_after(value: Optional[str]) -> float:
+    """Converte o header Retry-After (segundos ou data HTTP) em segundos."""
+    if not value:
+        return 1.0
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except Exception:
+        return 1.0
+
+
+class RateLimiter:
+    """
+    Token bucket + janela de concorrência AIMD, compartilhados entre threads e o event loop.
+    Usado pelos clientes do Notion (um por tenant) e do Flexge.
+
+    - Token bucket: no máximo `rate` req/s com rajadas de até `burst`.
+    - Retry-After: um 429 bloqueia todas as chamadas até o prazo informado.
+    - AIMD: cada 429 corta a janela pela metade; cada sucesso soma 1/janela.
+    """
+
+    def __init__(self, rate: float, burst: int, max_concurrency: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._window = float(max_concurrency)
+        self._in_flight = 0
+
+    # --- janela de concorrência ---
+    def _try_enter(self) -> bool:
+        with self._cond:
+            if self._in_flight < max(int(self._window), 1):
+                self._in_flight += 1
+                return True
+            return False
+
+    def enter(self) -> None:
+        with self._cond:
+            while self._in_flight >= max(int(self._window), 1):
+                self._cond.wait(0.5)
+            self._in_flight += 1
+
+    async def enter_async(self) -> None:
+        while not self._try_enter():
+            await asyncio.sleep(0.05)
+
+    def leave(self) -> None:
+        with self._cond:
+            self._in_flight = max(self._in_flight - 1, 0)
+            self._cond.notify()
+
+    # --- token bucket ---
+    def reserve(self) -> float:
+        """Reserva um token e retorna quantos segundos esperar antes de usar."""
+        with self._cond:
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            self._tokens -= 1.0
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(wait, self._blocked_until - now)
+
+    # --- feedback ---
+    def on_success(self) -> None:
+        with self._cond:
+            self._window = min(float(self.max_concurrency), self._window + 1.0 / self._window)
+            self._cond.notify()
+
+    def on_throttled(self, retry_after: float) -> None:
+        with self._cond:
+            self._window = max(1.0, self._window / 2)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            self._tokens = min(self._tokens, 0.0)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "window": round(self._window, 2),
+                "in_flight": self._in_flight,
+                "blocked_for": round(max(self._blocked_until - time.monotonic(), 0.0), 2),
+            }
+
+
+# -----------------------------------------------------------------------------
+# Orçamento de tempo (deadline) por requisição
+# -----------------------------------------------------------------------------
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline_budget(seconds: float) -> Iterator[None]:
+    """Define um prazo total para a cadeia de chamadas executada dentro do bloco.
+
+    Um prazo externo mais curto continua valendo (o menor vence).
+    """
+    new_deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        new_deadline = min(new_deadline, current)
+    token = _deadline.set(new_deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Segundos restantes do orçamento atual, ou None se não houver prazo."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def call_timeout(default: float) -> float:
+    """Timeout a usar na próxima chamada: o menor entre o padrão e o orçamento restante."""
+    remaining = remaining_budget()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        raise DeadlineExceeded("Orçamento de tempo da requisição esgotado")
+    return min(default, remaining)
+
+
+# -----------------------------------------------------------------------------
+# Requisições HTTP protegidas (breaker + orçamento de tempo)
+# -----------------------------------------------------------------------------
+def is_upstream_failure(status_code: int) -> bool:
+    """429 e 5xx contam como falha do upstream; demais 4xx são erro nosso."""
+    return status_code == 429 or status_code >= 500
+
+
+def guarded_request(
+    name: str, method: str, url: str, timeout: float, throttle_is_failure: bool = True,
+    client: Optional[httpx.Client] = None, **kwargs
+) -> httpx.Response:
+    """Faz uma requisição síncrona passando pelo circuit breaker de `name`.
+
+    Com `throttle_is_failure=False` um 429 não conta contra o circuito (quem chama
+    já trata o rate limit com back-off). Com `client`, reaproveita as conexões dele.
+    """
+    breaker = get_breaker(name)
+    request_timeout = call_timeout(timeout)
+    breaker.before_call()
+    started = time.perf_counter()
+    try:
+        resp = (client or httpx).request(method, url, timeout=request_timeout, **kwargs)
+    except Exception:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Cancelada (CancelledError, KeyboardInterrupt): sem resultado, mas libera a vaga do half-open
+        breaker.release()
+        raise
+    finally:
+        record_upstream(name, time.perf_counter() - started)
+    if resp.status_code == 429 and not throttle_is_failure:
+        breaker.record_success()
+    elif is_upstream_failure(resp.status_code):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return resp
+
+
+async def guarded_request_async(
+    client: httpx.AsyncClient, name: str, method: str, url: str, timeout: float,
+    throttle_is_failure: bool = True, **kwargs
+) -> httpx.Response:
+    """Versão assíncrona de `guarded_request`, reutilizando o client informado."""
+    breaker = get_breaker(name)
+    request_timeout = call_timeout(timeout)
+    breaker.before_call()
+    started = time.perf_counter()
+    try:
+        resp = await client.request(method, url, timeout=request_timeout, **kwargs)
+    except Exception:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Cancelada (CancelledError, KeyboardInterrupt): sem resultado, mas libera a vaga do half-open
+        breaker.release()
+        raise
+    finally:
+        record_upstream(name, time.perf_counter() - started)
+    if resp.status_code == 429 and not throttle_is_failure:
+        breaker.record_success()
+    elif is_upstream_failure(resp.status_code):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return resp
@@ -2,32 +2,38 @@
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.date import DateTrigger
+from config import PLACEMENT_REFRESH_DELAY_MINUTES, ADMIN_DIGEST_ENABLED, FLEXGE_API_KEY
 from services.whatsapp_service import send_wa_bulk, send_wa_message
+from services.tenant_service import add_tenant_job, current_tenant
 from services.zaia_context_service import ZaiaContextService
+from utils import notion_page_url, wa_me_link
 
 # Inicializa o serviço de contexto da Zaia
 zaia_context = ZaiaContextService()
 
 def schedule_messages(scheduler: AsyncIOScheduler, first_name: str, meeting_dt: datetime, page_id: str, whatsapp: str | None) -> None:
-    """Agenda lembretes para a equipe de vendas (admins) com links para Notion e WhatsApp."""
+    """Agenda lembretes para a equipe de vendas (admins) com links para Notion e WhatsApp.
+
+    Com ADMIN_DIGEST_ENABLED o lembrete das 8h não é agendado: a reunião entra no
+    resumo diário (admin_digest_service).
+    """
     meeting_str = meeting_dt.strftime("%H:%M")
-    notion_page_url = f"https://www.notion.so/{page_id.replace('-', '')}"
     
     # Monta a mensagem base - admins veem o nome completo
     base_message_8am = f"🔔 Lembrete de Reunião: Hoje temos um encontro com o lead *{first_name}* às *{meeting_str}*."
     base_message_1h = f"⏰ Atenção: A reunião com *{first_name}* começa em 1 hora, às *{meeting_str}*."
     
     # Adiciona os links
-    links = f"\n\n📄 Notion: {notion_page_url}"
+    links = f"\n\n📄 Notion: {notion_page_url(page_id)}"
     if whatsapp:
-        clean_phone = ''.join(filter(str.isdigit, whatsapp))
-        links += f"\n💬 WhatsApp: wa.me/{clean_phone}"
+        links += f"\n💬 WhatsApp: {wa_me_link(whatsapp)}"
 
     # Lembrete no dia da reunião, às 8h da manhã.
     meeting_day_8am = meeting_dt.replace(hour=8, minute=0, second=0, microsecond=0)
     
-    if meeting_day_8am > datetime.now(tz=meeting_dt.tzinfo):
-        scheduler.add_job(
+    if not ADMIN_DIGEST_ENABLED and meeting_day_8am > datetime.now(tz=meeting_dt.tzinfo):
+        add_tenant_job(
+            scheduler,
             send_wa_bulk,
             trigger=DateTrigger(run_date=meeting_day_8am),
             args=[base_message_8am + links],
@@ -38,7 +44,8 @@ def schedule_messages(scheduler: AsyncIOScheduler, first_name: str, meeting_dt:
     # Lembrete 1 hora antes da reunião.
     one_hour_before = meeting_dt - timedelta(hours=1)
     if one_hour_before > datetime.now(tz=meeting_dt.tzinfo):
-        scheduler.add_job(
+        add_tenant_job(
+            scheduler,
             send_wa_bulk,
             trigger=DateTrigger(run_date=one_hour_before),
             args=[base_message_1h + links],
@@ -61,17 +68,38 @@ def schedule_lead_messages(scheduler: AsyncIOScheduler, first_name: str, phone:
     # ✅ REMOVIDO: Envio imediato para a Zaia no momento do agendamento
     # As mensagens só serão enviadas para a Zaia quando o scheduler executar
 
-    scheduler.add_job(
+    add_tenant_job(
+        scheduler,
         send_wa_message,
         trigger=DateTrigger(run_date=dt - timedelta(days=1)),
         args=[phone, one_day_before_message, False, None, "reminder"],
         id=f"lead_whatsapp_{dt.timestamp()}_1day",
         replace_existing=True,
     )
-    scheduler.add_job(
+    add_tenant_job(
+        scheduler,
         send_wa_message,
         trigger=DateTrigger(run_date=dt - timedelta(hours=4)),
         args=[phone, f"Hello {lead_first_name}, tudo certo para a nossa reunião hoje às {meeting_str}?", False, None, "reminder"],
         id=f"lead_whatsapp_{dt.timestamp()}_4h",
         replace_existing=True,
-    )
\ No newline at end of file
+    )
+
+# Referência textual: o agendamento não depende do serviço de testes (nem o importa)
+LEAD_REFRESH_FUNC = "services.placement_test_service:run_lead_refresh"
+
+def schedule_placement_refresh(scheduler: AsyncIOScheduler, email: str | None, page_id: str | None) -> None:
+    """Agenda a verificação do teste de nivelamento do lead pouco depois do envio do link.
+
+    A integração com a Flexge é só do tenant padrão.
+    """
+    if not FLEXGE_API_KEY or not (email or page_id) or not current_tenant().is_default:
+        return
+    run_at = datetime.now(tz=scheduler.timezone) + timedelta(minutes=PLACEMENT_REFRESH_DELAY_MINUTES)
+    scheduler.add_job(
+        LEAD_REFRESH_FUNC,
+        trigger=DateTrigger(run_date=run_at),
+        kwargs={"email": email, "page_id": page_id},
+        id=f"placement_refresh_{page_id or email}",
+        replace_existing=True,
+    )
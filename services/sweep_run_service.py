@@ -0,0 +1,216 @@
+# services/sweep_run_service.py
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import Column, Float, Index, Integer, String, Table, Text, UniqueConstraint, select, text
+from sqlalchemy.exc import IntegrityError
+from config import SWEEP_STALE_SECONDS, TZ
+from database import get_engine, metadata
+
+RUNNING = "running"
+INTERRUPTED = "interrupted"
+COMPLETED = "completed"
+
+# Resultado de cada lead processado numa execução
+OUTCOME_TEST_DONE = "test_done"
+OUTCOME_NO_TEST = "no_test"
+OUTCOME_SKIPPED = "skipped"
+OUTCOME_ERROR = "error"
+
+# Uma linha por execução da varredura; o cursor permite retomar de onde parou
+sweep_runs = Table(
+    "placement_sweep_runs",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("database_id", String(64), nullable=False, index=True),
+    Column("status", String(16), nullable=False, index=True),
+    Column("owner", String(191), nullable=False),
+    Column("started_at", Float, nullable=False),
+    Column("finished_at", Float),
+    Column("heartbeat_at", Float, nullable=False),
+    # Cursor: último lead concluído (os leads são percorridos em ordem de page_id)
+    Column("last_page_id", String(64)),
+    Column("processed", Integer, nullable=False, default=0),
+    Column("tests_done", Integer, nullable=False, default=0),
+    Column("errors", Integer, nullable=False, default=0),
+    Column("resumes", Integer, nullable=False, default=0),
+    Column("last_error", Text),
+    # No máximo uma execução em andamento por database, mesmo com instâncias abrindo ao mesmo tempo
+    Index(
+        "uq_placement_sweep_runs_running",
+        "database_id",
+        unique=True,
+        postgresql_where=text(f"status = '{RUNNING}'"),
+        sqlite_where=text(f"status = '{RUNNING}'"),
+    ),
+)
+
+sweep_items = Table(
+    "placement_sweep_items",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("run_id", Integer, nullable=False, index=True),
+    Column("page_id", String(64), nullable=False),
+    Column("email", String(320)),
+    Column("outcome", String(16), nullable=False),
+    Column("detail", Text),
+    Column("processed_at", Float, nullable=False),
+    UniqueConstraint("run_id", "page_id", name="uq_placement_sweep_items_run_page"),
+)
+
+
+def start_or_resume_run(owner: str, database_id: str) -> Optional[Dict[str, Any]]:
+    """Retoma a última execução interrompida/abandonada ou abre uma nova.
+
+    Retorna None se outra execução do mesmo database ainda está viva (heartbeat recente)
+    ou se outra instância abriu/retomou uma ao mesmo tempo.
+    """
+    try:
+        return _start_or_resume_run(owner, database_id)
+    except IntegrityError:
+        # Índice único parcial: já existe uma execução em andamento para o database
+        return None
+
+
+def _start_or_resume_run(owner: str, database_id: str) -> Optional[Dict[str, Any]]:
+    now = time.time()
+    with get_engine().begin() as conn:
+        current = conn.execute(
+            select(sweep_runs)
+            .where(sweep_runs.c.database_id == database_id, sweep_runs.c.status.in_([RUNNING, INTERRUPTED]))
+            .order_by(sweep_runs.c.id.desc())
+            .limit(1)
+        ).mappings().first()
+
+        if current is not None:
+            if current["status"] == RUNNING and now - current["heartbeat_at"] < SWEEP_STALE_SECONDS:
+                return None
+            # Update condicional: se outra instância retomou primeiro, nada é alterado
+            result = conn.execute(
+                sweep_runs.update()
+                .where(sweep_runs.c.id == current["id"], sweep_runs.c.heartbeat_at == current["heartbeat_at"])
+                .values(status=RUNNING, owner=owner, heartbeat_at=now, resumes=sweep_runs.c.resumes + 1)
+            )
+            if result.rowcount != 1:
+                return None
+            run = dict(current)
+            run.update(status=RUNNING, owner=owner, heartbeat_at=now, resumes=current["resumes"] + 1)
+            return run
+
+        result = conn.execute(sweep_runs.insert().values(
+            database_id=database_id,
+            status=RUNNING,
+            owner=owner,
+            started_at=now,
+            heartbeat_at=now,
+            processed=0,
+            tests_done=0,
+            errors=0,
+            resumes=0,
+        ))
+        run_id = result.inserted_primary_key[0]
+        return dict(conn.execute(select(sweep_runs).where(sweep_runs.c.id == run_id)).mappings().first())
+
+
+def get_live_run(database_id: str) -> Optional[Dict[str, Any]]:
+    """Execução em andamento (heartbeat recente) do database, se houver."""
+    with get_engine().begin() as conn:
+        run = conn.execute(
+            select(sweep_runs)
+            .where(
+                sweep_runs.c.database_id == database_id,
+                sweep_runs.c.status == RUNNING,
+                sweep_runs.c.heartbeat_at >= time.time() - SWEEP_STALE_SECONDS,
+            )
+            .order_by(sweep_runs.c.id.desc())
+            .limit(1)
+        ).mappings().first()
+    return dict(run) if run else None
+
+
+def record_item(run_id: int, page_id: str, email: str | None, outcome: str, detail: str | None = None) -> None:
+    """Grava o resultado de um lead e avança o cursor para depois dele (também serve de heartbeat)."""
+    now = time.time()
+    with get_engine().begin() as conn:
+        conn.execute(sweep_items.delete().where(sweep_items.c.run_id == run_id, sweep_items.c.page_id == page_id))
+        conn.execute(sweep_items.insert().values(
+            run_id=run_id,
+            page_id=page_id,
+            email=email,
+            outcome=outcome,
+            detail=detail[:2000] if detail else None,
+            processed_at=now,
+        ))
+        conn.execute(
+            sweep_runs.update().where(sweep_runs.c.id == run_id).values(
+                last_page_id=page_id,
+                heartbeat_at=now,
+                processed=sweep_runs.c.processed + 1,
+                tests_done=sweep_runs.c.tests_done + (1 if outcome == OUTCOME_TEST_DONE else 0),
+                errors=sweep_runs.c.errors + (1 if outcome == OUTCOME_ERROR else 0),
+            )
+        )
+
+
+def finish_run(run_id: int, status: str, error: str | None = None) -> None:
+    now = time.time()
+    values: Dict[str, Any] = {"status": status, "heartbeat_at": now, "last_error": error[:2000] if error else None}
+    if status == COMPLETED:
+        values["finished_at"] = now
+    with get_engine().begin() as conn:
+        conn.execute(sweep_runs.update().where(sweep_runs.c.id == run_id).values(**values))
+
+
+def _iso(ts: float | None) -> str | None:
+    return datetime.fromtimestamp(ts, tz=TZ).isoformat() if ts else None
+
+
+def _summarize(run: Dict[str, Any]) -> Dict[str, Any]:
+    end = run["finished_at"] or run["heartbeat_at"]
+    duration = max(end - run["started_at"], 0.0)
+    return {
+        "id": run["id"],
+        "database_id": run["database_id"],
+        "status": run["status"],
+        "started_at": _iso(run["started_at"]),
+        "finished_at": _iso(run["finished_at"]),
+        "heartbeat_at": _iso(run["heartbeat_at"]),
+        "duration_seconds": round(duration, 1),
+        "processed": run["processed"],
+        "tests_done": run["tests_done"],
+        "errors": run["errors"],
+        "resumes": run["resumes"],
+        "items_per_second": round(run["processed"] / duration, 3) if duration else None,
+        "last_error": run["last_error"],
+    }
+
+
+def list_runs(limit: int = 20) -> List[Dict[str, Any]]:
+    """Histórico das execuções mais recentes, com duração e itens por segundo."""
+    with get_engine().begin() as conn:
+        rows = conn.execute(select(sweep_runs).order_by(sweep_runs.c.id.desc()).limit(limit)).mappings().all()
+    return [_summarize(dict(row)) for row in rows]
+
+
+def get_run(run_id: int, outcome: str | None = None, limit: int = 500) -> Optional[Dict[str, Any]]:
+    """Uma execução com os resultados por lead (opcionalmente filtrados por `outcome`)."""
+    with get_engine().begin() as conn:
+        run = conn.execute(select(sweep_runs).where(sweep_runs.c.id == run_id)).mappings().first()
+        if run is None:
+            return None
+        query = select(sweep_items).where(sweep_items.c.run_id == run_id)
+        if outcome:
+            query = query.where(sweep_items.c.outcome == outcome)
+        items = conn.execute(query.order_by(sweep_items.c.id).limit(limit)).mappings().all()
+    summary = _summarize(dict(run))
+    summary["items"] = [
+        {
+            "page_id": item["page_id"],
+            "email": item["email"],
+            "outcome": item["outcome"],
+            "detail": item["detail"],
+            "processed_at": _iso(item["processed_at"]),
+        }
+        for item in items
+    ]
+    return summary
@@ -0,0 +1,241 @@
+# services/tenant_service.py
+import hashlib
+import hmac
+import inspect
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from apscheduler.job import Job
+from apscheduler.schedulers.base import BaseScheduler
+from apscheduler.util import obj_to_ref, ref_to_obj
+from config import (
+    ADMIN_PHONES, CAL_SECRET, NOTION_DB, NOTION_RATE_PER_SECOND, NOTION_BURST, NOTION_MAX_CONCURRENCY,
+    TENANTS_FILE, TENANTS_JSON, ZAIA_BASE_URL,
+)
+from services.context_marker_service import ContextMarkerSink, context_marker_sink
+from services.notion_client import NotionClient, notion_client
+from services.resilience import RateLimiter
+from services.zaia_context_service import ZaiaContextService, zaia_context
+from services.zapi_pool import ZapiPool, zapi_pool
+
+DEFAULT_TENANT = "default"
+# Chave com o tenant nos webhooks enfileirados pelo processo web (ausente = padrão)
+TENANT_PAYLOAD_KEY = "_tenant"
+
+
+class Tenant:
+    """
+    Configuração de uma escola/unidade: segredo do Cal.com, integração e database do
+    Notion, instâncias da Z-API, telefones dos admins e agente da Zaia.
+
+    Cada tenant tem o próprio cliente do Notion (rate limit, circuito e conexões) e o
+    próprio pool da Z-API, para que a cota de um não seja consumida pelo outro. O contexto das
+    mensagens vai para o agente da Zaia do próprio tenant.
+    """
+
+    def __init__(
+        self,
+        tenant_id: str,
+        cal_secret: bytes,
+        notion_db: str | None,
+        admin_phones: List[str],
+        notion: NotionClient,
+        zapi: ZapiPool,
+        zaia: ZaiaContextService,
+        context_markers: ContextMarkerSink,
+    ):
+        self.id = tenant_id
+        self.cal_secret = cal_secret
+        self.notion_db = notion_db
+        self.admin_phones = admin_phones
+        self.notion = notion
+        self.zapi = zapi
+        self.zaia = zaia
+        self.context_markers = context_markers
+
+    @property
+    def is_default(self) -> bool:
+        return self.id == DEFAULT_TENANT
+
+    def job_id(self, job_id: str) -> str:
+        """Id do job no jobstore compartilhado (o tenant padrão mantém os ids de sempre)."""
+        return job_id if self.is_default else f"{self.id}:{job_id}"
+
+    def signs(self, signature: str, raw_body: bytes) -> bool:
+        digest = hmac.new(self.cal_secret, raw_body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(digest, signature)
+
+    def close(self) -> None:
+        """Envia as marcações de contexto pendentes e fecha as conexões HTTP (shutdown)."""
+        self.context_markers.close()
+        self.notion.close()
+        self.zapi.close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "notion_db": self.notion_db,
+            "admin_phones_configured": len(self.admin_phones),
+            "notion_rate_limit": self.notion.limiter.snapshot(),
+            "zapi_instances": self.zapi.snapshot(),
+            "zaia_enabled": self.zaia.enabled,
+            "context_marker_mode": self.context_markers.mode,
+        }
+
+
+def _split(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value or "").split(",") if v.strip()]
+
+
+def _tenant_from_config(tenant_id: str, conf: Dict[str, Any]) -> Tenant:
+    missing = [key for key in ("cal_secret", "notion_token", "notion_db", "zapi_instances") if not conf.get(key)]
+    if missing:
+        raise ValueError(f"Tenant '{tenant_id}' sem {', '.join(missing)}")
+
+    headers = {
+        "Authorization": f"Bearer {conf['notion_token']}",
+        "Content-Type": "application/json",
+        "Notion-Version": "2025-09-03",
+    }
+    limiter = RateLimiter(
+        rate=float(conf.get("notion_rate_per_second", NOTION_RATE_PER_SECOND)),
+        burst=int(conf.get("notion_burst", NOTION_BURST)),
+        max_concurrency=int(conf.get("notion_max_concurrency", NOTION_MAX_CONCURRENCY)),
+    )
+    entries = [tuple(part.strip() for part in item.split(":")) for item in _split(conf["zapi_instances"])]
+    # Sem destino próprio, as marcações não vão para o receptor do tenant padrão
+    marker_url = conf.get("context_marker_url")
+    return Tenant(
+        tenant_id,
+        cal_secret=str(conf["cal_secret"]).encode(),
+        notion_db=conf["notion_db"],
+        admin_phones=_split(conf.get("admin_phones")),
+        notion=NotionClient(limiter, headers=headers, breaker_name=f"notion:{tenant_id}"),
+        zapi=ZapiPool.from_entries(entries, conf.get("zapi_client_token"), prefix=f"zapi:{tenant_id}"),
+        zaia=ZaiaContextService(
+            api_key=conf.get("zaia_api_key"),
+            agent_id=conf.get("zaia_agent_id"),
+            base_url=conf.get("zaia_base_url", ZAIA_BASE_URL),
+            breaker_name=f"zaia:{tenant_id}",
+        ),
+        context_markers=ContextMarkerSink(
+            mode=conf.get("context_marker_mode", "http" if marker_url else "disabled"),
+            url=marker_url,
+            batch_url=conf.get("context_marker_batch_url"),
+            breaker_name=f"context_marker:{tenant_id}",
+        ),
+    )
+
+
+def load_tenants() -> Dict[str, Tenant]:
+    """Tenant padrão (variáveis de ambiente de sempre) + os de TENANTS_FILE/TENANTS_JSON."""
+    tenants = {
+        DEFAULT_TENANT: Tenant(
+            DEFAULT_TENANT, CAL_SECRET, NOTION_DB, ADMIN_PHONES, notion_client, zapi_pool, zaia_context,
+            context_marker_sink,
+        )
+    }
+    raw = TENANTS_JSON
+    if TENANTS_FILE:
+        with open(TENANTS_FILE, encoding="utf-8") as f:
+            raw = f.read()
+    if not raw:
+        return tenants
+
+    for tenant_id, conf in json.loads(raw).items():
+        if tenant_id == DEFAULT_TENANT or ":" in tenant_id or "/" in tenant_id:
+            raise ValueError(f"Nome de tenant inválido: '{tenant_id}'")
+        tenants[tenant_id] = _tenant_from_config(tenant_id, conf)
+    print(f"🏫 Tenants configurados: {', '.join(tenants)}")
+    return tenants
+
+
+tenants = load_tenants()
+
+# Tenant da requisição/job em andamento (propaga para asyncio.to_thread e tasks)
+_current_tenant: ContextVar[Optional[Tenant]] = ContextVar("current_tenant", default=None)
+
+
+def get_tenant(tenant_id: str) -> Optional[Tenant]:
+    return tenants.get(tenant_id)
+
+
+def current_tenant() -> Tenant:
+    """Tenant do contexto atual; fora de um `tenant_scope`, o padrão."""
+    return _current_tenant.get() or tenants[DEFAULT_TENANT]
+
+
+@contextmanager
+def tenant_scope(tenant: Tenant) -> Iterator[Tenant]:
+    """Executa o bloco com `tenant` como tenant atual."""
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
+
+
+def tenant_for_signature(signature: str | None, raw_body: bytes) -> Optional[Tenant]:
+    """Tenant cujo CAL_SECRET gerou a assinatura do webhook (None se nenhum)."""
+    if not signature:
+        return None
+    for tenant in tenants.values():
+        if tenant.signs(signature, raw_body):
+            return tenant
+    return None
+
+
+def close_tenants() -> None:
+    """Fecha os clientes de todos os tenants: marcações pendentes e conexões (shutdown)."""
+    for tenant in tenants.values():
+        tenant.close()
+
+
+def tenants_snapshot() -> Dict[str, Dict[str, Any]]:
+    return {tenant_id: tenant.snapshot() for tenant_id, tenant in tenants.items() if tenant_id != DEFAULT_TENANT}
+
+
+# -----------------------------------------------------------------------------
+# Jobs no jobstore compartilhado
+# -----------------------------------------------------------------------------
+def run_in_tenant(tenant_id: str, func_ref: str, *args, **kwargs) -> Any:
+    """Executa um job agendado por um tenant adicional dentro do contexto dele."""
+    tenant = get_tenant(tenant_id)
+    if tenant is None:
+        print(f"⚠️ Tenant '{tenant_id}' não está mais configurado; job {func_ref} ignorado")
+        return None
+    with tenant_scope(tenant):
+        return ref_to_obj(func_ref)(*args, **kwargs)
+
+
+async def run_in_tenant_async(tenant_id: str, func_ref: str, *args, **kwargs) -> Any:
+    """Versão de `run_in_tenant` para jobs assíncronos."""
+    tenant = get_tenant(tenant_id)
+    if tenant is None:
+        print(f"⚠️ Tenant '{tenant_id}' não está mais configurado; job {func_ref} ignorado")
+        return None
+    with tenant_scope(tenant):
+        return await ref_to_obj(func_ref)(*args, **kwargs)
+
+
+def add_tenant_job(
+    scheduler: BaseScheduler,
+    func: Callable,
+    args: tuple | list = (),
+    kwargs: Dict[str, Any] | None = None,
+    **options: Any,
+) -> Job:
+    """`scheduler.add_job` com o namespace do tenant atual.
+
+    Para o tenant padrão é o próprio `add_job`. Para os demais, o id ganha o prefixo
+    "<tenant>:" e o job roda via `run_in_tenant`, com o tenant restaurado na execução.
+    """
+    tenant = current_tenant()
+    if tenant.is_default:
+        return scheduler.add_job(func, args=args, kwargs=kwargs, **options)
+    if "id" in options:
+        options["id"] = tenant.job_id(options["id"])
+    runner = run_in_tenant_async if inspect.iscoroutinefunction(func) else run_in_tenant
+    return scheduler.add_job(runner, args=[tenant.id, obj_to_ref(func), *args], kwargs=kwargs, **options)
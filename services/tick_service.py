@@ -0,0 +1,83 @@
+# services/tick_service.py
+import asyncio
+import inspect
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore
+from apscheduler.schedulers.base import BaseScheduler
+from config import TICK_CATCHUP_SECONDS, TICK_CONCURRENCY, TICK_MAX_JOBS
+from services.profiling_service import profiled_job
+
+
+def _pending_run_times(job: Job, now: datetime) -> List[datetime]:
+    """Todas as execuções do job que já venceram até `now`."""
+    run_times = []
+    next_run = job.next_run_time
+    while next_run and next_run <= now:
+        run_times.append(next_run)
+        next_run = job.trigger.get_next_fire_time(next_run, now)
+    return run_times
+
+
+async def _run_job(job: Job) -> None:
+    job = profiled_job(job)
+    if inspect.iscoroutinefunction(job.func):
+        await job.func(*job.args, **job.kwargs)
+    else:
+        await asyncio.to_thread(job.func, *job.args, **job.kwargs)
+
+
+async def run_due_jobs(scheduler: BaseScheduler, store: BaseJobStore, now: datetime | None = None) -> Dict[str, Any]:
+    """Executa, em uma única passada, todos os jobs vencidos do jobstore ("relógio externo").
+
+    - Catch-up: execuções perdidas até TICK_CATCHUP_SECONDS atrás ainda rodam.
+    - Coalescência: cada job roda no máximo uma vez por tick, não importa quantas
+      execuções tenha perdido enquanto a instância estava desligada.
+    - O próximo horário é gravado antes de executar, para que um tick concorrente
+      não pegue o mesmo job.
+    """
+    now = now or datetime.now(scheduler.timezone)
+    started = time.monotonic()
+    oldest_allowed = now - timedelta(seconds=TICK_CATCHUP_SECONDS)
+
+    due_jobs = store.get_due_jobs(now)[:TICK_MAX_JOBS]
+    to_run: List[Job] = []
+    skipped = 0
+    for job in due_jobs:
+        run_times = _pending_run_times(job, now)
+        next_run = job.trigger.get_next_fire_time(run_times[-1], now) if run_times else None
+        if next_run:
+            scheduler.modify_job(job.id, next_run_time=next_run)
+        else:
+            scheduler.remove_job(job.id)
+
+        if run_times and run_times[-1] >= oldest_allowed:
+            to_run.append(job)
+        else:
+            skipped += 1
+            print(f"⏭️ Job {job.id} perdido há mais de {TICK_CATCHUP_SECONDS:.0f}s; descartado")
+
+    semaphore = asyncio.Semaphore(TICK_CONCURRENCY)
+    failed: List[str] = []
+
+    async def run_bounded(job: Job) -> None:
+        async with semaphore:
+            try:
+                await _run_job(job)
+            except Exception as e:
+                failed.append(job.id)
+                print(f"❌ Erro ao executar job {job.id} no tick: {e}")
+
+    await asyncio.gather(*(run_bounded(job) for job in to_run))
+
+    result = {
+        "due": len(due_jobs),
+        "executed": len(to_run) - len(failed),
+        "failed": failed,
+        "skipped": skipped,
+        "duration_seconds": round(time.monotonic() - started, 3),
+    }
+    print(f"⏱️ Tick concluído: {result}")
+    return result
@@ -0,0 +1,123 @@
+# services/webhook_log_service.py
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import Column, Float, Integer, LargeBinary, String, Table, select
+from config import TZ
+from database import execute_async, get_engine, metadata
+from models import CalWebhookPayload
+
+# Chave com o id do evento no payload enfileirado (APP_ROLE=web), como o tenant
+EVENT_PAYLOAD_KEY = "_event_id"
+
+# Todo webhook aceito do Cal.com, como chegou (corpo comprimido), para reprocessamento.
+# Só `processed_at` é atualizado depois: o corpo nunca muda.
+webhook_events = Table(
+    "webhook_events",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("tenant", String(64), nullable=False, index=True),
+    Column("uid", String(191), index=True),
+    Column("trigger_event", String(64), nullable=False, index=True),
+    Column("received_at", Float, nullable=False, index=True),
+    Column("body", LargeBinary, nullable=False),
+    Column("body_size", Integer, nullable=False),
+    # Preenchido quando o processamento (inline, pela fila ou por replay) termina sem erro
+    Column("processed_at", Float),
+)
+
+
+def _timestamp(dt: datetime) -> float:
+    """Datas sem fuso são do fuso da aplicação."""
+    return (TZ.localize(dt) if dt.tzinfo is None else dt).timestamp()
+
+
+def _insert_event(tenant_id: str, data: CalWebhookPayload, raw_body: bytes):
+    return webhook_events.insert().values(
+        tenant=tenant_id,
+        uid=data.payload.uid,
+        trigger_event=data.trigger_event,
+        received_at=time.time(),
+        body=zlib.compress(raw_body),
+        body_size=len(raw_body),
+        processed_at=None,
+    )
+
+
+def _mark_processed(event_id: int):
+    return webhook_events.update().where(webhook_events.c.id == event_id).values(processed_at=time.time())
+
+
+def record_event(tenant_id: str, data: CalWebhookPayload, raw_body: bytes) -> int:
+    """Grava o corpo do webhook (zlib) e retorna o id do evento."""
+    with get_engine().begin() as conn:
+        return conn.execute(_insert_event(tenant_id, data, raw_body)).inserted_primary_key[0]
+
+
+async def record_event_async(tenant_id: str, data: CalWebhookPayload, raw_body: bytes) -> int:
+    """`record_event` para o caminho do webhook (driver assíncrono, sem ocupar thread)."""
+    return await execute_async(_insert_event(tenant_id, data, raw_body))
+
+
+def mark_processed(event_id: int | None) -> None:
+    if event_id is None:
+        return
+    with get_engine().begin() as conn:
+        conn.execute(_mark_processed(event_id))
+
+
+async def mark_processed_async(event_id: int | None) -> None:
+    if event_id is not None:
+        await execute_async(_mark_processed(event_id))
+
+
+def list_events(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    uids: Optional[Iterable[str]] = None,
+    tenant_id: Optional[str] = None,
+    trigger_events: Optional[Iterable[str]] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Eventos (sem o corpo) por período de recebimento e/ou uids, do mais antigo ao mais novo."""
+    query = select(
+        webhook_events.c.id,
+        webhook_events.c.tenant,
+        webhook_events.c.uid,
+        webhook_events.c.trigger_event,
+        webhook_events.c.received_at,
+        webhook_events.c.body_size,
+        webhook_events.c.processed_at,
+    ).order_by(webhook_events.c.received_at, webhook_events.c.id)
+    if since is not None:
+        query = query.where(webhook_events.c.received_at >= _timestamp(since))
+    if until is not None:
+        query = query.where(webhook_events.c.received_at < _timestamp(until))
+    if uids:
+        query = query.where(webhook_events.c.uid.in_(list(uids)))
+    if tenant_id:
+        query = query.where(webhook_events.c.tenant == tenant_id)
+    if trigger_events:
+        query = query.where(webhook_events.c.trigger_event.in_(list(trigger_events)))
+    if limit:
+        query = query.limit(limit)
+    with get_engine().begin() as conn:
+        rows = [dict(r) for r in conn.execute(query).mappings()]
+    for row in rows:
+        row["received_at_iso"] = datetime.fromtimestamp(row["received_at"], tz=TZ).isoformat()
+    return rows
+
+
+def load_bodies(event_ids: List[int]) -> Dict[int, bytes]:
+    """Corpos descomprimidos dos eventos, por id."""
+    bodies: Dict[int, bytes] = {}
+    with get_engine().begin() as conn:
+        # Em blocos, para não montar um IN gigante num replay grande
+        for start in range(0, len(event_ids), 500):
+            chunk = event_ids[start:start + 500]
+            for event_id, body in conn.execute(
+                select(webhook_events.c.id, webhook_events.c.body).where(webhook_events.c.id.in_(chunk))
+            ):
+                bodies[event_id] = zlib.decompress(body)
+    return bodies
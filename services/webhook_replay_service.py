@@ -0,0 +1,126 @@
+# services/webhook_replay_service.py
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from apscheduler.schedulers.base import BaseScheduler
+from pydantic import ValidationError
+from config import TZ, WEBHOOK_REPLAY_CONCURRENCY
+from models import CalWebhookPayload
+from services.booking_service import BOOKING_EVENTS, booking_start, lead_key, process_booking
+from services.notion_service import flush_notion_writes
+from services.tenant_service import get_tenant, tenant_scope
+from services.webhook_log_service import list_events, load_bodies, mark_processed
+
+
+def _latest_per_booking(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Só o evento mais recente de cada agendamento (uid): os anteriores foram superados."""
+    latest: Dict[Any, Dict[str, Any]] = {}
+    for event in events:
+        latest[(event["tenant"], event["uid"] or f"event:{event['id']}")] = event
+    return sorted(latest.values(), key=lambda e: (e["received_at"], e["id"]))
+
+
+def replay_events(
+    scheduler: BaseScheduler,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    uids: Optional[Iterable[str]] = None,
+    tenant_id: Optional[str] = None,
+    notify_lead: bool = False,
+    notify_admins: bool = False,
+    include_processed: bool = False,
+    include_past: bool = False,
+    concurrency: int = WEBHOOK_REPLAY_CONCURRENCY,
+    dry_run: bool = False,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Reprocessa os webhooks gravados de um período e/ou lista de uids.
+
+    - Idempotente: por padrão só eventos que não terminaram de ser processados
+      (`include_processed=True` refaz todos, ex.: depois de um deploy com bug), só o
+      mais recente de cada agendamento, e nunca reuniões que já passaram
+      (`include_past=True` muda isso).
+    - Leads diferentes rodam em paralelo (`concurrency` threads); agendamentos do
+      mesmo lead rodam em sequência, para não criar a mesma página duas vezes.
+    - Com `notify_lead=False` (padrão) o lead não recebe de novo a confirmação e, com
+      `notify_admins=False` (padrão), os admins não recebem de novo o aviso de agendamento.
+    """
+    uids = list(uids or [])
+    if since is None and not uids:
+        raise ValueError("Informe um período (since) ou uma lista de uids")
+
+    events = list_events(since=since, until=until, uids=uids, tenant_id=tenant_id, trigger_events=BOOKING_EVENTS)
+    events = _latest_per_booking(events)
+    summary: Dict[str, Any] = {
+        "matched": len(events),
+        "replayed": 0,
+        "skipped_processed": 0,
+        "skipped_past": 0,
+        "failed": [],
+    }
+
+    pending = []
+    for event in events:
+        if event["processed_at"] and not include_processed:
+            summary["skipped_processed"] += 1
+        else:
+            pending.append(event)
+
+    bodies = load_bodies([e["id"] for e in pending])
+    now = datetime.now(tz=TZ)
+    groups: Dict[tuple, List[tuple]] = {}
+    for event in pending:
+        try:
+            data = CalWebhookPayload.model_validate_json(bodies[event["id"]])
+        except ValidationError as e:
+            print(f"✗ Evento {event['id']} inválido: {e.errors()[0].get('msg')}")
+            summary["failed"].append(event["id"])
+            continue
+        if not data.payload.attendees:
+            continue
+        if not include_past and booking_start(data) <= now:
+            summary["skipped_past"] += 1
+            continue
+        groups.setdefault((event["tenant"], lead_key(data)), []).append((event, data))
+
+    summary["to_replay"] = sum(len(g) for g in groups.values())
+    print(
+        f"🔁 Replay: {summary['matched']} agendamento(s) encontrados, {summary['to_replay']} a reprocessar "
+        f"({summary['skipped_processed']} já processados, {summary['skipped_past']} no passado)"
+    )
+    if dry_run or not groups:
+        return summary
+
+    def replay_group(items: List[tuple]) -> List[int]:
+        failed = []
+        for event, data in items:
+            tenant = get_tenant(event["tenant"])
+            if tenant is None:
+                print(f"✗ Evento {event['id']}: tenant '{event['tenant']}' não configurado")
+                failed.append(event["id"])
+                continue
+            try:
+                with tenant_scope(tenant):
+                    process_booking(scheduler, data, notify_lead=notify_lead, notify_admins=notify_admins)
+                mark_processed(event["id"])
+            except Exception as e:
+                print(f"✗ Erro ao reprocessar evento {event['id']} ({event['uid']}): {e}")
+                failed.append(event["id"])
+        return failed
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        futures = {pool.submit(replay_group, items): len(items) for items in groups.values()}
+        for future in as_completed(futures):
+            failed = future.result()
+            summary["replayed"] += futures[future] - len(failed)
+            summary["failed"].extend(failed)
+            if on_progress:
+                on_progress(dict(summary))
+
+    # Atualizações de páginas ainda no buffer de escrita vão antes de reportar o fim
+    flush_notion_writes()
+    summary["duration_seconds"] = round(time.monotonic() - started, 3)
+    print(f"✅ Replay concluído: {summary['replayed']} reprocessado(s), {len(summary['failed'])} falha(s)")
+    return summary
@@ -1,51 +1,16 @@
-import requests
 import json
 from datetime import datetime
-from config import ZAPI_CLIENT_TOKEN, ZAPI_INSTANCE, ZAPI_TOKEN, ADMIN_PHONES
 from utils import format_pt_br
-from services.zaia_context_service import ZaiaContextService
+from services.tenant_service import current_tenant
 
-# URL do webhook para marcar mensagens do sistema
-# ✅ CORRIGIDO: URL corrigida para o serviço correto
-WEBHOOK_URL = "https://agenda-cal-2-0.onrender.com/webhook"
-
-# Inicializa o serviço de contexto da Zaia
-zaia_context = ZaiaContextService()
-
-def mark_system_message(phone: str, message_type: str):
+def mark_system_message(phone: str, message_type: str) -> bool:
     """
     Marca mensagem do sistema para evitar perda de contexto no agente da Zaia.
+
+    Não bloqueia: a marcação é entregue pelo sink do tenant atual, em lote e em
+    segundo plano.
     """
-    try:
-        # Normaliza o telefone
-        clean_phone = ''.join(filter(str.isdigit, str(phone)))
-        if not clean_phone.startswith('55'):
-            clean_phone = '55' + clean_phone
-        
-        webhook_data = {
-            "type": "system_message_sent",
-            "phone": clean_phone,
-            "message_type": message_type
-        }
-        
-        # ✅ MELHORADO: Tratamento de erro mais robusto
-        try:
-            response = requests.post(WEBHOOK_URL, json=webhook_data, timeout=10)
-            
-            if response.status_code == 200:
-                print(f"✅ Contexto marcado para {clean_phone}: {message_type}")
-                return True
-            else:
-                print(f"⚠️ Erro ao marcar contexto: {response.status_code} - {response.text}")
-                return False
-                
-        except requests.exceptions.RequestException as e:
-            print(f"⚠️ Erro de conexão ao marcar contexto: {e}")
-            return False
-            
-    except Exception as e:
-        print(f"❌ Erro ao marcar contexto: {e}")
-        return False
+    return current_tenant().context_markers.mark(phone, message_type)
 
 def send_wa_message(phone: str, message: str, has_link: bool = False, link_data: dict | None = None, message_type: str = "system") -> None:
     """Send a WhatsApp message using Z-API."""
@@ -58,16 +23,9 @@ def send_wa_message(phone: str, message: str, has_link: bool = False, link_data:
     print(f"Enviando mensagem WhatsApp para {clean_phone}")
     print(f"Conteúdo da mensagem: {message}")
     
-    headers = {
-        "Client-Token": ZAPI_CLIENT_TOKEN,
-        "Content-Type": "application/json"
-    }
-    
-    base_url = f"https://api.z-api.io/instances/{ZAPI_INSTANCE}/token/{ZAPI_TOKEN}"
-    
     # Se tiver link, usar o endpoint de send-link
     if has_link and link_data:
-        url = f"{base_url}/send-link"
+        endpoint = "send-link"
         payload = {
             "phone": clean_phone,
             "message": message,
@@ -80,30 +38,30 @@ def send_wa_message(phone: str, message: str, has_link: bool = False, link_data:
         print(f"Enviando link com payload: {json.dumps(payload, indent=2)}")
     else:
         # Tentar endpoint /send-text
-        url = f"{base_url}/send-text"
+        endpoint = "send-text"
         payload = {
             "phone": clean_phone,
             "message": message
         }
         print(f"Enviando texto com payload: {json.dumps(payload, indent=2)}")
     
-    print(f"URL da requisição: {url}")
-    
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        # Timeout + circuit breaker por instância: com um número fora do ar, a mensagem
+        # sai por outro. Leads ficam sempre no mesmo número; admins são distribuídos.
+        # Cada tenant envia pelas próprias instâncias.
+        response = current_tenant().zapi.send(clean_phone, endpoint, payload, sticky=message_type != "admin")
         response_text = response.text
         print(f"Status code: {response.status_code}")
         print(f"Resposta Z-API: {response_text}")
         
         if response.status_code != 200 or "error" in response_text.lower():
             print("Erro detectado na resposta!")
-            print(f"Headers enviados: {json.dumps(headers, indent=2)}")
         else:
             print("Mensagem enviada com sucesso!")
             
             # Envia para a Zaia para preservar contexto
             if message_type != "admin":  # Não envia contexto para mensagens administrativas
-                zaia_context.send_message_to_zaia(clean_phone, message, message_type)
+                current_tenant().zaia.send_message_to_zaia(clean_phone, message, message_type)
             
             # ✅ CORRIGIDO: Só marca no contexto para mensagens imediatas, não para lembretes agendados
             if message_type not in ["admin", "reminder"]:  # Não marca mensagens para admins nem lembretes
@@ -115,15 +73,21 @@ def send_wa_message(phone: str, message: str, has_link: bool = False, link_data:
         raise
 
 def send_wa_bulk(message: str) -> None:
-    for phone in ADMIN_PHONES:
+    for phone in current_tenant().admin_phones:
         send_wa_message(phone, message, message_type="admin")
 
 def send_immediate_booking_notifications(
     attendee_name: str,
     whatsapp: str | None,
     start_dt: datetime,
+    notify_admins: bool = True,
+    notify_lead: bool = True,
 ) -> None:
-    """Envia a mensagem de confirmação imediata com o teste de nivelamento."""
+    """Envia a mensagem de confirmação imediata com o teste de nivelamento.
+
+    Com `notify_admins=False` o aviso ao time de vendas fica para o resumo de novos agendamentos.
+    Com `notify_lead=False` só os admins são avisados.
+    """
     first_name = attendee_name.split(' ')[0]
     zoom_url = (
         "https://us06web.zoom.us/j/8902841864?"
@@ -140,10 +104,13 @@ def send_immediate_booking_notifications(
         "https://zoom.us/j/8902841864"
     )
 
-    if whatsapp:
+    if whatsapp and notify_lead:
         # Envia a mensagem combinada e marca como confirmação de reunião
         send_wa_message(whatsapp, confirmation_message, message_type="meeting_confirmation")
 
+    if not notify_admins:
+        return
+
     # ------------------------------------------------------------------
     # Mensagem para o time de vendas continua igual (com nome completo)
     formatted_pt = format_pt_br(start_dt)
@@ -152,5 +119,5 @@ def send_immediate_booking_notifications(
         f"�� Cliente: {attendee_name}\n"
         f"📅 Data: {formatted_pt}"
     )
-    for admin_phone in ADMIN_PHONES:
+    for admin_phone in current_tenant().admin_phones:
         send_wa_message(admin_phone, sales_message, message_type="admin")
\ No newline at end of file
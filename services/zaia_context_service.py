@@ -2,6 +2,7 @@
 import httpx
 import logging
 from typing import Optional
+from services.resilience import guarded_request
 
 # Configuração de logging consistente com seu padrão
 logger = logging.getLogger(__name__)
@@ -21,18 +22,26 @@ class ZaiaContextService:
     das conversas quando mensagens são enviadas por outros sistemas.
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        api_key: Optional[str] = ZAIA_API_KEY,
+        agent_id: Optional[str] = ZAIA_AGENT_ID,
+        base_url: str = ZAIA_BASE_URL,
+        breaker_name: str = "zaia",
+    ):
+        # Credenciais do tenant (o padrão usa ZAIA_API_KEY/ZAIA_AGENT_ID)
+        self.breaker_name = breaker_name
         # Valida se as configurações estão disponíveis
-        if not ZAIA_API_KEY or not ZAIA_AGENT_ID:
+        if not api_key or not agent_id:
             print("❌ Configurações da Zaia incompletas. Contexto será desabilitado.")
-            print(f"   ZAIA_API_KEY: {'✅ Definida' if ZAIA_API_KEY else '❌ Não definida'}")
-            print(f"   ZAIA_AGENT_ID: {'✅ Definida' if ZAIA_AGENT_ID else '❌ Não definida'}")
+            print(f"   ZAIA_API_KEY: {'✅ Definida' if api_key else '❌ Não definida'}")
+            print(f"   ZAIA_AGENT_ID: {'✅ Definida' if agent_id else '❌ Não definida'}")
             self.enabled = False
         else:
             self.enabled = True
-            self.api_key = ZAIA_API_KEY
-            self.agent_id = ZAIA_AGENT_ID
-            self.base_url = ZAIA_BASE_URL
+            self.api_key = api_key
+            self.agent_id = agent_id
+            self.base_url = base_url
             print(f"✅ Serviço de contexto da Zaia inicializado com sucesso")
             print(f"   Agent ID: {self.agent_id}")
             print(f"   Base URL: {self.base_url}")
@@ -87,9 +96,9 @@ class ZaiaContextService:
             print(f"   🌐 URL: {url}")
             print(f"   🔑 Agent ID: {self.agent_id}")
             
-            # Faz a requisição para a Zaia usando httpx (consistente com seu padrão)
-            with httpx.Client(timeout=15.0) as client:
-                response = client.post(url, headers=headers, json=payload)
+            # Faz a requisição para a Zaia usando httpx (consistente com seu padrão),
+            # protegida pelo circuit breaker da Zaia
+            response = guarded_request(self.breaker_name, "POST", url, 15.0, headers=headers, json=payload)
             
             print(f"📡 Resposta da Zaia: {response.status_code}")
             
@@ -131,4 +140,8 @@ class ZaiaContextService:
              return '55' + clean_phone
         if not clean_phone.startswith('55'):
             return '55' + clean_phone
-        return clean_phone
\ No newline at end of file
+        return clean_phone
+
+
+# Serviço do tenant padrão (os demais tenants têm o próprio, com as credenciais deles)
+zaia_context = ZaiaContextService()
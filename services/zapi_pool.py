@@ -0,0 +1,137 @@
+# services/zapi_pool.py
+import hashlib
+import itertools
+import threading
+from typing import Any, Dict, List, Optional
+import httpx
+from config import ZAPI_INSTANCES, ZAPI_INSTANCE, ZAPI_TOKEN, ZAPI_CLIENT_TOKEN, ZAPI_TIMEOUT_SECONDS
+from services.resilience import OPEN, CircuitOpenError, get_breaker, guarded_request, is_upstream_failure
+
+ZAPI_BASE_URL = "https://api.z-api.io/instances"
+
+
+class ZapiInstance:
+    """Uma instância (número de WhatsApp) da Z-API, com circuit breaker próprio."""
+
+    def __init__(self, instance_id: str, token: str, client_token: str | None, breaker_name: str):
+        self.instance_id = instance_id
+        self.token = token
+        self.client_token = client_token
+        self.breaker_name = breaker_name
+
+    @property
+    def label(self) -> str:
+        return self.breaker_name
+
+    def url(self, endpoint: str) -> str:
+        return f"{ZAPI_BASE_URL}/{self.instance_id}/token/{self.token}/{endpoint}"
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Client-Token": self.client_token or "", "Content-Type": "application/json"}
+
+    @property
+    def healthy(self) -> bool:
+        return get_breaker(self.breaker_name).state != OPEN
+
+
+class ZapiPool:
+    """
+    Envio distribuído entre várias instâncias da Z-API.
+
+    - Mensagens para leads são "grudadas" no telefone: rendezvous hashing escolhe sempre
+      a mesma instância para o mesmo número (a conversa fica em um só WhatsApp), e
+      incluir/remover uma instância só muda o destino de ~1/n dos leads.
+    - Mensagens para admins são distribuídas em rodízio.
+    - Instâncias com o circuito aberto vão para o fim da fila; se a escolhida recusar a
+      mensagem (circuito aberto, falha de conexão, 429/5xx), a próxima é tentada. Timeout
+      de leitura não troca de instância: a mensagem pode ter sido aceita.
+    - As instâncias do pool compartilham um `httpx.Client` (conexões reaproveitadas com a
+      Z-API), fechado no shutdown (`close`).
+    """
+
+    def __init__(self, instances: List[ZapiInstance]):
+        self.instances = instances
+        self._rotation = itertools.count()
+        self._lock = threading.Lock()
+        self._http: Optional[httpx.Client] = None
+
+    @property
+    def http(self) -> httpx.Client:
+        with self._lock:
+            if self._http is None:
+                self._http = httpx.Client()
+            return self._http
+
+    def close(self) -> None:
+        with self._lock:
+            http, self._http = self._http, None
+        if http is not None:
+            http.close()
+
+    @classmethod
+    def from_config(cls) -> "ZapiPool":
+        if not ZAPI_INSTANCES:
+            # Uma única instância mantém o nome de circuito de sempre ("zapi")
+            return cls([ZapiInstance(ZAPI_INSTANCE, ZAPI_TOKEN, ZAPI_CLIENT_TOKEN, "zapi")])
+        return cls.from_entries(ZAPI_INSTANCES, ZAPI_CLIENT_TOKEN)
+
+    @classmethod
+    def from_entries(
+        cls, entries: List[tuple], default_client_token: str | None, prefix: str = "zapi"
+    ) -> "ZapiPool":
+        """Pool a partir de tuplas (instancia, token[, client_token]); `prefix` nomeia os circuitos."""
+        instances = []
+        for entry in entries:
+            instance_id, token = entry[0], entry[1]
+            client_token = entry[2] if len(entry) > 2 and entry[2] else default_client_token
+            instances.append(ZapiInstance(instance_id, token, client_token, f"{prefix}:{instance_id[-6:]}"))
+        return cls(instances)
+
+    def _sticky_order(self, phone: str) -> List[ZapiInstance]:
+        def weight(instance: ZapiInstance) -> str:
+            return hashlib.sha1(f"{instance.instance_id}:{phone}".encode()).hexdigest()
+        return sorted(self.instances, key=weight, reverse=True)
+
+    def _round_robin_order(self) -> List[ZapiInstance]:
+        with self._lock:
+            start = next(self._rotation) % len(self.instances)
+        return self.instances[start:] + self.instances[:start]
+
+    def candidates(self, phone: str, sticky: bool = True) -> List[ZapiInstance]:
+        """Instâncias na ordem de tentativa (saudáveis primeiro, preservando a preferência)."""
+        order = self._sticky_order(phone) if sticky else self._round_robin_order()
+        return [i for i in order if i.healthy] + [i for i in order if not i.healthy]
+
+    def send(self, phone: str, endpoint: str, payload: Dict[str, Any], sticky: bool = True) -> httpx.Response:
+        """Envia pela instância preferida do telefone, com failover para as demais."""
+        candidates = self.candidates(phone, sticky)
+        last_error: Optional[Exception] = None
+        for position, instance in enumerate(candidates):
+            is_last = position == len(candidates) - 1
+            try:
+                response = guarded_request(
+                    instance.breaker_name, "POST", instance.url(endpoint), ZAPI_TIMEOUT_SECONDS,
+                    client=self.http, headers=instance.headers, json=payload,
+                )
+            except (CircuitOpenError, httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # A mensagem certamente não saiu: pode ir pela próxima instância
+                last_error = e
+                print(f"⚠️ Instância Z-API {instance.label} indisponível: {e}")
+                continue
+            if is_upstream_failure(response.status_code) and not is_last:
+                print(f"⚠️ Instância Z-API {instance.label} respondeu {response.status_code}; tentando a próxima")
+                continue
+            print(f"Instância Z-API: {instance.label}")
+            return response
+        raise last_error or RuntimeError("Nenhuma instância da Z-API disponível")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {"instance": i.label, "state": get_breaker(i.breaker_name).state}
+            for i in self.instances
+        ]
+
+
+# Instância compartilhada do processo
+zapi_pool = ZapiPool.from_config()
@@ -1,4 +1,10 @@
 from datetime import datetime
 
 def format_pt_br(dt: datetime) -> str:
-    return dt.strftime("%d/%m/%Y as %H:%M") 
\ No newline at end of file
+    return dt.strftime("%d/%m/%Y as %H:%M") 
+
+def notion_page_url(page_id: str) -> str:
+    return f"https://www.notion.so/{page_id.replace('-', '')}"
+
+def wa_me_link(phone: str) -> str:
+    return f"wa.me/{''.join(filter(str.isdigit, phone))}"
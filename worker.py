@@ -0,0 +1,82 @@
+from __future__ import annotations
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import socket
+from fastapi import FastAPI
+
+from config import TZ, NOTION_OUTBOX_ENABLED
+from database import create_tables, dispose_async_engine, pool_snapshot, warm_up_async_pool, warm_up_pool
+from app_scheduler import scheduler, start_scheduler, register_periodic_jobs, poll_jobstore, shutdown_scheduler
+from services.queue_handlers import register_queue_handlers
+from services.queue_service import run_queue_consumer
+from services.notion_outbox_service import outbox_snapshot
+from services.notion_outbox_drainer import run_outbox_drainer
+from services.notion_service import flush_notion_writes
+from services.zapi_pool import zapi_pool
+from services.tenant_service import close_tenants, tenants_snapshot
+from services.resilience import breakers_snapshot
+from services.profiling_service import profiler
+
+# -----------------------------------------------------------------------------
+# Worker: scheduler, lembretes, varreduras e consumo da fila durável.
+# O processo web (main.py com APP_ROLE=web) só recebe webhooks e enfileira.
+# -----------------------------------------------------------------------------
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    create_tables()
+    # Conexões já abertas: a primeira requisição não espera o handshake com o banco
+    warm_up_pool()
+    await warm_up_async_pool()
+    start_scheduler(run_jobs=True)
+    register_periodic_jobs()
+    register_queue_handlers()
+
+    stop_event = asyncio.Event()
+    tasks = [
+        asyncio.create_task(run_queue_consumer(WORKER_ID, stop_event)),
+        asyncio.create_task(poll_jobstore(stop_event)),
+    ]
+    if NOTION_OUTBOX_ENABLED:
+        tasks.append(asyncio.create_task(run_outbox_drainer(WORKER_ID, scheduler, stop_event)))
+    print(f"👷 Worker {WORKER_ID} iniciado")
+
+    yield
+
+    stop_event.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    shutdown_scheduler()
+    # Atualizações de páginas do Notion ainda no buffer de escrita
+    await asyncio.to_thread(flush_notion_writes)
+    # Envia as marcações de contexto que ainda estão na fila e fecha as conexões dos tenants
+    await asyncio.to_thread(close_tenants)
+    await dispose_async_engine()
+
+# O Cloud Run exige uma porta HTTP: o worker expõe apenas o health check
+app = FastAPI(title="Agenda CAL worker", lifespan=lifespan)
+
+
+@app.get("/")
+async def root():
+    return {
+        "status": "healthy",
+        "role": "worker",
+        "worker_id": WORKER_ID,
+        "timezone": str(TZ),
+        "circuits": breakers_snapshot(),
+        "zapi_instances": zapi_pool.snapshot(),
+        "tenants": tenants_snapshot(),
+        "notion_outbox": await outbox_snapshot(),
+        "database": pool_snapshot(),
+        # Sem endpoints administrativos no worker: só os perfis mais lentos, resumidos
+        "slowest_profiles": profiler.profiles()[:3],
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.getenv("PORT", 8080))
+    uvicorn.run(app, host="0.0.0.0", port=port)